@@ -1,9 +1,285 @@
-from google.cloud import vision
-from PIL import Image
+"""
+OCR engines for summarize.py.
+
+Two backends share one interface: "vision" (Google Cloud Vision, batched through a
+process-wide client) and "tesseract" (local pytesseract in a process pool with
+Pillow preprocessing). Choose with OCR_BACKEND=vision|tesseract|auto; "auto" uses
+Vision when credentials are configured and falls back to Tesseract for any image
+Vision cannot read, or uses Tesseract alone when there are no credentials.
+"""
+from PIL import Image, ImageOps
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 import os
 import io
+import multiprocessing
+import threading
+
+from api_scheduler import get_scheduler
+
+try:
+    from google.cloud import vision
+except Exception:
+    vision = None
+
+try:
+    import pytesseract
+except Exception:
+    pytesseract = None
+
+# Vision accepts at most 16 images per batch_annotate_images call; also keep the
+# inline payload of one request well under the API's size limit.
+MAX_BATCH = 16
+MAX_BATCH_BYTES = 8 * 1024 * 1024
+
+# Downscale images scanned above this DPI before sending (0 = send original bytes).
+OCR_TARGET_DPI = int(os.getenv("OCR_TARGET_DPI") or 0)
+
+OCR_BACKEND = os.getenv("OCR_BACKEND", "auto").lower()
+TESSERACT_WORKERS = int(os.getenv("TESSERACT_WORKERS") or os.cpu_count() or 2)
+TESSERACT_LANG = os.getenv("TESSERACT_LANG", "eng")
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """One ImageAnnotatorClient per process; it is thread-safe and slow to build."""
+    global _client
+    if vision is None:
+        raise RuntimeError("google-cloud-vision is not installed")
+    with _client_lock:
+        if _client is None:
+            _client = vision.ImageAnnotatorClient()
+    return _client
+
+
+def image_bytes(image_path, target_dpi=OCR_TARGET_DPI):
+    """
+    Bytes to send for an image. The original file is passed through untouched
+    unless it was scanned above target_dpi, in which case it is downscaled once.
+    """
+    data = Path(image_path).read_bytes()
+    if not target_dpi:
+        return data
+    with Image.open(io.BytesIO(data)) as img:
+        dpi = (img.info.get("dpi") or (0, 0))[0]
+        if not dpi or dpi <= target_dpi:
+            return data
+        scale = target_dpi / dpi
+        small = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), Image.LANCZOS)
+        with io.BytesIO() as output:
+            small.convert("RGB").save(output, format="JPEG", quality=90, dpi=(target_dpi, target_dpi))
+            return output.getvalue()
+
+
+def _batches(paths, target_dpi):
+    """Group (path, bytes) pairs by the per-request image count and size limits."""
+    batch, size = [], 0
+    for path in paths:
+        content = image_bytes(path, target_dpi)
+        if batch and (len(batch) >= MAX_BATCH or size + len(content) > MAX_BATCH_BYTES):
+            yield batch
+            batch, size = [], 0
+        batch.append((path, content))
+        size += len(content)
+    if batch:
+        yield batch
+
+
+def ocr_images(image_paths, target_dpi=OCR_TARGET_DPI):
+    """
+    Run document text detection over many images in as few requests as possible.
+    Returns one entry per path, in order: the text, or None if that image failed.
+    """
+    client = get_client()
+    feature = vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION)
+    results = []
+    for batch in _batches(image_paths, target_dpi):
+        requests = [
+            vision.AnnotateImageRequest(image=vision.Image(content=content), features=[feature])
+            for _, content in batch
+        ]
+        # every image counts against the Vision quota; throttled batches are retried
+        response = get_scheduler("vision").call(client.batch_annotate_images, requests=requests, cost=len(requests))
+        for (path, _), r in zip(batch, response.responses):
+            if r.error.message:
+                print(f"Warning: OCR failed for {path}: {r.error.message}")
+                results.append(None)
+            else:
+                results.append(r.full_text_annotation.text)
+    return results
+
+
+# --- Tesseract (local) ---
+
+def _otsu_threshold(hist):
+    """Grey level that best separates ink from paper in a 256-bin histogram."""
+    total = sum(hist)
+    sum_all = sum(i * h for i, h in enumerate(hist))
+    weight_bg = sum_bg = 0
+    best, threshold = 0.0, 127
+    for t in range(256):
+        weight_bg += hist[t]
+        if weight_bg == 0:
+            continue
+        weight_fg = total - weight_bg
+        if weight_fg == 0:
+            break
+        sum_bg += t * hist[t]
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_all - sum_bg) / weight_fg
+        between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if between > best:
+            best, threshold = between, t
+    return threshold
+
+
+def _skew_angle(binary, max_angle=5.0, step=0.5):
+    """
+    Rotation that makes text lines horizontal: the angle whose horizontal
+    projection profile (mean ink per row) has the largest variance.
+    """
+    ink = ImageOps.invert(binary)
+    ink.thumbnail((800, 800))
+    best_angle, best_score = 0.0, -1.0
+    steps = int(max_angle / step)
+    for i in range(-steps, steps + 1):
+        angle = i * step
+        rotated = ink.rotate(angle, fillcolor=0)
+        rows = list(rotated.resize((1, rotated.height), Image.BOX).getdata())
+        mean = sum(rows) / len(rows)
+        score = sum((r - mean) ** 2 for r in rows)
+        if score > best_score:
+            best_angle, best_score = angle, score
+    return best_angle
+
+
+def preprocess(img):
+    """Grayscale, binarize (Otsu) and deskew a page before handing it to Tesseract."""
+    gray = ImageOps.autocontrast(ImageOps.grayscale(img))
+    threshold = _otsu_threshold(gray.histogram())
+    binary = gray.point(lambda v: 255 if v > threshold else 0)
+    angle = _skew_angle(binary)
+    if angle:
+        binary = binary.rotate(angle, expand=True, fillcolor=255)
+    return binary
+
+
+def tesseract_image(image_path, lang=TESSERACT_LANG):
+    """OCR one image locally. Top-level so it can run in a process pool."""
+    with Image.open(image_path) as img:
+        return pytesseract.image_to_string(preprocess(img), lang=lang)
+
+
+# --- backends ---
+
+class OCRBackend:
+    """recognize() returns one (text or None, engine name) pair per image, in order."""
+    name = ""
+    version = "1"
+
+    def recognize(self, image_paths):
+        raise NotImplementedError
+
+    @classmethod
+    def available(cls):
+        return True
+
+    def engines(self):
+        """Backends whose cached results this one can reuse, in preference order."""
+        return [self]
+
+    def cache_engines(self):
+        """
+        Engines whose cached results may answer for this backend: only its own
+        while it is usable, the fallbacks' too when it is not.
+        """
+        engines = self.engines()
+        return engines[:1] if engines[0].available() else engines
+
+
+class TesseractBackend(OCRBackend):
+    name = "tesseract"
+    version = "1"
+
+    _pool = None
+    _pool_lock = threading.Lock()
+
+    @classmethod
+    def available(cls):
+        if pytesseract is None:
+            return False
+        try:
+            pytesseract.get_tesseract_version()  # the binary has to be installed too
+            return True
+        except Exception:
+            return False
+
+    @classmethod
+    def pool(cls):
+        with cls._pool_lock:
+            if cls._pool is None:
+                # spawn: OCR runs on threads, and forking a threaded process is unsafe
+                cls._pool = ProcessPoolExecutor(max_workers=TESSERACT_WORKERS,
+                                                mp_context=multiprocessing.get_context("spawn"))
+        return cls._pool
+
+    def recognize(self, image_paths):
+        futures = [self.pool().submit(tesseract_image, str(p)) for p in image_paths]
+        results = []
+        for path, f in zip(image_paths, futures):
+            try:
+                results.append((f.result(), self.name))
+            except Exception as e:
+                print(f"Warning: Tesseract failed for {path}: {e}")
+                results.append((None, self.name))
+        return results
+
+
+class VisionBackend(OCRBackend):
+    name = "vision"
+    version = f"2-{OCR_TARGET_DPI}dpi" if OCR_TARGET_DPI else "2"
+
+    def __init__(self, fallback=None):
+        self.fallback = fallback
+
+    @classmethod
+    def available(cls):
+        return vision is not None and bool(os.getenv("GOOGLE_APPLICATION_CREDENTIALS"))
+
+    def engines(self):
+        return [self] + (self.fallback.engines() if self.fallback else [])
+
+    def recognize(self, image_paths):
+        image_paths = list(image_paths)
+        try:
+            texts = ocr_images(image_paths)
+        except Exception as e:
+            if self.fallback is None:
+                raise
+            print(f"Warning: Vision OCR unavailable ({e}), falling back to {self.fallback.name}")
+            return self.fallback.recognize(image_paths)
+        results = [(text, self.name) for text in texts]
+        failed = [i for i, (text, _) in enumerate(results) if text is None]
+        if failed and self.fallback is not None:
+            for i, result in zip(failed, self.fallback.recognize([image_paths[i] for i in failed])):
+                results[i] = result
+        return results
+
+
+def get_backend(name=OCR_BACKEND):
+    """The configured OCR backend, or None when no engine is usable."""
+    tesseract = TesseractBackend() if TesseractBackend.available() else None
+    if name == "tesseract":
+        return tesseract
+    if name == "vision":
+        return VisionBackend(fallback=tesseract)
+    # auto
+    if VisionBackend.available():
+        return VisionBackend(fallback=tesseract)
+    return tesseract
 
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = r"C:\Users\jdwil\Downloads\bustling-syntax-472017-a4-9350377c4a41.json"
 
 def handwriting(image_path):
     # Only process .jpg or .jpeg files
@@ -11,19 +287,13 @@ def handwriting(image_path):
         print("Skipping non-JPG image:", image_path)
         return
 
-    client = vision.ImageAnnotatorClient()
-
-    # Open the image and convert to bytes
-    with Image.open(image_path) as img:
-        with io.BytesIO() as output:
-            img.save(output, format="JPEG")
-            content = output.getvalue()
-
-    image = vision.Image(content=content)
-    response = client.document_text_detection(image=image)
+    text = ocr_images([image_path])[0]
 
     print(f"--- Text from {os.path.basename(image_path)} ---")
-    print(response.full_text_annotation.text)
+    print(text)
+
 
-# Example usage
-handwriting(r"C:\Users\jdwil\Downloads\'.jpg")
\ No newline at end of file
+if __name__ == "__main__":
+    # Example usage
+    os.environ.setdefault("GOOGLE_APPLICATION_CREDENTIALS", r"C:\Users\jdwil\Downloads\bustling-syntax-472017-a4-9350377c4a41.json")
+    handwriting(r"C:\Users\jdwil\Downloads\'.jpg")
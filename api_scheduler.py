@@ -0,0 +1,354 @@
+# api_scheduler.py
+"""
+Shared scheduler for calls to external APIs (OpenAI, Google Vision).
+
+Every call goes through its service's process-wide Scheduler (get_scheduler),
+so overlapping jobs in one worker share one budget:
+
+- token buckets cap requests and tokens per minute ({SERVICE}_RPM and
+  {SERVICE}_TPM, e.g. OPENAI_RPM; 0 means no cap);
+- the number of calls in flight starts at {SERVICE}_CONCURRENCY, halves when
+  the service answers 429 / 5xx or the connection fails, and grows back by
+  about one per round of successful calls;
+- failed calls are retried up to API_RETRIES times after a full-jitter
+  exponential backoff, and a Retry-After from the service pauses the whole
+  service for that long;
+- calls wait in two priority lanes: queued "interactive" calls are always
+  admitted before queued "bulk" ones. The lane comes from the caller's context
+  (`with lane(BULK): ...`), so it follows a job into the threads it starts.
+
+stats() reports queue depth per lane, calls in flight, the current limit and
+throttle/retry counters; each admission is also recorded as a
+"{service}.queue_wait" telemetry span.
+"""
+from __future__ import annotations
+import asyncio, heapq, itertools, os, random, sys, threading, time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from telemetry import record
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+LANES = (INTERACTIVE, BULK)
+_ABORTED = "aborted"  # a call cancelled while in flight: neither a success nor a failure
+
+API_RETRIES = int(os.getenv("API_RETRIES") or 5)
+API_BACKOFF = float(os.getenv("API_BACKOFF") or 0.5)   # seconds; doubles per attempt
+API_BACKOFF_MAX = float(os.getenv("API_BACKOFF_MAX") or 30)
+
+# requests/min, tokens/min, max concurrent calls; override with {SERVICE}_RPM etc.
+DEFAULTS = {
+    "openai": (500, 200_000, 8),    # gpt-4o-mini, usage tier 1
+    "vision": (1800, 0, 4),         # Vision counts every image as one request
+}
+
+_lane: ContextVar[str] = ContextVar("api_lane", default=INTERACTIVE)
+
+
+@contextmanager
+def lane(name: str) -> Iterator[None]:
+    """Run the calls made inside the block (and in threads it starts with the context) in lane name."""
+    if name not in LANES:
+        raise ValueError(f"unknown lane {name!r}; expected one of {', '.join(LANES)}")
+    token = _lane.set(name)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+class TokenBucket:
+    """per_minute units per minute, bursting to one minute's worth; 0 never limits. Not locked."""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.stamp = time.monotonic()
+
+    def delay(self, n: float, now: float) -> float:
+        """Seconds until n units are available."""
+        if not self.rate:
+            return 0.0
+        self.level = min(self.capacity, self.level + (now - self.stamp) * self.rate)
+        self.stamp = now
+        n = min(n, self.capacity)  # a call bigger than the burst goes out once the bucket is full
+        return 0.0 if self.level >= n else (n - self.level) / self.rate
+
+    def take(self, n: float) -> None:
+        if self.rate:
+            self.level -= n  # may go negative when usage turns out higher than estimated
+
+    def give(self, n: float) -> None:
+        if self.rate:
+            self.level = min(self.capacity, self.level + n)
+
+
+class _Waiter:
+    __slots__ = ("key", "cost", "tokens", "lane", "wake", "state")
+    WAITING, GRANTED, CANCELLED = 0, 1, 2
+
+    def __init__(self, key: Tuple[int, int], cost: float, tokens: float, lane_: str, wake: Callable[[], None]):
+        self.key = key
+        self.cost = cost
+        self.tokens = tokens
+        self.lane = lane_
+        self.wake = wake
+        self.state = self.WAITING
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return self.key < other.key
+
+
+def classify(e: BaseException) -> Optional[str]:
+    """"throttled", "server" or "network" for failures worth retrying, None for the rest."""
+    status = getattr(e, "status_code", None)
+    if status is None:
+        code = getattr(e, "code", None)  # google.api_core exceptions carry the HTTP status here
+        status = code if isinstance(code, int) else None
+    if status == 429:
+        # OpenAI also answers 429 when the account is out of credit; waiting will not help
+        return None if getattr(e, "code", None) == "insufficient_quota" else "throttled"
+    if status is not None and (status >= 500 or status == 408):
+        return "server"
+    if isinstance(e, (TimeoutError, ConnectionError)) or any(
+        "Timeout" in c.__name__ or "Connection" in c.__name__ for c in type(e).__mro__
+    ):
+        return "network"
+    return None
+
+
+def retry_after(e: BaseException) -> Optional[float]:
+    """Seconds the service asked us to wait (Retry-After / retry-after-ms headers), if any."""
+    headers = getattr(getattr(e, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:  # HTTP-date form; fall back to our own backoff
+        pass
+    return None
+
+
+class Scheduler:
+    """Admission control, adaptive concurrency and retries for one external service."""
+
+    def __init__(self, name: str, rpm: float = 0, tpm: float = 0, concurrency: int = 8):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_limit = max(1, concurrency)
+        self.limit = float(self.max_limit)
+        self.active = 0
+        self.paused_until = 0.0
+        self._last_cut = 0.0
+        self._lock = threading.Lock()
+        self._queue: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._timer: Optional[threading.Timer] = None
+        self._timer_at = 0.0
+        self.counters = {"calls": 0, "throttled": 0, "server_errors": 0, "network_errors": 0,
+                         "retries": 0, "failures": 0}
+
+    # --- admission ---
+    def _enqueue(self, cost: float, tokens: float, wake: Callable[[], None], seq: Optional[int]) -> _Waiter:
+        lane_ = _lane.get()
+        key = (LANES.index(lane_), next(self._seq) if seq is None else seq)
+        waiter = _Waiter(key, cost, tokens, lane_, wake)
+        with self._lock:
+            heapq.heappush(self._queue, waiter)
+            self._dispatch()
+        return waiter
+
+    def _dispatch(self) -> None:
+        """Admit queued calls in lane order while the limits allow. Lock held."""
+        now = time.monotonic()
+        while self._queue:
+            w = self._queue[0]
+            if w.state == _Waiter.CANCELLED:
+                heapq.heappop(self._queue)
+                continue
+            if self.active >= int(self.limit):
+                return  # a finishing call dispatches again
+            wait = max(self.paused_until - now, self.requests.delay(w.cost, now), self.tokens.delay(w.tokens, now))
+            if wait > 0:
+                self._wake_in(wait, now)
+                return
+            heapq.heappop(self._queue)
+            self.requests.take(w.cost)
+            self.tokens.take(w.tokens)
+            self.active += 1
+            w.state = _Waiter.GRANTED
+            w.wake()
+
+    def _wake_in(self, delay: float, now: float) -> None:
+        if self._timer is not None and self._timer_at <= now + delay:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self._on_timer)
+        self._timer.daemon = True
+        self._timer_at = now + delay
+        self._timer.start()
+
+    def _on_timer(self) -> None:
+        with self._lock:
+            self._timer = None
+            self._dispatch()
+
+    async def _acquire(self, cost: float, tokens: float, seq: Optional[int]) -> _Waiter:
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake() -> None:
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        t0 = time.perf_counter()
+        waiter = self._enqueue(cost, tokens, wake, seq)
+        try:
+            await granted
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.state == _Waiter.GRANTED:  # admitted just as we were cancelled
+                    self.active -= 1
+                    self._dispatch()
+                waiter.state = _Waiter.CANCELLED
+            raise
+        record(f"{self.name}.queue_wait", time.perf_counter() - t0, lane=waiter.lane)
+        return waiter
+
+    def _acquire_sync(self, cost: float, tokens: float, seq: Optional[int]) -> _Waiter:
+        granted = threading.Event()
+        t0 = time.perf_counter()
+        waiter = self._enqueue(cost, tokens, granted.set, seq)
+        granted.wait()
+        record(f"{self.name}.queue_wait", time.perf_counter() - t0, lane=waiter.lane)
+        return waiter
+
+    # --- feedback ---
+    def _finish(self, failure: Optional[str], wait: Optional[float], unused_tokens: float = 0) -> None:
+        """Release a call's slot; failure is None on success, _ABORTED when it was cancelled."""
+        with self._lock:
+            now = time.monotonic()
+            self.active -= 1
+            self.counters["calls"] += 1
+            self.tokens.give(unused_tokens)
+            if failure is None:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            elif failure != _ABORTED:
+                self.counters["server_errors" if failure == "server" else
+                              "network_errors" if failure == "network" else "throttled"] += 1
+                if now - self._last_cut > 1.0:  # one cut per burst of failures from calls already in flight
+                    self.limit = max(1.0, self.limit / 2)
+                    self._last_cut = now
+                if wait:
+                    self.paused_until = max(self.paused_until, now + wait)
+            self._dispatch()
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(API_BACKOFF_MAX, API_BACKOFF * 2 ** attempt))
+
+    def _retry_delay(self, failure: Optional[str], attempt: int) -> Optional[float]:
+        """The delay before retrying a failed call, or None to give up."""
+        with self._lock:
+            if failure is None or attempt >= API_RETRIES:
+                self.counters["failures"] += 1
+                return None
+            self.counters["retries"] += 1
+        return self._backoff(attempt)
+
+    # --- calls ---
+    async def run(self, fn: Callable[..., Any], *args, cost: float = 1, tokens: float = 0,
+                  used: Optional[Callable[[Any], float]] = None, **kwargs) -> Any:
+        """
+        await fn(*args, **kwargs) once admitted, retrying retryable failures.
+        cost counts against the requests bucket, tokens (an estimate) against
+        the tokens bucket; used(result) returns the actual tokens to settle it.
+        """
+        seq = None
+        for attempt in itertools.count():
+            waiter = await self._acquire(cost, tokens, seq)
+            seq = waiter.key[1]  # a retry keeps its place in the lane
+            # the slot is released whatever happens; a call that did not complete used no tokens
+            failure, wait, unused = _ABORTED, None, tokens
+            try:
+                result = await fn(*args, **kwargs)
+                failure = None
+                unused = tokens - used(result) if used else 0
+                return result
+            except Exception as e:
+                failure = classify(e)
+                wait = retry_after(e) if failure else None
+                delay = self._retry_delay(failure, attempt)
+                if delay is None:
+                    raise
+            finally:
+                self._finish(failure, wait, unused)
+            await asyncio.sleep(delay)
+
+    def call(self, fn: Callable[..., Any], *args, cost: float = 1, tokens: float = 0,
+             used: Optional[Callable[[Any], float]] = None, **kwargs) -> Any:
+        """run() for blocking clients (called from worker threads)."""
+        seq = None
+        for attempt in itertools.count():
+            waiter = self._acquire_sync(cost, tokens, seq)
+            seq = waiter.key[1]
+            failure, wait, unused = _ABORTED, None, tokens
+            try:
+                result = fn(*args, **kwargs)
+                failure = None
+                unused = tokens - used(result) if used else 0
+                return result
+            except Exception as e:
+                failure = classify(e)
+                wait = retry_after(e) if failure else None
+                delay = self._retry_delay(failure, attempt)
+                if delay is None:
+                    raise
+            finally:
+                self._finish(failure, wait, unused)
+            time.sleep(delay)
+
+    def stats(self) -> dict:
+        with self._lock:
+            queued = dict.fromkeys(LANES, 0)
+            for w in self._queue:
+                if w.state == _Waiter.WAITING:
+                    queued[w.lane] += 1
+            return {
+                "queued": queued, "active": self.active, "limit": round(self.limit, 2),
+                "max_concurrency": self.max_limit,
+                "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 3),
+                **self.counters,
+            }
+
+
+_schedulers: Dict[str, Scheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(service: str) -> Scheduler:
+    """The process-wide scheduler for service, built from {SERVICE}_RPM/_TPM/_CONCURRENCY."""
+    with _schedulers_lock:
+        sched = _schedulers.get(service)
+        if sched is None:
+            rpm, tpm, concurrency = DEFAULTS.get(service, (0, 0, 8))
+            prefix = service.upper()
+            sched = _schedulers[service] = Scheduler(
+                service,
+                rpm=float(os.getenv(f"{prefix}_RPM") or rpm),
+                tpm=float(os.getenv(f"{prefix}_TPM") or tpm),
+                concurrency=int(os.getenv(f"{prefix}_CONCURRENCY") or concurrency),
+            )
+    return sched
+
+
+def stats() -> Dict[str, dict]:
+    with _schedulers_lock:
+        return {name: s.stats() for name, s in _schedulers.items()}
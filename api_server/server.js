@@ -6,6 +6,7 @@ import path from 'path';
 import { fileURLToPath } from 'url';
 import { dirname } from 'path';
 import { spawn } from 'child_process';
+import readline from 'readline';
 import dotenv from 'dotenv';
 
 dotenv.config();
@@ -27,6 +28,11 @@ const INPUT_FILES_DIR = path.join(PROJECT_ROOT, 'InputFiles');
 const OUTPUT_FILES_DIR = path.join(PROJECT_ROOT, 'OutputFiles');
 const CLOUD_DIR = path.join(PROJECT_ROOT, 'cloud');
 
+// Python interpreter for summarize.py (the virtual environment one on Windows)
+const PYTHON_PATH = process.platform === 'win32' ?
+  path.join(PROJECT_ROOT, 'venv', 'Scripts', 'python.exe') :
+  'python3';
+
 // Ensure directories exist
 await fs.ensureDir(INPUT_FILES_DIR);
 await fs.ensureDir(OUTPUT_FILES_DIR);
@@ -68,41 +74,164 @@ const upload = multer({
   }
 });
 
+// Persistent summarization worker (summarize_worker.py): one warm Python
+// process takes jobs as JSON lines on stdin and answers on stdout, so a request
+// does not pay interpreter startup and library imports. Started at boot and
+// restarted on the next request if it exits. PYTHON_WORKER=off spawns
+// summarize.py per request instead.
+const USE_WORKER = (process.env.PYTHON_WORKER || 'on').toLowerCase() !== 'off';
+const WORKER_TIMEOUT_MS = Number(process.env.PYTHON_WORKER_TIMEOUT_MS || 15 * 60 * 1000);
+
+class SummarizeWorker {
+  constructor() {
+    this.proc = null;
+    this.pending = new Map(); // request id -> { resolve, reject, timer }
+    this.nextId = 1;
+  }
+
+  start() {
+    if (this.proc) return this.proc;
+    const proc = spawn(PYTHON_PATH, ['summarize_worker.py'], {
+      cwd: PROJECT_ROOT,
+      stdio: ['pipe', 'pipe', 'pipe']
+    });
+    this.proc = proc;
+
+    readline.createInterface({ input: proc.stdout }).on('line', (line) => {
+      let reply;
+      try {
+        reply = JSON.parse(line);
+      } catch {
+        console.error('Python worker sent invalid reply:', line);
+        return;
+      }
+      const waiter = this.pending.get(reply.id);
+      if (!waiter) return;
+      this.pending.delete(reply.id);
+      clearTimeout(waiter.timer);
+      waiter.resolve(reply);
+    });
+
+    proc.stderr.on('data', (data) => {
+      const text = data.toString().trimEnd();
+      if (text) console.error('Python worker:', text);
+    });
+
+    const fail = (err) => {
+      if (this.proc === proc) this.proc = null;
+      for (const [id, waiter] of this.pending) {
+        clearTimeout(waiter.timer);
+        waiter.reject(err);
+        this.pending.delete(id);
+      }
+    };
+    proc.on('error', (err) => {
+      console.error('Failed to start Python worker:', err);
+      fail(err);
+    });
+    proc.on('exit', (code, signal) => {
+      console.error(`Python worker exited (code ${code}, signal ${signal})`);
+      fail(new Error(`Python worker exited with code ${code}`));
+    });
+    return proc;
+  }
+
+  request(payload = {}) {
+    const proc = this.start();
+    const id = String(this.nextId++);
+    return new Promise((resolve, reject) => {
+      const timer = setTimeout(() => {
+        this.pending.delete(id);
+        reject(new Error(`Python worker did not answer within ${WORKER_TIMEOUT_MS} ms`));
+      }, WORKER_TIMEOUT_MS);
+      this.pending.set(id, { resolve, reject, timer });
+      proc.stdin.write(JSON.stringify({ id, ...payload }) + '\n');
+    });
+  }
+
+  stop() {
+    if (this.proc) this.proc.stdin.end(); // the worker finishes running jobs, then exits
+  }
+}
+
+const summarizeWorker = new SummarizeWorker();
+
+// One-off run of summarize.py (PYTHON_WORKER=off)
+function runSummarizeOnce() {
+  return new Promise((resolve, reject) => {
+    const pythonProcess = spawn(PYTHON_PATH, ['summarize.py'], {
+      cwd: PROJECT_ROOT,
+      stdio: ['pipe', 'pipe', 'pipe']
+    });
+
+    let output = '';
+    let error = '';
+
+    pythonProcess.stdout.on('data', (data) => {
+      output += data.toString();
+      console.log('Python output:', data.toString());
+    });
+
+    pythonProcess.stderr.on('data', (data) => {
+      error += data.toString();
+      console.error('Python error:', data.toString());
+    });
+
+    pythonProcess.on('close', (code) => {
+      resolve(code === 0 ? { ok: true, output } : { ok: false, output, error, code });
+    });
+
+    pythonProcess.on('error', reject);
+  });
+}
+
 // Routes
 
 // Get study materials from OutputFiles
+// Read one output file; null when it is missing (or was just replaced)
+async function readOutput(name) {
+  try {
+    const filePath = path.join(OUTPUT_FILES_DIR, name);
+    const [text, stats] = await Promise.all([fs.readFile(filePath, 'utf8'), fs.stat(filePath)]);
+    return { text, mtime: stats.mtime };
+  } catch (error) {
+    if (error.code === 'ENOENT') return null;
+    throw error;
+  }
+}
+
+const OUTPUT_SECTIONS = [
+  ['summarization', 'summarization.txt'],
+  ['questions', 'questions.txt'],
+  ['answers', 'answers.txt'],
+];
+
 app.get('/api/study-materials', async (req, res) => {
   try {
     const materials = {};
-    
-    // Read summarization file
-    const summarizationPath = path.join(OUTPUT_FILES_DIR, 'summarization.txt');
-    if (await fs.pathExists(summarizationPath)) {
-      materials.summarization = await fs.readFile(summarizationPath, 'utf8');
-    }
-    
-    // Read questions file
-    const questionsPath = path.join(OUTPUT_FILES_DIR, 'questions.txt');
-    if (await fs.pathExists(questionsPath)) {
-      materials.questions = await fs.readFile(questionsPath, 'utf8');
-    }
-    
-    // Read answers file
-    const answersPath = path.join(OUTPUT_FILES_DIR, 'answers.txt');
-    if (await fs.pathExists(answersPath)) {
-      materials.answers = await fs.readFile(answersPath, 'utf8');
-    }
-    
-    // Get last modified time
-    if (await fs.pathExists(summarizationPath)) {
-      const stats = await fs.stat(summarizationPath);
-      materials.lastUpdated = stats.mtime.toISOString().split('T')[0];
-    }
-    
-    if (Object.keys(materials).length === 1) { // Only lastUpdated
+
+    // While summarize.py is streaming a new study guide it saves each finished
+    // section as <name>.partial (removed once the final files are written).
+    // Serve those as soon as they appear, without mixing in the previous
+    // run's remaining sections.
+    const partial = await Promise.all(OUTPUT_SECTIONS.map(([, file]) => readOutput(`${file}.partial`)));
+    const inProgress = partial.some(Boolean);
+    const sections = inProgress
+      ? partial
+      : await Promise.all(OUTPUT_SECTIONS.map(([, file]) => readOutput(file)));
+
+    OUTPUT_SECTIONS.forEach(([key], i) => {
+      if (sections[i]) materials[key] = sections[i].text;
+    });
+    if (!Object.keys(materials).length) {
       return res.status(404).json({ message: 'No study materials found' });
     }
-    
+
+    // Get last modified time
+    const newest = sections.filter(Boolean).map(s => s.mtime).sort((a, b) => b - a)[0];
+    materials.lastUpdated = newest.toISOString().split('T')[0];
+    if (inProgress) materials.inProgress = true;
+
     res.json(materials);
   } catch (error) {
     console.error('Error reading study materials:', error);
@@ -140,58 +269,32 @@ app.post('/api/upload-files', upload.array('files'), async (req, res) => {
 app.post('/api/process-files', async (req, res) => {
   try {
     console.log('Starting file processing...');
-    
-    // Use the virtual environment Python on Windows
-    const pythonPath = process.platform === 'win32' ?
-      path.join(PROJECT_ROOT, 'venv', 'Scripts', 'python.exe') :
-      'python3';
 
-    const pythonProcess = spawn(pythonPath, ['summarize.py'], {
-      cwd: PROJECT_ROOT,
-      stdio: ['pipe', 'pipe', 'pipe']
-    });
-    
-    let output = '';
-    let error = '';
-    
-    pythonProcess.stdout.on('data', (data) => {
-      output += data.toString();
-      console.log('Python output:', data.toString());
-    });
-    
-    pythonProcess.stderr.on('data', (data) => {
-      error += data.toString();
-      console.error('Python error:', data.toString());
-    });
-    
-    pythonProcess.on('close', (code) => {
-      if (code === 0) {
-        console.log('File processing completed successfully');
-        res.json({ 
-          message: 'Files processed successfully',
-          output: output
-        });
-      } else {
-        console.error('Python script failed with code:', code);
-        res.status(500).json({ 
-          message: 'Error processing files',
-          error: error,
-          code: code
-        });
-      }
-    });
-    
-    pythonProcess.on('error', (err) => {
-      console.error('Failed to start Python process:', err);
-      res.status(500).json({ 
-        message: 'Failed to start file processing',
-        error: err.message
+    // priority: 'interactive' (default) or 'bulk' for re-processing that can wait for API budget
+    const { priority } = req.body || {};
+    const result = USE_WORKER ? await summarizeWorker.request({ priority }) : await runSummarizeOnce();
+    if (result.output) console.log('Python output:', result.output);
+
+    if (result.ok) {
+      console.log('File processing completed successfully');
+      res.json({
+        message: 'Files processed successfully',
+        output: result.output
       });
-    });
-    
+    } else {
+      console.error('File processing failed:', result.error);
+      res.status(500).json({
+        message: 'Error processing files',
+        error: result.error,
+        code: result.code
+      });
+    }
   } catch (error) {
     console.error('Error processing files:', error);
-    res.status(500).json({ message: 'Error processing files' });
+    res.status(500).json({
+      message: 'Failed to start file processing',
+      error: error.message
+    });
   }
 });
 
@@ -361,6 +464,18 @@ app.get('/api/health', (req, res) => {
   });
 });
 
+// Summarization worker stats: jobs, stage timings, API queue depth and throttling
+app.get('/api/worker-stats', async (req, res) => {
+  if (!USE_WORKER) {
+    return res.status(404).json({ message: 'The summarization worker is disabled (PYTHON_WORKER=off)' });
+  }
+  try {
+    res.json(await summarizeWorker.request({ op: 'stats' }));
+  } catch (error) {
+    res.status(503).json({ message: 'Python worker unavailable', error: error.message });
+  }
+});
+
 // Error handling middleware
 app.use((error, req, res, next) => {
   if (error instanceof multer.MulterError) {
@@ -379,4 +494,12 @@ app.listen(PORT, () => {
   console.log(`Project root: ${PROJECT_ROOT}`);
   console.log(`Input files: ${INPUT_FILES_DIR}`);
   console.log(`Output files: ${OUTPUT_FILES_DIR}`);
-});
\ No newline at end of file
+  if (USE_WORKER) summarizeWorker.start();
+});
+
+for (const signal of ['SIGINT', 'SIGTERM']) {
+  process.on(signal, () => {
+    summarizeWorker.stop();
+    process.exit(0);
+  });
+}
\ No newline at end of file
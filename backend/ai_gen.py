@@ -1,42 +1,162 @@
 # ai_gen.py
-from typing import Dict, Any
+from typing import Callable, Dict, Any, Iterator, List, Optional
+from collections import deque
 from pathlib import Path
 import re
 
+from extract_cache import cache_key, file_digest, get_cache
+import summarizer
+from corpus import build_corpus
+from telemetry import span, traced_call, unwrap
+
 try:
     import pdfplumber  # already in requirements
 except Exception:
     pdfplumber = None
 
+# bump when page extraction changes so stale cache entries are ignored
+PDF_EXTRACTOR = "pdfplumber"
+PDF_EXTRACTOR_VERSION = "1"
+PDF_PAGES_PER_TASK = 16
+SUMMARY_SOURCE_CHARS = 2_000_000  # cap on the text the extractive summarizer ranks (~600 pages)
 
-def _extract_text(file_path: str) -> str:
-    """Return plain text from a .txt/.md/.pdf file (best-effort)."""
+# progress(file index, stage, fields): "page" {pages}, "extracted" {chars},
+# then the finished parts of each bundle as "cards" {flashcards, mcqs} and "summary" {summary}
+Progress = Optional[Callable[[int, str, Dict[str, Any]], None]]
+
+
+def pdf_page_count(file_path: str) -> int:
+    with pdfplumber.open(file_path) as pdf:
+        return len(pdf.pages)
+
+
+def _iter_pdf_uncached(file_path: str, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+    with pdfplumber.open(file_path) as pdf:
+        for page in pdf.pages[start:stop]:
+            try:
+                yield page.extract_text() or ""
+            finally:
+                page.close()  # drop this page's layout objects right away
+
+
+def extract_pdf_range(file_path: str, start: int = 0, stop: Optional[int] = None) -> List[str]:
+    """Text of pages[start:stop]. Top-level so it can be shipped to a process pool."""
+    with span("pdf.parse", path=str(file_path), start=start, stop=stop) as s:
+        pages = list(_iter_pdf_uncached(file_path, start, stop))
+        s.attrs["pages"] = len(pages)
+        s.bytes = sum(len(t.encode("utf-8")) for t in pages)
+    return pages
+
+
+def _iter_pdf_parallel(file_path: str, start: int, stop: Optional[int], executor, window: int = 8) -> Iterator[str]:
+    """Parse page ranges on executor, keeping at most `window` ranges in flight."""
+    n = pdf_page_count(file_path)
+    stop = n if stop is None else min(stop, n)
+    ranges = iter(range(start, stop, PDF_PAGES_PER_TASK))
+    pending: deque = deque()
+    for lo in ranges:
+        pending.append(executor.submit(traced_call, extract_pdf_range, str(file_path), lo, min(lo + PDF_PAGES_PER_TASK, stop)))
+        if len(pending) >= window:
+            break
+    while pending:
+        texts = unwrap(pending.popleft().result())  # also merges the worker's spans
+        lo = next(ranges, None)
+        if lo is not None:
+            pending.append(executor.submit(traced_call, extract_pdf_range, str(file_path), lo, min(lo + PDF_PAGES_PER_TASK, stop)))
+        yield from texts
+
+
+def iter_pdf_pages(
+    file_path: str,
+    start: int = 0,
+    stop: Optional[int] = None,
+    executor=None,
+    digest: Optional[str] = None,
+) -> Iterator[str]:
+    """
+    Yield the text of pages[start:stop] one page at a time.
+
+    Unchanged files stream straight from the extraction cache. On a miss the pages
+    are parsed (across `executor` when given, in order) and written to the cache as
+    they go, so peak memory stays flat however long the document is. Partial ranges
+    are served from the cache but never stored. Pass `digest` when the SHA-256 of
+    the file is already known (e.g. hashed during upload) to skip re-hashing.
+    """
+    def parse():
+        if executor is not None:
+            return _iter_pdf_parallel(file_path, start, stop, executor)
+        return _iter_pdf_uncached(file_path, start, stop)
+
+    cache = get_cache()
+    if cache is None:
+        yield from parse()
+        return
+    key = cache_key(digest or file_digest(file_path), PDF_EXTRACTOR, PDF_EXTRACTOR_VERSION)
+    if cache.touch(key):
+        yield from cache.iter_pages(key, start, stop)
+        return
+    if start or stop is not None:
+        yield from parse()
+        return
+    writer = cache.writer(key)
+    try:
+        for text in parse():
+            writer.add(text)
+            yield text
+        writer.commit()
+    finally:
+        writer.close()  # a reader that stopped early leaves no pages behind
+
+
+def iter_text(file_path: str, digest: Optional[str] = None) -> Iterator[str]:
+    """Yield a file's text piece by piece: one page at a time for PDFs."""
     p = Path(file_path)
     suf = p.suffix.lower()
 
     # .txt / .md
     if suf in {".txt", ".md"}:
-        return p.read_text(encoding="utf-8", errors="ignore")
+        yield p.read_text(encoding="utf-8", errors="ignore")
 
     # .pdf
-    if suf == ".pdf" and pdfplumber is not None:
-        parts = []
-        with pdfplumber.open(p) as pdf:
-            for page in pdf.pages:
-                t = page.extract_text() or ""
-                parts.append(t)
-        return "\n".join(parts)
+    elif suf == ".pdf" and pdfplumber is not None:
+        yield from iter_pdf_pages(str(p), digest=digest)
+
+    # unsupported types for now
+
+
+def _extract_text(file_path: str) -> str:
+    """Return plain text from a .txt/.md/.pdf file (best-effort)."""
+    return "\n".join(iter_text(file_path))
 
-    return ""  # unsupported types for now
+
+def _leading_text(file_path: str, limit: int, digest: Optional[str] = None,
+                  on_page: Optional[Callable[[int], None]] = None) -> str:
+    """Text from the start of the file, reading pages only until `limit` chars."""
+    parts, size = [], 0
+    pieces = iter_text(file_path, digest)
+    for piece in pieces:
+        parts.append(piece)
+        size += len(piece)
+        if on_page is not None:
+            on_page(len(parts))
+        if size >= limit:
+            break
+    pieces.close()
+    return "\n".join(parts)
 
 
 def _simple_summary(text: str, max_sentences: int = 5, max_chars: int = 800) -> str:
-    """Very small summarizer: first few sentences, trimmed."""
+    """
+    Extractive summary (TF-IDF + TextRank + MMR, see summarizer.py) within the
+    sentence/char budget; falls back to the first few sentences without NumPy/SciPy.
+    """
     text = re.sub(r"\s+", " ", text).strip()
     if not text:
         return "(no text found)"
-    sentences = re.split(r"(?<=[.!?])\s+", text)
-    out = " ".join(sentences[:max_sentences]).strip()
+    out = summarizer.summarize(text, max_sentences, max_chars)
+    if not out:
+        sentences = re.split(r"(?<=[.!?])\s+", text)
+        out = " ".join(sentences[:max_sentences]).strip()
     if len(out) > max_chars:
         out = out[:max_chars].rstrip() + "…"
     return out
@@ -67,9 +187,56 @@ def generate_from_text(text: str) -> Dict[str, Any]:
     return {"summary": summary, "flashcards": flashcards, "mcqs": mcqs}
 
 
-def generate_from_file(file_path: str) -> Dict[str, Any]:
-    """New entry point: read the file, make a simple summary, reuse your Q&A."""
-    text = _extract_text(file_path)
-    bundle = generate_from_text(text)   # reuse your existing generator
-    bundle["summary"] = _simple_summary(text)
-    return bundle
+def read_sources(file_paths: List[str], digests: Optional[List[Optional[str]]] = None,
+                 progress: Progress = None) -> List[str]:
+    """Leading text of each file (up to SUMMARY_SOURCE_CHARS), as the generators see it."""
+    digests = list(digests or [None] * len(file_paths))
+    texts = []
+    with span("generate.read", files=len(file_paths)) as s:
+        for i, (p, d) in enumerate(zip(file_paths, digests)):
+            on_page = (lambda n, i=i: progress(i, "page", {"pages": n})) if progress else None
+            texts.append(_leading_text(p, SUMMARY_SOURCE_CHARS, d, on_page))
+            if progress:
+                progress(i, "extracted", {"chars": len(texts[-1])})
+        s.bytes = sum(len(t.encode("utf-8")) for t in texts)
+    return texts
+
+
+def generate_from_texts(texts: List[str], names: List[str], progress: Progress = None) -> List[Dict[str, Any]]:
+    """One bundle per text, all sharing one corpus model (see generate_from_files)."""
+    with span("generate.corpus", files=len(texts)):
+        model = build_corpus(texts, names)
+        generated = model.generate() if model is not None else [{} for _ in texts]
+    bundles = []
+    for i, gen in enumerate(generated):
+        bundle = {"flashcards": gen.get("flashcards") or [], "mcqs": gen.get("mcqs") or []}
+        bundles.append(bundle)
+        if progress:
+            progress(i, "cards", {"flashcards": bundle["flashcards"], "mcqs": bundle["mcqs"]})
+    with span("generate.summary", files=len(texts)):
+        for i, (text, bundle) in enumerate(zip(texts, bundles)):
+            bundle["summary"] = _simple_summary(text)
+            if progress:
+                progress(i, "summary", {"summary": bundle["summary"]})
+    return bundles
+
+
+def generate_from_files(
+    file_paths: List[str],
+    digests: Optional[List[Optional[str]]] = None,
+    names: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    One bundle per file, in order. All files share one corpus model, so key
+    terms are weighed against the whole upload set and MCQ distractors come from
+    the other documents' terms too. names label the sources in MCQ explanations
+    (default: the file names). Documents the model finds nothing in (or every
+    document, without NumPy/SciPy) get no flashcards/MCQs.
+    """
+    texts = read_sources(file_paths, digests)
+    return generate_from_texts(texts, names or [Path(p).name for p in file_paths])
+
+
+def generate_from_file(file_path: str, digest: Optional[str] = None) -> Dict[str, Any]:
+    """New entry point: read the file, make a simple summary and Q&A."""
+    return generate_from_files([file_path], [digest])[0]
@@ -1,19 +1,66 @@
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from pathlib import Path
-import uuid, json
+from contextlib import asynccontextmanager
+import asyncio, hashlib, json, os, time, uuid
 
-from ai_gen import generate_from_text
+from ai_gen import generate_from_text, read_sources
+from jobs import TERMINAL, JobQueue
+from job_store import JOB_TTL_DAYS, open_store
+from search_index import open_index
+import telemetry
 
 # --- paths ---
 ROOT = Path(__file__).parent
-UPLOADS = ROOT / "uploads"
-DATA = ROOT / "data"
-UPLOADS.mkdir(exist_ok=True)
-DATA.mkdir(exist_ok=True)
+UPLOADS = Path(os.environ.get("UPLOAD_DIR") or ROOT / "uploads")
+DATA = Path(os.environ.get("DATA_DIR") or ROOT / "data")
+UPLOADS.mkdir(parents=True, exist_ok=True)
+DATA.mkdir(parents=True, exist_ok=True)
 
-app = FastAPI()
+# uploads are streamed to disk in chunks and stored once per content hash
+UPLOAD_CHUNK = 1024 * 1024
+MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB") or 200)
+# idle event streams send a keep-alive this often so proxies do not drop them
+EVENTS_KEEPALIVE = float(os.environ.get("EVENTS_KEEPALIVE") or 15)
+
+# JOB_STORE=sqlite (default, imports existing data/*.json once) or JOB_STORE=file
+store = open_store(DATA)
+# full-text index of finished jobs (None with SEARCH_INDEX=off or without FTS5)
+index = open_index(DATA)
+
+# --- background generation queue (started with the app) ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global jobs
+    jobs = JobQueue(store, index)
+    jobs.start()
+    reaper = asyncio.create_task(expire_jobs())
+    if index is not None:
+        # jobs finished before the index existed (or imported from data/*.json), once per index
+        backfill = asyncio.create_task(asyncio.to_thread(index.backfill, store, job_source))
+    yield
+    reaper.cancel()
+    await jobs.stop()
+
+def job_source(job: dict) -> str:
+    """Source text of a finished job for the search index; "" when its upload is gone."""
+    path = job.get("fileId")
+    if not path or not Path(path).is_file():
+        return ""
+    return read_sources([path], [job.get("sha256")])[0]
+
+async def expire_jobs():
+    """Drop jobs older than JOB_TTL_DAYS, once at startup and then hourly."""
+    while True:
+        await asyncio.to_thread(store.expire, JOB_TTL_DAYS * 86400)
+        if index is not None:
+            await asyncio.to_thread(index.expire, JOB_TTL_DAYS * 86400)
+        await asyncio.sleep(3600)
+
+jobs: JobQueue | None = None
+app = FastAPI(lifespan=lifespan)
 
 # --- CORS (dev-friendly) ---
 app.add_middleware(
@@ -24,43 +71,80 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --- request timing (per route template, so /content/{job_id} is one stage) ---
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    t0, c0 = time.perf_counter(), time.thread_time()
+    status, error = 500, None
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        route = request.scope.get("route")
+        path = getattr(route, "path", None) or "unmatched"
+        telemetry.record(f"http {request.method} {path}", time.perf_counter() - t0,
+                         time.thread_time() - c0, error=error, status=status)
+
 # --- models ---
 class GenerateReq(BaseModel):
     jobId: str
 
+class GenerateBatchReq(BaseModel):
+    jobIds: list[str]
+
 # --- helpers ---
 def save_json(job_id: str, payload: dict) -> None:
-    (DATA / f"{job_id}.json").write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    store.put(job_id, payload)
 
 def load_json(job_id: str) -> dict | None:
-    p = DATA / f"{job_id}.json"
-    if not p.exists(): return None
-    return json.loads(p.read_text(encoding="utf-8"))
+    return store.get(job_id)
 
 # --- endpoints ---
 
-# app.py (only the changed/added lines shown)
-
-from ai_gen import generate_from_text, generate_from_file  # add generate_from_file
-
 @app.post("/upload")
 async def upload(file: UploadFile = File(...)):
     job_id = uuid.uuid4().hex[:8]
-    file_path = UPLOADS / f"{job_id}_{file.filename}"
-    content = await file.read()
-    file_path.write_bytes(content)
+    tmp = UPLOADS / f".{job_id}.part"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with telemetry.span("upload.write", fileName=file.filename) as sp, tmp.open("wb") as out:
+            while chunk := await file.read(UPLOAD_CHUNK):
+                size += len(chunk)
+                if size > MAX_UPLOAD_MB * 1024 * 1024:
+                    raise HTTPException(status_code=413, detail=f"file larger than {MAX_UPLOAD_MB} MB")
+                digest.update(chunk)
+                out.write(chunk)
+            sp.bytes = size
+        sha256 = digest.hexdigest()
+        # content-addressed name: identical uploads share one file (and one cache entry)
+        file_path = UPLOADS / f"{sha256}{Path(file.filename or '').suffix.lower()}"
+        if file_path.exists():
+            tmp.unlink()
+        else:
+            os.replace(tmp, file_path)
+    finally:
+        tmp.unlink(missing_ok=True)
 
     # store fileId so /generate knows what to read
     stub = {
         "jobId": job_id,
         "status": "pending",
         "fileId": str(file_path),   # <--- add this
+        "fileName": file.filename,
+        "sha256": sha256,
+        "size": size,
+        "createdAt": time.time(),
         "summary": "",
         "flashcards": [],
         "mcqs": []
     }
     save_json(job_id, stub)
-    return {"fileId": str(file_path), "jobId": job_id}
+    return {"fileId": str(file_path), "jobId": job_id, "sha256": sha256, "size": size}
 
 @app.post("/generate")
 async def generate(req: GenerateReq):
@@ -71,14 +155,37 @@ async def generate(req: GenerateReq):
     if not file_id:
         return {"ok": False, "error": "no fileId on job; upload first"}
 
-    # NEW: build bundle from the actual file
-    payload = {
-        "jobId": req.jobId,
-        "status": "ready",
-        **generate_from_file(file_id)
-    }
-    save_json(req.jobId, payload)
-    return {"ok": True, "jobId": req.jobId}
+    # queue it; a worker process builds the bundle and flips status to ready/error
+    try:
+        jobs.submit(req.jobId)
+    except asyncio.QueueFull:
+        return JSONResponse(status_code=429, content={"ok": False, "error": "generation queue is full, retry later"})
+    return {"ok": True, "jobId": req.jobId, "status": "pending"}
+
+
+@app.post("/generate-batch")
+async def generate_batch(req: GenerateBatchReq):
+    """Generate a whole upload set together, sharing one corpus model."""
+    missing = [j for j in req.jobIds if not (load_json(j) or {}).get("fileId")]
+    if missing:
+        return {"ok": False, "error": "unknown jobs or no fileId; upload first", "jobIds": missing}
+    try:
+        jobs.submit_batch(req.jobIds)
+    except asyncio.QueueFull:
+        return JSONResponse(status_code=429, content={"ok": False, "error": "generation queue is full, retry later"})
+    return {"ok": True, "jobIds": req.jobIds, "status": "pending"}
+
+
+@app.post("/cancel/{job_id}")
+async def cancel(job_id: str):
+    if not jobs.cancel(job_id):
+        return {"ok": False, "error": "job is not pending or running"}
+    return {"ok": True, "jobId": job_id, "status": "cancelled"}
+
+
+@app.get("/jobs")
+async def list_jobs(status: str | None = None, since: float | None = None, limit: int = 100):
+    return {"jobs": store.list(status=status, since=since, limit=min(limit, 1000))}
 
 
 @app.get("/content/{job_id}")
@@ -88,6 +195,73 @@ async def content(job_id: str):
         return {"jobId": job_id, "status": "error", "message": "Job not found"}
     return data
 
+@app.get("/events/{job_id}")
+async def job_events(job_id: str, format: str = "sse"):
+    """
+    Live progress of a job as server-sent events (format=ndjson: one JSON object
+    per line). The first event is a snapshot of the job; then come "status",
+    "progress" (pages read, files extracted) and "section" events (flashcards +
+    MCQs, then the summary, each saved to the job as soon as it is done). The
+    stream ends after the job's final status.
+    """
+    if format not in ("sse", "ndjson"):
+        return JSONResponse(status_code=400, content={"ok": False, "error": "format must be sse or ndjson"})
+    queue = jobs.subscribe(job_id)  # before the snapshot, so no event falls in between
+    job = load_json(job_id)
+    if not job:
+        jobs.unsubscribe(job_id, queue)
+        return JSONResponse(status_code=404, content={"jobId": job_id, "status": "error", "message": "Job not found"})
+
+    def encode(event: dict) -> str:
+        data = json.dumps(event, ensure_ascii=False)
+        return f"event: {event['event']}\ndata: {data}\n\n" if format == "sse" else data + "\n"
+
+    async def stream():
+        try:
+            yield encode({"event": "snapshot", "job": job, "progress": jobs.progress.get(job_id)})
+            if job.get("status") in TERMINAL:
+                return
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n" if format == "sse" else "\n"
+                    continue
+                yield encode(event)
+                if event["event"] == "status" and event["status"] in TERMINAL:
+                    return
+        finally:
+            jobs.unsubscribe(job_id, queue)
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(stream(), media_type=media_type,
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/search")
+async def search(q: str, limit: int = 20, offset: int = 0):
+    """Ranked full-text search over finished jobs' file names, summaries, flashcards, MCQs and source text."""
+    if index is None:
+        return JSONResponse(status_code=503, content={"ok": False, "error": "search index is disabled"})
+    limit, offset = max(1, min(limit, 100)), max(0, offset)
+    found = await asyncio.to_thread(index.search, q, limit, offset)
+    return {"query": q, "limit": limit, "offset": offset, **found}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint: stage latency histograms, cache hit ratios, queue depth."""
+    body = telemetry.render_prometheus()
+    if jobs is not None:
+        st = jobs.stats()
+        body += (
+            "# HELP mesa_jobs_pending Generation jobs waiting in the queue.\n"
+            "# TYPE mesa_jobs_pending gauge\n"
+            f"mesa_jobs_pending {st['pending']}\n"
+            "# HELP mesa_jobs_running Generation jobs being processed.\n"
+            "# TYPE mesa_jobs_running gauge\n"
+            f"mesa_jobs_running {st['running']}\n"
+        )
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
 # --- dev helper: create a ready-to-load demo job ---
 @app.post("/seed-demo")
 async def seed_demo():
@@ -98,6 +272,8 @@ async def seed_demo():
         **generate_from_text("demo text")
     }
     save_json(job_id, payload)
+    if index is not None:
+        index.add(job_id, payload, "demo text", file_name=job_id)
     return {"jobId": job_id, "status": "ready"}
 
 
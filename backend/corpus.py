@@ -0,0 +1,291 @@
+# corpus.py
+"""
+Shared corpus model for batch generation.
+
+All documents of an upload set are split into sentences once and turned into a
+single sparse sentence x term count matrix (terms are content-word unigrams and
+bigrams). Document frequencies, per-document key terms and the term -> sentence
+index all come from that one matrix, so flashcards (term -> defining sentence) and
+cloze MCQs (with distractors drawn from the other key terms of the corpus) are
+derived for every document together instead of rebuilding state per file.
+"""
+from __future__ import annotations
+import re, zlib
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Dict, List, Optional
+
+from summarizer import STOPWORDS, available, np, sparse, split_sentences, tokenize
+
+KEY_TERMS_PER_DOC = 8
+MCQS_PER_DOC = 5
+MIN_TERM_COUNT = 2          # a term must occur this often in a document to be key
+MIN_TERM_CHARS = 3
+BIGRAM_WEIGHT = 1.5         # multi-word terms are usually the real concepts
+DEFINED_WEIGHT = 3.0        # terms some sentence defines ("A stack is ...")
+BLANK = "_____"
+
+_WORD = re.compile(r"[a-z][a-z0-9\-]+")  # the tokens of summarizer.tokenize
+
+# "A hash table is ..." / "Overfitting means ...": the subject being defined.
+# ("X is called Y" names Y, not X, so it does not count.)
+_DEFINED_SUBJECT = re.compile(
+    r"^(?:an?\s+|the\s+)?([A-Za-z][\w\- ]{2,40}?)\s+(is|are|refers? to|means?|denotes?|is defined as)\b",
+    re.IGNORECASE,
+)
+_PLURAL_VERBS = {"are", "refer to", "mean", "denote"}
+
+
+def _terms(sentence: str) -> List[str]:
+    """
+    Content-word unigrams, plus bigrams of content words that stand next to
+    each other in the sentence (only whitespace between them): words that a
+    dropped stopword or punctuation separated never form a term.
+    """
+    text = sentence.lower()
+    words: List[str] = []
+    bigrams: List[str] = []
+    prev = None  # (word, end offset) of the previous token, if it was a content word
+    for m in _WORD.finditer(text):
+        tok = m.group(0)
+        if tok in STOPWORDS or len(tok) < MIN_TERM_CHARS or tok.replace("-", "").isdigit():
+            prev = None
+            continue
+        words.append(tok)
+        if prev is not None and text[prev[1]:m.start()].isspace():
+            bigrams.append(f"{prev[0]} {tok}")
+        prev = (tok, m.end())
+    return words + bigrams
+
+
+def _stems(term: str) -> set:
+    """Words of a term with a plural "s" dropped, for overlap checks."""
+    return {w[:-1] if w.endswith("s") and len(w) > 3 else w for w in term.split()}
+
+
+def _defined_subject(sentence: str) -> Optional[tuple]:
+    """
+    (term, plural) when the sentence defines its subject and the whole subject
+    is a one- or two-word term ("A hash table is ..."); None otherwise, e.g.
+    for "The topmost node of the tree is ...", which does not define "tree".
+    """
+    m = _DEFINED_SUBJECT.match(sentence)
+    if not m:
+        return None
+    words = m.group(1).lower().split()
+    if not 1 <= len(words) <= 2 or any(
+        w in STOPWORDS or len(w) < MIN_TERM_CHARS or not _WORD.fullmatch(w) for w in words
+    ):
+        return None
+    return " ".join(words), m.group(2).lower() in _PLURAL_VERBS
+
+
+def _defined_terms(sentences: List[str]) -> set:
+    """Every term some sentence defines as its subject."""
+    return {d[0] for d in map(_defined_subject, sentences) if d}
+
+
+def _term_pattern(term: str) -> "re.Pattern":
+    return re.compile(r"\b" + r"\s+".join(map(re.escape, term.split())) + r"\b", re.IGNORECASE)
+
+
+@dataclass
+class CorpusModel:
+    names: List[str]
+    sentences: List[str]
+    sent_doc: "np.ndarray"            # document index of every sentence
+    terms: List[str]                  # column -> term
+    vocab: Dict[str, int]             # term -> column
+    counts: "sparse.csr_matrix"       # sentences x terms
+    doc_terms: "sparse.csr_matrix"    # documents x terms
+    df: "np.ndarray"                  # number of documents containing each term
+    key_terms: List[List[int]] = field(default_factory=list)  # per document, best first
+
+    # --- construction ---
+    @classmethod
+    def build(cls, texts: List[str], names: Optional[List[str]] = None,
+              key_terms_per_doc: int = KEY_TERMS_PER_DOC) -> "CorpusModel":
+        sentences: List[str] = []
+        sent_doc: List[int] = []
+        for d, text in enumerate(texts):
+            ss = split_sentences(text)
+            sentences += ss
+            sent_doc += [d] * len(ss)
+        vocab: dict = {}
+        docs = [_terms(s) for s in sentences]
+        cols = [vocab.setdefault(t, len(vocab)) for doc in docs for t in doc]
+        n, ndocs = len(sentences), len(texts)
+        rows = np.repeat(np.arange(n), [len(doc) for doc in docs])
+        counts = sparse.csr_matrix(
+            (np.ones(len(cols)), (rows, cols)), shape=(n, max(len(vocab), 1))
+        )
+        counts.sum_duplicates()
+        sent_doc_arr = np.asarray(sent_doc, dtype=np.int64)
+        membership = sparse.csr_matrix((np.ones(n), (sent_doc_arr, np.arange(n))), shape=(ndocs, n))
+        doc_terms = sparse.csr_matrix(membership @ counts)
+        df = np.bincount(doc_terms.indices, minlength=counts.shape[1])
+        terms = [""] * len(vocab)
+        for t, i in vocab.items():
+            terms[i] = t
+        model = cls(list(names or [f"document {i + 1}" for i in range(ndocs)]), sentences, sent_doc_arr,
+                    terms, vocab, counts, doc_terms, df)
+        defined = [vocab[t] for t in _defined_terms(sentences) if t in vocab]
+        model.key_terms = model._rank_key_terms(key_terms_per_doc, defined)
+        return model
+
+    def _rank_key_terms(self, k: int, defined: List[int] = ()) -> List[List[int]]:
+        """
+        Score every (document, term) cell at once: sublinear term frequency, times
+        document IDF, times sentence specificity (terms found in most sentences
+        are generic), with bonuses for bigrams and for terms some sentence defines.
+        Then pick the top k per document, skipping terms that overlap words with
+        one already picked.
+        """
+        ndocs, nsent = self.doc_terms.shape[0], max(self.counts.shape[0], 1)
+        sent_df = np.bincount(self.counts.indices, minlength=self.counts.shape[1])
+        idf = np.log((1.0 + ndocs) / (1.0 + self.df)) + 1.0
+        specificity = np.log1p(nsent / np.maximum(sent_df, 1))
+        weight = idf * specificity * np.array([BIGRAM_WEIGHT if " " in t else 1.0 for t in self.terms])
+        weight[list(defined)] *= DEFINED_WEIGHT
+        scored = self.doc_terms.copy()
+        keep = scored.data >= MIN_TERM_COUNT
+        scored.data = np.where(keep, (1.0 + np.log(np.maximum(scored.data, 1))) * weight[scored.indices], 0.0)
+        scored.eliminate_zeros()
+        out: List[List[int]] = []
+        for d in range(ndocs):
+            lo, hi = scored.indptr[d], scored.indptr[d + 1]
+            order = scored.indices[lo:hi][np.argsort(-scored.data[lo:hi], kind="stable")]
+            picked: List[int] = []
+            words: set = set()
+            for t in order:
+                tw = _stems(self.terms[t])
+                if tw & words:
+                    continue
+                picked.append(int(t))
+                words |= tw
+                if len(picked) >= k:
+                    break
+            out.append(picked)
+        return out
+
+    # --- queries ---
+    def sentences_with(self, term: int, doc: int) -> "np.ndarray":
+        """Indices of the sentences of one document that contain a term."""
+        col = self._by_term[:, term]
+        rows = col.indices
+        return rows[self.sent_doc[rows] == doc]
+
+    @cached_property
+    def _by_term(self) -> "sparse.csc_matrix":
+        """Column-major copy of counts: the term -> sentence index."""
+        return self.counts.tocsc()
+
+    def _rank_sentences(self, term: int, doc: int) -> List[int]:
+        """Sentences mentioning a term, best definition first."""
+        rows = self.sentences_with(term, doc)
+        if not len(rows):
+            return []
+        pattern = _term_pattern(self.terms[term])
+        lengths = np.array([len(self.sentences[i].split()) for i in rows])
+        defines = np.array([self._defines(term, i) for i in rows])
+        starts = np.array([bool(pattern.match(self.sentences[i])) for i in rows])
+        score = 3.0 * defines + 1.0 * starts - np.abs(lengths - 20) / 20.0 - 0.001 * np.arange(len(rows))
+        return [int(rows[i]) for i in np.argsort(-score, kind="stable")]
+
+    def _defines(self, term: int, sentence: int) -> bool:
+        """Whether the sentence defines the term as its subject ("A stack is ...")."""
+        defined = _defined_subject(self.sentences[sentence])
+        return bool(defined and defined[0] == self.terms[term])
+
+    def _surface(self, term: int, sentence: int) -> str:
+        """The term as it is written in a sentence (original casing)."""
+        m = _term_pattern(self.terms[term]).search(self.sentences[sentence])
+        if not m:
+            return self.terms[term]
+        text = m.group(0)
+        if m.start() == 0 and text[1:] == text[1:].lower():
+            text = text[0].lower() + text[1:]  # capitalised only because it starts the sentence
+        return text
+
+    def _distractor_order(self) -> Dict[int, List[int]]:
+        """
+        For every key term of the corpus, the other key terms ordered by how
+        similar their sentence contexts are (cosine over the count matrix).
+        """
+        keys = sorted({t for ts in self.key_terms for t in ts})
+        if not keys:
+            return {}
+        vecs = sparse.csr_matrix(self._by_term[:, keys].T)
+        norms = np.sqrt(np.asarray(vecs.multiply(vecs).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        vecs = sparse.diags(1.0 / norms) @ vecs
+        # related-but-different terms make plausible distractors; add document
+        # co-membership so same-course terms win over unrelated ones
+        sims = (vecs @ vecs.T).toarray()
+        docs_of = (self.doc_terms[:, keys] > 0).astype(np.float64)
+        sims += 0.5 * (docs_of.T @ docs_of).toarray() / max(self.doc_terms.shape[0], 1)
+        np.fill_diagonal(sims, -np.inf)
+        order = np.argsort(-sims, axis=1, kind="stable")
+        return {t: [keys[j] for j in order[i]] for i, t in enumerate(keys)}
+
+    # --- generation ---
+    def flashcards(self, doc: int) -> List[dict]:
+        """One card per key term that some sentence of the document defines."""
+        cards = []
+        for t in self.key_terms[doc]:
+            ranked = self._rank_sentences(t, doc)
+            if not ranked:
+                continue
+            s = ranked[0]  # defining sentences rank first
+            if not self._defines(t, s):
+                continue
+            verb = "are" if _defined_subject(self.sentences[s])[1] else "is"
+            cards.append({"front": f"What {verb} {self._surface(t, s)}?", "back": self.sentences[s]})
+        return cards
+
+    def mcqs(self, doc: int, limit: int = MCQS_PER_DOC, distractors: Optional[Dict[int, List[int]]] = None) -> List[dict]:
+        distractors = self._distractor_order() if distractors is None else distractors
+        out = []
+        for t in self.key_terms[doc]:
+            ranked = self._rank_sentences(t, doc)
+            if not ranked:
+                continue
+            # quiz on a different sentence than the flashcard when there is one
+            s = ranked[1] if len(ranked) > 1 else ranked[0]
+            sentence = self.sentences[s]
+            answer = self._surface(t, s)
+            question, blanks = _term_pattern(self.terms[t]).subn(BLANK, sentence)
+            if not blanks:
+                continue
+            words = _stems(self.terms[t])
+            options: List[str] = []
+            for o in distractors.get(t, []):
+                if words & _stems(self.terms[o]) or _term_pattern(self.terms[o]).search(sentence):
+                    continue
+                options.append(self.terms[o])
+                if len(options) == 3:
+                    break
+            if len(options) < 3:
+                continue
+            pos = zlib.crc32(self.terms[t].encode()) % 4
+            options.insert(pos, answer)
+            out.append({"q": question, "options": options, "answer": pos,
+                        "explanation": f"From {self.names[doc]}: {sentence}"})
+            if len(out) >= limit:
+                break
+        return out
+
+    def generate(self) -> List[dict]:
+        """Flashcards and MCQs for every document, sharing one distractor table."""
+        distractors = self._distractor_order()
+        return [
+            {"flashcards": self.flashcards(d), "mcqs": self.mcqs(d, distractors=distractors)}
+            for d in range(len(self.names))
+        ]
+
+
+def build_corpus(texts: List[str], names: Optional[List[str]] = None) -> Optional[CorpusModel]:
+    """A CorpusModel over texts, or None when NumPy/SciPy are unavailable."""
+    if not available:
+        return None
+    return CorpusModel.build(texts, names)
@@ -0,0 +1,166 @@
+# extract_cache.py
+"""
+Persistent cache for extracted text, shared by summarize.py and ai_gen.
+
+Entries are keyed by the SHA-256 of the file bytes plus the extractor name and
+version, and hold one text row per PDF page (or a single row for an OCR'd image).
+Least-recently-used entries are evicted once the cache grows past its size cap.
+"""
+from __future__ import annotations
+import hashlib, os, threading, time, uuid
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+
+from sqlite_util import SqliteDB, evict_lru
+from telemetry import cache_event
+
+# --- settings ---
+CACHE_DIR = Path(os.environ.get("EXTRACT_CACHE_DIR") or Path(__file__).resolve().parent.parent / ".cache")
+CACHE_MAX_MB = int(os.environ.get("EXTRACT_CACHE_MAX_MB", "512"))
+CACHE_ENABLED = os.environ.get("EXTRACT_CACHE", "on").lower() not in {"off", "0", "false"}
+
+_READ_CHUNK = 1 << 20  # 1 MiB
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries(last_used);
+CREATE TABLE IF NOT EXISTS pages (
+    key TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (key, idx)
+);
+"""
+
+
+def file_digest(path: str | Path) -> str:
+    """SHA-256 of the file contents, read in 1 MiB blocks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_READ_CHUNK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_key(digest: str, extractor: str, version: str) -> str:
+    return f"{digest}:{extractor}:{version}"
+
+
+class ExtractCache(SqliteDB):
+    """SQLite-backed page cache; safe to share between threads and processes."""
+
+    def __init__(self, path: str | Path, max_bytes: int):
+        self.max_bytes = max_bytes
+        super().__init__(path, _SCHEMA)
+
+    def touch(self, key: str, count: bool = True) -> bool:
+        """
+        Mark key as recently used; False when it is not cached. count=False
+        leaves the hit/miss to the caller (e.g. one event for several keys).
+        """
+        conn = self._conn()
+        with conn:
+            hit = bool(conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key)).rowcount)
+        if count:
+            cache_event("extract", hit)
+        return hit
+
+    def iter_pages(self, key: str, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+        """Stream pages[start:stop] of a cached entry without loading the rest."""
+        sql = "SELECT text FROM pages WHERE key = ? AND idx >= ?"
+        args: list = [key, start]
+        if stop is not None:
+            sql += " AND idx < ?"
+            args.append(stop)
+        for (text,) in self._conn().execute(sql + " ORDER BY idx", args):
+            yield text
+
+    def get(self, key: str, count: bool = True) -> Optional[List[str]]:
+        """Return the cached pages for key, or None on a miss."""
+        if not self.touch(key, count):
+            return None
+        return list(self.iter_pages(key))
+
+    def writer(self, key: str) -> "PageWriter":
+        return PageWriter(self, key)
+
+    def put(self, key: str, pages: Iterable[str]) -> None:
+        w = self.writer(key)
+        try:
+            for text in pages:
+                w.add(text)
+            w.commit()
+        finally:
+            w.close()
+
+    def _evict(self) -> None:
+        """Drop least-recently-used entries until the cache fits under max_bytes."""
+        evict_lru(self._conn(), "entries", self.max_bytes, dependents=("pages",))
+
+    def clear(self) -> None:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM pages")
+            conn.execute("DELETE FROM entries")
+
+
+class PageWriter:
+    """
+    Appends pages one at a time so long documents are never buffered in memory.
+    Pages are staged under a key of their own, and commit() swaps them in for the
+    entry's pages in one transaction, so readers and concurrent writers of the
+    same entry only ever see a complete set. close() drops the staged pages of a
+    writer that was abandoned before commit(); call it in a finally block.
+    """
+
+    def __init__(self, cache: ExtractCache, key: str):
+        self.cache = cache
+        self.key = key
+        self.staging = f"{key}#staging:{uuid.uuid4().hex}"
+        self.size = 0
+        self.count = 0
+        self.committed = False
+
+    def add(self, text: str) -> None:
+        with self.cache._conn() as conn:
+            conn.execute(
+                "INSERT INTO pages (key, idx, text) VALUES (?, ?, ?)",
+                (self.staging, self.count, text),
+            )
+        self.count += 1
+        self.size += len(text.encode("utf-8"))
+
+    def commit(self) -> None:
+        with self.cache._conn() as conn:
+            conn.execute("DELETE FROM pages WHERE key = ?", (self.key,))
+            conn.execute("UPDATE pages SET key = ? WHERE key = ?", (self.key, self.staging))
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, size, last_used) VALUES (?, ?, ?)",
+                (self.key, self.size, time.time()),
+            )
+        self.committed = True
+        self.cache._evict()
+
+    def close(self) -> None:
+        if not self.committed and self.count:
+            with self.cache._conn() as conn:
+                conn.execute("DELETE FROM pages WHERE key = ?", (self.staging,))
+            self.count = 0
+
+
+_cache: Optional[ExtractCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Optional[ExtractCache]:
+    """Process-wide cache instance, or None when disabled via EXTRACT_CACHE=off."""
+    global _cache
+    if not CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ExtractCache(CACHE_DIR / "extract.sqlite3", CACHE_MAX_MB * 1024 * 1024)
+    return _cache
@@ -0,0 +1,231 @@
+# job_store.py
+"""
+Job persistence for the FastAPI app.
+
+JobStore is the interface app.py talks to. FileJobStore keeps the original
+one-JSON-file-per-job layout in data/; SqliteJobStore keeps jobs in one WAL-mode
+database with indexed status/creation-time columns, so listing, filtering and
+expiring jobs never has to scan the directory. Pick one with JOB_STORE=file|sqlite.
+"""
+from __future__ import annotations
+import json, os, time
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+from sqlite_util import SqliteDB
+
+JOB_STORE = os.environ.get("JOB_STORE", "sqlite").lower()
+JOB_TTL_DAYS = float(os.environ.get("JOB_TTL_DAYS") or 30)
+
+# fields kept in their own columns; everything else lives in the bundle JSON
+_COLUMNS = ("status", "fileId")
+
+
+class JobStore:
+    def get(self, job_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def put(self, job_id: str, payload: dict) -> None:
+        """Insert or fully replace a job."""
+        raise NotImplementedError
+
+    def update(self, job_id: str, **fields) -> None:
+        """Change some fields of an existing job."""
+        job = self.get(job_id) or {"jobId": job_id}
+        job.update(fields)
+        self.put(job_id, job)
+
+    def list(self, status: Optional[str] = None, since: Optional[float] = None, limit: int = 100) -> List[dict]:
+        """Newest-first job summaries (jobId, status, createdAt)."""
+        raise NotImplementedError
+
+    def expire(self, ttl_seconds: float) -> int:
+        """Delete jobs created more than ttl_seconds ago; returns how many."""
+        raise NotImplementedError
+
+
+class FileJobStore(JobStore):
+    """Original layout: data/<jobId>.json, rewritten on every change."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, job_id: str) -> Path:
+        return self.root / f"{job_id}.json"
+
+    def get(self, job_id: str) -> Optional[dict]:
+        p = self._path(job_id)
+        if not p.exists():
+            return None
+        return json.loads(p.read_text(encoding="utf-8"))
+
+    def put(self, job_id: str, payload: dict) -> None:
+        self._path(job_id).write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    def _all(self) -> Iterable[dict]:
+        for p in self.root.glob("*.json"):
+            try:
+                job = json.loads(p.read_text(encoding="utf-8"))
+            except ValueError:
+                continue
+            job.setdefault("createdAt", p.stat().st_mtime)
+            yield job
+
+    def list(self, status=None, since=None, limit=100):
+        jobs = [
+            {"jobId": j.get("jobId"), "status": j.get("status"), "createdAt": j["createdAt"]}
+            for j in self._all()
+            if (status is None or j.get("status") == status) and (since is None or j["createdAt"] >= since)
+        ]
+        return sorted(jobs, key=lambda j: j["createdAt"], reverse=True)[:limit]
+
+    def expire(self, ttl_seconds):
+        cutoff = time.time() - ttl_seconds
+        n = 0
+        for j in list(self._all()):
+            if j["createdAt"] < cutoff:
+                self._path(j["jobId"]).unlink(missing_ok=True)
+                n += 1
+        return n
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'pending',
+    file_id TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    bundle TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs(status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_created ON jobs(created_at);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+class SqliteJobStore(SqliteDB, JobStore):
+    """
+    One row per job. status/fileId/createdAt are real columns, the rest of the
+    payload is a JSON bundle; status-only updates never touch the bundle. WAL mode
+    plus a busy timeout makes concurrent writers across uvicorn workers safe.
+    """
+
+    def __init__(self, path: Path):
+        super().__init__(path, _SCHEMA)
+
+    @staticmethod
+    def _split(payload: dict) -> tuple:
+        bundle = {k: v for k, v in payload.items() if k not in _COLUMNS and k not in ("jobId", "createdAt")}
+        return payload.get("status", "pending"), payload.get("fileId"), json.dumps(bundle, ensure_ascii=False)
+
+    def get(self, job_id):
+        row = self._conn().execute(
+            "SELECT status, file_id, created_at, bundle FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        status, file_id, created_at, bundle = row
+        job = {"jobId": job_id, "status": status, **json.loads(bundle), "createdAt": created_at}
+        if file_id is not None:
+            job["fileId"] = file_id
+        return job
+
+    def put(self, job_id, payload):
+        status, file_id, bundle = self._split(payload)
+        now = time.time()
+        created = payload.get("createdAt", now)
+        with self._conn() as conn:
+            conn.execute(
+                """INSERT INTO jobs (job_id, status, file_id, created_at, updated_at, bundle)
+                   VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(job_id) DO UPDATE SET
+                     status = excluded.status, file_id = excluded.file_id,
+                     updated_at = excluded.updated_at, bundle = excluded.bundle""",
+                (job_id, status, file_id, created, now, bundle),
+            )
+
+    def update(self, job_id, **fields):
+        cols = {k: fields.pop(k) for k in _COLUMNS if k in fields}
+        fields.pop("jobId", None)
+        fields.pop("createdAt", None)
+        sets = ["updated_at = ?"]
+        args: list = [time.time()]
+        if "status" in cols:
+            sets.append("status = ?")
+            args.append(cols["status"])
+        if "fileId" in cols:
+            sets.append("file_id = ?")
+            args.append(cols["fileId"])
+        if fields:
+            # set only the changed keys in the stored bundle; unlike json_patch,
+            # json_set keeps explicit nulls, so an update can clear a field
+            sets.append(f"bundle = json_set(bundle{', ?, json(?)' * len(fields)})")
+            for key, value in fields.items():
+                args += ['$."' + key + '"', json.dumps(value, ensure_ascii=False)]
+        with self._conn() as conn:
+            cur = conn.execute(f"UPDATE jobs SET {', '.join(sets)} WHERE job_id = ?", (*args, job_id))
+            if cur.rowcount == 0:
+                conn.execute(
+                    "INSERT INTO jobs (job_id, status, file_id, created_at, updated_at, bundle) VALUES (?, ?, ?, ?, ?, ?)",
+                    (job_id, cols.get("status", "pending"), cols.get("fileId"), time.time(), time.time(),
+                     json.dumps(fields, ensure_ascii=False)),
+                )
+
+    def list(self, status=None, since=None, limit=100):
+        sql = "SELECT job_id, status, created_at FROM jobs WHERE 1=1"
+        args: list = []
+        if status is not None:
+            sql += " AND status = ?"
+            args.append(status)
+        if since is not None:
+            sql += " AND created_at >= ?"
+            args.append(since)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        args.append(limit)
+        return [
+            {"jobId": job_id, "status": st, "createdAt": created}
+            for job_id, st, created in self._conn().execute(sql, args)
+        ]
+
+    def expire(self, ttl_seconds):
+        with self._conn() as conn:
+            return conn.execute("DELETE FROM jobs WHERE created_at < ?", (time.time() - ttl_seconds,)).rowcount
+
+    def import_json_dir(self, root: Path) -> int:
+        """
+        One-off migration: copy data/*.json jobs that are not in the database yet.
+        Runs only once per database so expired jobs are not re-imported later;
+        when several workers start at once, the one whose marker insert wins
+        imports and the others skip.
+        """
+        n = 0
+        with self._conn() as conn:
+            claimed = conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES ('json_imported', ?)", (str(time.time()),)
+            ).rowcount
+            if not claimed:
+                return 0
+            for p in sorted(Path(root).glob("*.json")):
+                try:
+                    payload = json.loads(p.read_text(encoding="utf-8"))
+                except ValueError:
+                    continue
+                job_id = payload.get("jobId") or p.stem
+                status, file_id, bundle = self._split(payload)
+                mtime = p.stat().st_mtime
+                n += conn.execute(
+                    """INSERT OR IGNORE INTO jobs (job_id, status, file_id, created_at, updated_at, bundle)
+                       VALUES (?, ?, ?, ?, ?, ?)""",
+                    (job_id, status, file_id, payload.get("createdAt", mtime), mtime, bundle),
+                ).rowcount
+        return n
+
+
+def open_store(data_dir: Path, kind: str = JOB_STORE) -> JobStore:
+    if kind == "file":
+        return FileJobStore(data_dir)
+    store = SqliteJobStore(data_dir / "jobs.sqlite3")
+    store.import_json_dir(data_dir)
+    return store
@@ -0,0 +1,270 @@
+# jobs.py
+"""
+Background generation queue for the FastAPI app.
+
+/generate only enqueues; a fixed number of dispatcher tasks pull job ids off a
+bounded asyncio.Queue and run generate_from_files in a process pool, so PDF
+parsing never blocks the event loop. /generate-batch queues a whole upload set as
+one item, so all of its files are generated in a single call. Job status moves
+pending -> running -> ready | error (or cancelled) and is written to the job
+store as partial updates. With a search index, the pool worker also indexes
+each bundle and its source text before the job is marked ready.
+
+Pool workers report progress (pages read, files extracted) and each finished
+part of a bundle (flashcards + MCQs, then the summary) over a multiprocessing
+queue. Finished parts are written to the store right away, and every event is
+passed on to subscribe()rs, which /events streams to clients.
+"""
+from __future__ import annotations
+import asyncio, functools, multiprocessing, os, sqlite3, threading, time
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Set
+
+from ai_gen import generate_from_texts, read_sources
+from job_store import JobStore
+from search_index import SearchIndex, get_index
+from telemetry import record, span, traced_call, unwrap
+
+GEN_WORKERS = int(os.environ.get("GEN_WORKERS") or 2)
+GEN_QUEUE_MAX = int(os.environ.get("GEN_QUEUE_MAX") or 100)
+
+
+TERMINAL = ("ready", "error", "cancelled")
+SECTIONS = ("cards", "summary")  # progress stages that carry finished bundle fields
+
+# --- pool worker side ---
+_progress = None  # the JobQueue's progress queue, set in each worker by _init_worker
+
+
+def _init_worker(progress) -> None:
+    global _progress
+    _progress = progress
+
+
+def _report(job_ids: List[str], i: int, stage: str, fields: Dict[str, Any]) -> None:
+    _progress.put((job_ids[i], stage, fields))
+
+
+def run_generation(job_ids: List[str], paths: List[str], digests: List[Optional[str]], names: List[str],
+                   created: List[Optional[float]], index_path: Optional[str] = None) -> List[dict]:
+    """
+    generate_from_files for a batch of jobs, run in a pool worker: reports
+    progress as it goes and, given an index, indexes each bundle with the
+    source text it has already read (so that text never crosses back to the
+    app process). A failed index write is recorded in telemetry but does not
+    fail the jobs.
+    """
+    progress = functools.partial(_report, job_ids) if _progress is not None else None
+    texts = read_sources(paths, digests, progress)
+    bundles = generate_from_texts(texts, names, progress)
+    if index_path is not None:
+        try:
+            get_index(index_path).add_many(zip(job_ids, bundles, texts, names, created))
+        except sqlite3.Error:
+            pass  # already recorded as a search.index error
+    return bundles
+
+
+class JobQueue:
+    def __init__(
+        self,
+        store: JobStore,
+        index: Optional[SearchIndex] = None,
+        workers: int = GEN_WORKERS,
+        max_pending: int = GEN_QUEUE_MAX,
+    ):
+        self.store = store
+        self.index = index
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.tasks: list = []
+        self.queued: Set[str] = set()
+        self.cancelled: Set[str] = set()
+        self.running: Dict[str, asyncio.Future] = {}
+        self.enqueued_at: Dict[str, float] = {}
+        self.progress: Dict[str, dict] = {}                   # latest progress event per running job
+        self.listeners: Dict[str, Set[asyncio.Queue]] = {}
+        self.progress_queue = None
+
+    # --- lifecycle ---
+    def start(self) -> None:
+        # spawn, not fork: this process already runs threads (event loop helpers,
+        # SQLite connections), and a forked child could inherit a held lock
+        ctx = multiprocessing.get_context("spawn")
+        self.progress_queue = ctx.SimpleQueue()
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx, initializer=_init_worker,
+                                        initargs=(self.progress_queue,))
+        threading.Thread(target=self._read_progress, args=(asyncio.get_running_loop(),),
+                         name="job-progress", daemon=True).start()
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for t in self.tasks:
+            t.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+        if self.progress_queue is not None:
+            self.progress_queue.put(None)  # ends _read_progress
+
+    # --- public API ---
+    def submit(self, job_id: str) -> None:
+        """Queue a job; raises asyncio.QueueFull when the backlog is at capacity."""
+        self.submit_batch([job_id])
+
+    def submit_batch(self, job_ids: List[str]) -> None:
+        """
+        Queue jobs to be generated together in one call sharing a corpus model.
+        Jobs already queued or running are left where they are. Raises
+        asyncio.QueueFull when the backlog is at capacity.
+        """
+        fresh = [j for j in dict.fromkeys(job_ids) if j not in self.running and j not in self.queued]
+        if fresh:
+            self.queue.put_nowait(tuple(fresh))  # raises asyncio.QueueFull
+            now = time.perf_counter()
+            for job_id in fresh:
+                self.enqueued_at[job_id] = now
+        for job_id in job_ids:
+            if job_id in self.running:
+                continue
+            self.queued.add(job_id)
+            self.cancelled.discard(job_id)
+            self._set_status(job_id, "pending")
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a pending or running job. A running extraction cannot be interrupted
+        inside its worker process, so its result is discarded when it finishes; the
+        worker call itself is only cancelled once every job sharing it is.
+        """
+        if job_id in self.queued:
+            self.cancelled.add(job_id)
+        elif job_id in self.running:
+            self.cancelled.add(job_id)
+            fut = self.running[job_id]
+            if all(j in self.cancelled for j, f in self.running.items() if f is fut):
+                fut.cancel()
+        else:
+            return False
+        self._set_status(job_id, "cancelled")
+        return True
+
+    def stats(self) -> dict:
+        return {"pending": len(self.queued), "running": len(self.running), "workers": self.workers}
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        """
+        Queue receiving the job's events from now on: {"event": "status", "status"},
+        {"event": "progress", "stage", ...} and {"event": "section", "section", <bundle fields>}.
+        """
+        q: asyncio.Queue = asyncio.Queue()
+        self.listeners.setdefault(job_id, set()).add(q)
+        return q
+
+    def unsubscribe(self, job_id: str, q: asyncio.Queue) -> None:
+        qs = self.listeners.get(job_id)
+        if qs is not None:
+            qs.discard(q)
+            if not qs:
+                del self.listeners[job_id]
+
+    # --- internals ---
+    def _publish(self, job_id: str, event: dict) -> None:
+        for q in self.listeners.get(job_id, ()):
+            q.put_nowait(event)
+
+    def _set_status(self, job_id: str, status: str, **extra) -> None:
+        self.store.update(job_id, status=status, **extra)
+        event = {"event": "status", "status": status}
+        if "message" in extra:
+            event["message"] = extra["message"]
+        self._publish(job_id, event)
+
+    def _read_progress(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Thread: hand progress from the pool workers to the event loop."""
+        while (item := self.progress_queue.get()) is not None:
+            try:
+                loop.call_soon_threadsafe(self._on_progress, *item)
+            except RuntimeError:  # loop closed during shutdown
+                return
+
+    def _on_progress(self, job_id: str, stage: str, fields: dict) -> None:
+        if job_id not in self.running or job_id in self.cancelled:
+            return  # finished (the bundle has it all) or its result is discarded
+        if stage in SECTIONS:
+            self.store.update(job_id, **fields)  # readable through /content before the job is ready
+            self._publish(job_id, {"event": "section", "section": stage, **fields})
+        else:
+            event = self.progress[job_id] = {"event": "progress", "stage": stage, **fields}
+            self._publish(job_id, event)
+
+    def _unindex_cancelled(self, job_ids: tuple) -> None:
+        """
+        Drop the index entries a cancelled batch's pool process wrote after all
+        (runs in the pool's callback thread; the store and index are thread-safe).
+        """
+        for job_id in job_ids:
+            job = self.store.get(job_id)
+            if job is not None and job.get("status") == "cancelled":
+                self.index.remove(job_id)
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.queue.get()
+            live: List[str] = []
+            files: List[tuple] = []
+            created: List[Optional[float]] = []
+            try:
+                for job_id in batch:
+                    self.queued.discard(job_id)
+                    queued_at = self.enqueued_at.pop(job_id, None)
+                    if queued_at is not None:
+                        record("job.queue_wait", time.perf_counter() - queued_at, job=job_id)
+                    if job_id in self.cancelled:
+                        self.cancelled.discard(job_id)
+                        continue
+                    job = self.store.get(job_id)
+                    if job and job.get("fileId"):
+                        live.append(job_id)
+                        files.append((job["fileId"], job.get("sha256"), job.get("fileName") or Path(job["fileId"]).name))
+                        created.append(job.get("createdAt"))
+                if not live:
+                    continue
+                for job_id in live:
+                    self._set_status(job_id, "running")
+                paths, digests, names = map(list, zip(*files))
+                index_path = str(self.index.path) if self.index is not None else None
+                work = self.pool.submit(traced_call, run_generation, live, paths, digests, names, created, index_path)
+                fut = asyncio.wrap_future(work, loop=loop)
+                for job_id in live:
+                    self.running[job_id] = fut
+                try:
+                    with span("job.generate", jobs=len(live)):
+                        result = unwrap(await fut)  # merges the worker's spans into /metrics
+                except asyncio.CancelledError:
+                    if all(j in self.cancelled for j in live):  # cancel() calls, not shutdown
+                        if self.index is not None:
+                            # a running pool process cannot be stopped and still indexes the batch
+                            work.add_done_callback(lambda _, batch=tuple(live): self._unindex_cancelled(batch))
+                        continue
+                    raise
+                for job_id, bundle in zip(live, result):
+                    if job_id not in self.cancelled:
+                        self._set_status(job_id, "ready", **bundle)
+                    elif self.index is not None:
+                        self.index.remove(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                for job_id in live:
+                    if job_id not in self.cancelled:
+                        self._set_status(job_id, "error", message=str(e))
+            finally:
+                for job_id in live:
+                    self.running.pop(job_id, None)
+                    self.cancelled.discard(job_id)
+                    self.progress.pop(job_id, None)
+                self.queue.task_done()
@@ -0,0 +1,248 @@
+# search_index.py
+"""
+Full-text search over generated jobs.
+
+One SQLite FTS5 table holds, per job, the file name, summary, flashcards, MCQs
+and the extracted source text; a plain `entries` table maps job ids to FTS rows
+so replacing or expiring a job never scans the index. Generation workers add
+each job as it finishes (jobs.run_generation), and /search runs ranked
+(BM25, file name and summary weighted above the source text), paginated
+queries with highlighted snippets.
+
+Scoring every match of a word found in nearly every job is what makes FTS5
+slow at 100k jobs, so only the SEARCH_RANK_WINDOW most recently indexed
+matches are ranked (the total stays exact); narrower queries rank all of
+their matches. SQLite builds without FTS5 leave search disabled rather than
+failing the app.
+"""
+from __future__ import annotations
+import os, re, sqlite3, threading, time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlite_util import SqliteDB
+from telemetry import span
+
+SEARCH_INDEX = os.environ.get("SEARCH_INDEX", "on").lower() not in {"off", "0", "false"}
+# source text indexed per job; summaries, flashcards and MCQs are always indexed in full
+SEARCH_SOURCE_CHARS = int(os.environ.get("SEARCH_SOURCE_CHARS") or 200_000)
+SEARCH_RANK_WINDOW = int(os.environ.get("SEARCH_RANK_WINDOW") or 2000)
+
+# column order matters: bm25() weights and snippet() column numbers follow it
+_FIELDS = ("file_name", "summary", "flashcards", "mcqs", "source")
+_WEIGHTS = (4.0, 3.0, 2.0, 2.0, 1.0)
+_BM25 = f"bm25(search, {', '.join(map(str, _WEIGHTS))})"
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    job_id TEXT NOT NULL UNIQUE,
+    file_name TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_created ON entries(created_at);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5(
+    {", ".join(_FIELDS)},
+    tokenize = 'porter unicode61 remove_diacritics 2'
+);
+"""
+
+_PHRASE = re.compile(r'"([^"]*)"|(\S+)')
+_WORD = re.compile(r"\w+")
+
+
+def match_expression(query: str) -> str:
+    """
+    FTS5 MATCH expression for a user query: every word must appear, "quoted
+    words" must appear as a phrase and a trailing * matches prefixes (tree*).
+    Everything else is quoted, so FTS5 syntax in user input cannot raise.
+    """
+    terms = []
+    for phrase, word in _PHRASE.findall(query):
+        if phrase:
+            words = _WORD.findall(phrase)
+            if words:
+                terms.append('"' + " ".join(words) + '"')
+            continue
+        words = _WORD.findall(word)
+        terms += [f'"{w}"' for w in words]
+        if words and word.endswith("*"):
+            terms[-1] += "*"
+    return " ".join(terms)
+
+
+def _flashcards_text(cards) -> str:
+    return "\n".join(f"{c.get('front', '')}\n{c.get('back', '')}" for c in cards or [] if isinstance(c, dict))
+
+
+def _mcqs_text(mcqs) -> str:
+    lines = []
+    for m in mcqs or []:
+        if isinstance(m, dict):
+            lines.append(m.get("q", ""))
+            lines += [str(o) for o in m.get("options") or []]
+            lines.append(m.get("explanation", ""))
+    return "\n".join(line for line in lines if line)
+
+
+class SearchIndex(SqliteDB):
+    """FTS5 index of generated jobs; safe to share between threads and processes."""
+
+    def __init__(self, path: Path):
+        super().__init__(path, _SCHEMA)  # raises sqlite3.OperationalError without FTS5
+
+    # --- writes ---
+    def add(self, job_id: str, bundle: dict, source: str = "", file_name: Optional[str] = None,
+            created_at: Optional[float] = None) -> None:
+        """Index (or re-index) one job's bundle and source text."""
+        self.add_many([(job_id, bundle, source, file_name, created_at)])
+
+    def add_many(self, items: Iterable[Tuple[str, dict, str, Optional[str], Optional[float]]]) -> int:
+        """Index several (job_id, bundle, source, file_name, created_at) in one transaction."""
+        n = 0
+        with span("search.index") as sp, self._conn() as conn:
+            for job_id, bundle, source, file_name, created_at in items:
+                source = (source or "")[:SEARCH_SOURCE_CHARS]
+                file_name = file_name or bundle.get("fileName") or ""
+                self._delete(conn, job_id)
+                cur = conn.execute(
+                    "INSERT INTO entries (job_id, file_name, created_at) VALUES (?, ?, ?)",
+                    (job_id, file_name, created_at or bundle.get("createdAt") or time.time()),
+                )
+                row = (file_name, bundle.get("summary") or "", _flashcards_text(bundle.get("flashcards")),
+                       _mcqs_text(bundle.get("mcqs")), source)
+                conn.execute(
+                    f"INSERT INTO search (rowid, {', '.join(_FIELDS)}) VALUES (?, ?, ?, ?, ?, ?)",
+                    (cur.lastrowid, *row),
+                )
+                sp.bytes += sum(len(text.encode("utf-8")) for text in row)
+                n += 1
+        return n
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, job_id: str) -> int:
+        row = conn.execute("SELECT id FROM entries WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return 0
+        conn.execute("DELETE FROM search WHERE rowid = ?", row)
+        conn.execute("DELETE FROM entries WHERE id = ?", row)
+        return 1
+
+    def backfill(self, store, read_source: Callable[[dict], str] = lambda job: "", batch: int = 100) -> int:
+        """
+        One-off: index every ready job in store, i.e. jobs generated before the
+        index existed or imported from data/*.json. Runs once per index (like
+        JobStore.import_json_dir): when several workers start at once, the one
+        whose marker insert wins does it. read_source(job) returns a job's
+        source text, "" when its upload is gone. A failed backfill clears the
+        marker so the next start tries again.
+        """
+        with self._conn() as conn:
+            claimed = conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES ('backfilled', ?)", (str(time.time()),)
+            ).rowcount
+        if not claimed:
+            return 0
+        n = 0
+        try:
+            ready = [j["jobId"] for j in store.list(status="ready", limit=1 << 31)]
+            for i in range(0, len(ready), batch):
+                items = []
+                for job_id in ready[i:i + batch]:
+                    job = store.get(job_id)
+                    if job is not None:
+                        items.append((job_id, job, read_source(job), job.get("fileName"), job.get("createdAt")))
+                n += self.add_many(items)
+        except BaseException:
+            with self._conn() as conn:
+                conn.execute("DELETE FROM meta WHERE key = 'backfilled'")
+            raise
+        return n
+
+    def remove(self, job_id: str) -> bool:
+        with self._conn() as conn:
+            return bool(self._delete(conn, job_id))
+
+    def expire(self, ttl_seconds: float) -> int:
+        """Drop jobs created more than ttl_seconds ago (mirrors JobStore.expire)."""
+        cutoff = time.time() - ttl_seconds
+        with self._conn() as conn:
+            ids = conn.execute("SELECT id FROM entries WHERE created_at < ?", (cutoff,)).fetchall()
+            conn.executemany("DELETE FROM search WHERE rowid = ?", ids)
+            conn.executemany("DELETE FROM entries WHERE id = ?", ids)
+        return len(ids)
+
+    # --- reads ---
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> Dict:
+        """
+        Best matches first: {"total", "results": [{jobId, fileName, createdAt,
+        score, snippet}]}. score is the weighted BM25 rank (lower is better);
+        snippet marks the matched words with <mark>...</mark>.
+        """
+        expr = match_expression(query)
+        if not expr:
+            return {"total": 0, "results": []}
+        with span("search.query") as sp:
+            conn = self._conn()
+            (total,) = conn.execute("SELECT count(*) FROM search WHERE search MATCH ?", (expr,)).fetchone()
+            window = max(SEARCH_RANK_WINDOW, offset + limit)
+            floor = 0
+            if total > window:
+                # rowid of the window-th newest match; walking rowids costs nothing next to bm25()
+                (floor,) = conn.execute(
+                    "SELECT rowid FROM search WHERE search MATCH ? ORDER BY rowid DESC LIMIT 1 OFFSET ?",
+                    (expr, window - 1),
+                ).fetchone()
+            # rank inside the FTS table alone: wrapping this in a join costs several times more
+            ranked = conn.execute(
+                f"""SELECT rowid, {_BM25} AS score, snippet(search, -1, '<mark>', '</mark>', '…', 16)
+                    FROM search WHERE search MATCH ? AND rowid >= ?
+                    ORDER BY score LIMIT ? OFFSET ?""",
+                (expr, floor, limit, offset),
+            ).fetchall()
+            entries = {
+                row[0]: row[1:] for row in conn.execute(
+                    f"SELECT id, job_id, file_name, created_at FROM entries WHERE id IN ({','.join('?' * len(ranked))})",
+                    [rowid for rowid, *_ in ranked],
+                )
+            }
+            sp.attrs["hits"] = total
+        results: List[dict] = []
+        for rowid, score, snip in ranked:
+            job_id, file_name, created = entries[rowid]
+            results.append({"jobId": job_id, "fileName": file_name, "createdAt": created,
+                            "score": score, "snippet": snip})
+        return {"total": total, "results": results}
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT count(*) FROM entries").fetchone()[0]
+
+
+_indexes: Dict[Tuple[int, str], SearchIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(path: str | Path) -> SearchIndex:
+    """
+    Process-wide index for path (generation pool workers open it once each).
+    Keyed by pid: a forked worker inherits the parent's cache, and with it an
+    open SQLite connection that must not be shared across processes.
+    """
+    key = (os.getpid(), str(path))
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = SearchIndex(Path(path))
+    return index
+
+
+def open_index(data_dir: Path) -> Optional[SearchIndex]:
+    """The app's index in data_dir, or None when SEARCH_INDEX=off or SQLite lacks FTS5."""
+    if not SEARCH_INDEX:
+        return None
+    try:
+        return get_index(Path(data_dir) / "search.sqlite3")
+    except sqlite3.OperationalError as e:
+        print(f"Warning: full-text search disabled ({e})")
+        return None
@@ -0,0 +1,73 @@
+# sqlite_util.py
+"""
+Shared plumbing for the SQLite files: the extraction and LLM caches, the job
+store and the search index.
+
+Each is one WAL-mode database opened by several threads and processes at
+once. SqliteDB gives every thread its own connection (sqlite3 connections
+must not cross threads) with a busy timeout, and evict_lru() trims a cache
+table back under its size cap.
+"""
+from __future__ import annotations
+import sqlite3, threading, time
+from pathlib import Path
+from typing import Iterable
+
+BUSY_TIMEOUT = 30  # seconds a writer waits for another one's lock
+
+
+def enable_wal(conn: sqlite3.Connection, timeout: float = BUSY_TIMEOUT) -> None:
+    """
+    Switch a connection to WAL. Converting a new database takes an exclusive
+    lock without waiting on the busy timeout, so workers opening it at the
+    same moment retry here instead of failing at startup.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            return
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) or time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+class SqliteDB:
+    """One SQLite file, created with schema on first use; _conn() is this thread's connection."""
+
+    def __init__(self, path: str | Path, schema: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(schema)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT)
+            enable_wal(conn)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+
+def evict_lru(conn: sqlite3.Connection, table: str, max_bytes: int, dependents: Iterable[str] = ()) -> None:
+    """
+    Drop least-recently-used rows of table (key, size and last_used columns)
+    until their sizes add up to max_bytes or less, along with the rows of the
+    same keys in each dependent table.
+    """
+    with conn:
+        (total,) = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {table}").fetchone()
+        if total <= max_bytes:
+            return
+        victims = []
+        for key, size in conn.execute(f"SELECT key, size FROM {table} ORDER BY last_used"):
+            if total <= max_bytes:
+                break
+            victims.append((key,))
+            total -= size
+        for t in (*dependents, table):
+            conn.executemany(f"DELETE FROM {t} WHERE key = ?", victims)
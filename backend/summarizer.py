@@ -0,0 +1,160 @@
+# summarizer.py
+"""
+Offline extractive summarizer.
+
+Sentences are split with a regex and turned into a sparse TF-IDF matrix X. Each
+sentence is scored by TextRank centrality on the cosine-similarity graph X·Xᵀ,
+computed by power iteration as X·(Xᵀ·v) so the n×n graph is never built. The
+summary is then picked greedily with MMR (relevance minus similarity to what is
+already chosen) under a sentence and character budget, and returned in document
+order. Needs NumPy and SciPy; `available` is False without them.
+"""
+from __future__ import annotations
+import re
+from typing import List, Optional, Tuple
+
+try:
+    import numpy as np
+    from scipy import sparse
+except Exception:
+    np = None
+    sparse = None
+
+available = np is not None
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_TOKEN = re.compile(r"[a-z][a-z0-9\-]+")
+MIN_SENTENCE_CHARS = 20
+MAX_SENTENCE_CHARS = 600
+MMR_POOL = 300        # only the top-ranked sentences are considered for selection
+MMR_LAMBDA = 0.7      # 1.0 = pure centrality, lower = stronger redundancy penalty
+KEY_WINDOW = 200      # key_sentences budgets selection per this many consecutive sentences
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has have having
+he her here hers him his how i if in into is it its itself just me more most my no nor not of off on once
+only or other our ours out over own same she should so some such than that the their theirs them then there
+these they this those through to too under until up very was we were what when where which while who whom
+why will with would you your yours
+""".split())
+
+
+def split_sentences(text: str) -> List[str]:
+    text = " ".join(text.split())
+    if not text:
+        return []
+    return [s for s in _SENTENCE_END.split(text) if MIN_SENTENCE_CHARS <= len(s) <= MAX_SENTENCE_CHARS]
+
+
+def tokenize(sentence: str) -> List[str]:
+    return [t for t in _TOKEN.findall(sentence.lower()) if t not in STOPWORDS]
+
+
+def tfidf_matrix(sentences: List[str]) -> Tuple["sparse.csr_matrix", dict]:
+    """L2-normalised sublinear TF-IDF rows, one per sentence; also returns the vocabulary."""
+    vocab: dict = {}
+    docs = [tokenize(s) for s in sentences]
+    cols = [vocab.setdefault(tok, len(vocab)) for doc in docs for tok in doc]
+    n = len(sentences)
+    rows = np.repeat(np.arange(n), [len(doc) for doc in docs])
+    data = np.ones(len(cols), dtype=np.float64)
+    X = sparse.csr_matrix((data, (rows, cols)), shape=(n, max(len(vocab), 1)))
+    X.sum_duplicates()
+    X.data = 1.0 + np.log(X.data)
+    df = np.bincount(X.indices, minlength=X.shape[1])
+    idf = np.log((1.0 + n) / (1.0 + df)) + 1.0
+    X = X @ sparse.diags(idf)
+    norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.csr_matrix(sparse.diags(1.0 / norms) @ X), vocab
+
+
+def textrank(X, damping: float = 0.85, iters: int = 50, tol: float = 1e-6) -> "np.ndarray":
+    """
+    PageRank over the weighted graph S = X·Xᵀ - I (cosine similarity, no self loops),
+    using only sparse matrix-vector products.
+    """
+    n = X.shape[0]
+    Xt = X.T.tocsr()
+    ones = np.ones(n)
+    self_sim = np.asarray(X.multiply(X).sum(axis=1)).ravel()
+    degree = X @ (Xt @ ones) - self_sim
+    dangling = degree <= 1e-12
+    degree[dangling] = 1.0
+    p = ones / n
+    for _ in range(iters):
+        q = p / degree
+        q[dangling] = 0.0
+        spread = X @ (Xt @ q) - self_sim * q
+        new = (1 - damping) / n + damping * (spread + p[dangling].sum() / n)
+        if np.abs(new - p).sum() < tol:
+            return new
+        p = new
+    return p
+
+
+def select_mmr(X, scores, candidates, max_sentences: int, lengths: List[int], max_chars: int,
+               lam: float = MMR_LAMBDA) -> List[int]:
+    """
+    Greedy MMR pick among candidate sentence indices (only the MMR_POOL best-scored
+    are considered) within the sentence and character budgets; returns sorted indices.
+    """
+    candidates = np.asarray(candidates)
+    pool = candidates[np.argsort(-scores[candidates])[:MMR_POOL]]
+    sims = (X[pool] @ X[pool].T).toarray()
+    rel = scores[pool] / (scores[pool].max() or 1.0)
+    chosen: List[int] = []              # positions within pool
+    max_sim = np.zeros(len(pool))
+    used = 0
+    open_mask = np.ones(len(pool), dtype=bool)
+    while len(chosen) < max_sentences and open_mask.any():
+        gain = lam * rel - (1 - lam) * max_sim
+        gain[~open_mask] = -np.inf
+        best = int(np.argmax(gain))
+        open_mask[best] = False
+        length = lengths[pool[best]] + 1
+        if used + length > max_chars + 1:
+            continue
+        chosen.append(best)
+        used += length
+        max_sim = np.maximum(max_sim, sims[best])
+    return sorted(int(pool[i]) for i in chosen)
+
+
+def summarize(text: str, max_sentences: int = 5, max_chars: int = 800) -> Optional[str]:
+    """Extractive summary of text, or None when NumPy/SciPy are unavailable."""
+    if not available:
+        return None
+    sentences = split_sentences(text)
+    if len(sentences) <= 1:
+        return " ".join(sentences)[:max_chars]
+    X, _ = tfidf_matrix(sentences)
+    scores = textrank(X)
+    picked = select_mmr(X, scores, range(len(sentences)), max_sentences, [len(s) for s in sentences], max_chars)
+    return " ".join(sentences[i] for i in picked)
+
+
+def key_sentences(text: str, budget_chars: int) -> str:
+    """
+    Cheap pre-filter for LLM input: the most central, non-redundant sentences of
+    text that fit in about budget_chars, in document order. Selection runs per
+    window of consecutive sentences with a proportional share of the budget, so
+    every part of a long document stays represented. Returns text unchanged if it
+    already fits or NumPy/SciPy are unavailable.
+    """
+    if not available or len(text) <= budget_chars:
+        return text
+    sentences = split_sentences(text)
+    if len(sentences) <= 1:
+        return text
+    X, _ = tfidf_matrix(sentences)
+    scores = textrank(X)
+    lengths = [len(s) for s in sentences]
+    ratio = budget_chars / max(sum(lengths) + len(lengths), 1)
+    picked: List[int] = []
+    for lo in range(0, len(sentences), KEY_WINDOW):
+        window = range(lo, min(lo + KEY_WINDOW, len(sentences)))
+        share = int(ratio * sum(lengths[i] + 1 for i in window))
+        picked += select_mmr(X, scores, window, len(window), lengths, share)
+    return " ".join(sentences[i] for i in picked)
@@ -0,0 +1,242 @@
+# telemetry.py
+"""
+Instrumentation for the processing pipeline, shared by summarize.py, the
+backend and the cloud scripts.
+
+span() is a context manager that measures one stage: wall time, CPU time of the
+calling thread, and optional byte/token counts. Every finished span is folded
+into in-process histograms (render_prometheus() serves them on the backend's
+/metrics) and, when TELEMETRY_LOG is set, written as one JSON line to stderr
+(TELEMETRY_LOG=stderr) or appended to the named file. Work that runs in a
+process pool is wrapped with traced_call() in the worker and its spans are
+merged back into the parent with unwrap().
+"""
+from __future__ import annotations
+import json, os, sys, threading, time, uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+TELEMETRY_LOG = os.environ.get("TELEMETRY_LOG", "")
+# latency histogram bucket bounds, seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+@dataclass
+class Span:
+    name: str
+    attrs: Dict[str, Any] = field(default_factory=dict)
+    bytes: int = 0
+    tokens: int = 0
+    wall: float = 0.0
+    cpu: float = 0.0
+    start: float = 0.0
+    error: Optional[str] = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    parent: Optional[str] = None
+    pid: int = field(default_factory=os.getpid)
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("telemetry_span", default=None)
+_captured: ContextVar[Optional[List[dict]]] = ContextVar("telemetry_captured", default=None)
+
+
+# --- aggregation ---
+
+class _Stage:
+    __slots__ = ("buckets", "count", "wall", "cpu", "bytes", "tokens", "errors")
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.wall = self.cpu = 0.0
+        self.bytes = self.tokens = self.errors = 0
+
+
+class Registry:
+    """Per-stage latency histograms and totals plus per-cache hit/miss counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages: Dict[str, _Stage] = {}
+        self.caches: Dict[str, List[int]] = {}   # name -> [hits, misses]
+
+    def observe(self, name: str, wall: float, cpu: float = 0.0, nbytes: int = 0,
+                tokens: int = 0, error: bool = False) -> None:
+        with self._lock:
+            st = self.stages.get(name)
+            if st is None:
+                st = self.stages[name] = _Stage()
+            for i, bound in enumerate(BUCKETS):
+                if wall <= bound:
+                    st.buckets[i] += 1
+            st.count += 1
+            st.wall += wall
+            st.cpu += cpu
+            st.bytes += nbytes
+            st.tokens += tokens
+            st.errors += bool(error)
+
+    def cache_event(self, cache: str, hit: bool, n: int = 1) -> None:
+        with self._lock:
+            counts = self.caches.setdefault(cache, [0, 0])
+            counts[0 if hit else 1] += n
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "stages": {
+                    name: {"count": s.count, "wall": s.wall, "cpu": s.cpu, "bytes": s.bytes,
+                           "tokens": s.tokens, "errors": s.errors}
+                    for name, s in self.stages.items()
+                },
+                "caches": {name: {"hits": h, "misses": m} for name, (h, m) in self.caches.items()},
+            }
+
+    def render(self, prefix: str = "mesa") -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            stages = {name: (list(s.buckets), s.count, s.wall, s.cpu, s.bytes, s.tokens, s.errors)
+                      for name, s in sorted(self.stages.items())}
+            caches = {name: tuple(c) for name, c in sorted(self.caches.items())}
+        out = [f"# HELP {prefix}_stage_seconds Wall-clock time per pipeline stage.",
+               f"# TYPE {prefix}_stage_seconds histogram"]
+        for name, (buckets, count, wall, *_rest) in stages.items():
+            label = f'stage="{_escape(name)}"'
+            for bound, n in zip(BUCKETS, buckets):
+                out.append(f'{prefix}_stage_seconds_bucket{{{label},le="{bound:g}"}} {n}')
+            out.append(f'{prefix}_stage_seconds_bucket{{{label},le="+Inf"}} {count}')
+            out.append(f"{prefix}_stage_seconds_sum{{{label}}} {wall:.6f}")
+            out.append(f"{prefix}_stage_seconds_count{{{label}}} {count}")
+        for metric, idx, help_ in (
+            ("stage_cpu_seconds_total", 3, "CPU time of the measuring thread per stage."),
+            ("stage_bytes_total", 4, "Bytes processed per stage."),
+            ("stage_tokens_total", 5, "LLM tokens per stage."),
+            ("stage_errors_total", 6, "Stage runs that raised."),
+        ):
+            out += [f"# HELP {prefix}_{metric} {help_}", f"# TYPE {prefix}_{metric} counter"]
+            for name, values in stages.items():
+                value = values[idx]
+                out.append(f'{prefix}_{metric}{{stage="{_escape(name)}"}} '
+                           + (f"{value:.6f}" if isinstance(value, float) else str(value)))
+        out += [f"# HELP {prefix}_cache_requests_total Cache lookups by result.",
+                f"# TYPE {prefix}_cache_requests_total counter"]
+        for name, (hits, misses) in caches.items():
+            out.append(f'{prefix}_cache_requests_total{{cache="{_escape(name)}",result="hit"}} {hits}')
+            out.append(f'{prefix}_cache_requests_total{{cache="{_escape(name)}",result="miss"}} {misses}')
+        out += [f"# HELP {prefix}_cache_hit_ratio Share of cache lookups that hit.",
+                f"# TYPE {prefix}_cache_hit_ratio gauge"]
+        for name, (hits, misses) in caches.items():
+            ratio = hits / (hits + misses) if hits + misses else 0.0
+            out.append(f'{prefix}_cache_hit_ratio{{cache="{_escape(name)}"}} {ratio:.6f}')
+        return "\n".join(out) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY = Registry()
+
+
+# --- recording ---
+
+_log_lock = threading.Lock()
+
+
+def _log(record: dict) -> None:
+    if not TELEMETRY_LOG:
+        return
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    with _log_lock:
+        if TELEMETRY_LOG in {"stderr", "-", "1", "on"}:
+            sys.stderr.write(line + "\n")
+            sys.stderr.flush()
+        else:
+            with open(TELEMETRY_LOG, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+def _finish(s: Span) -> None:
+    REGISTRY.observe(s.name, s.wall, s.cpu, s.bytes, s.tokens, s.error is not None)
+    record = {"type": "span", **asdict(s)}
+    captured = _captured.get()
+    if captured is not None:
+        captured.append(record)
+    _log(record)
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Span]:
+    """
+    Measure one stage. Set s.bytes / s.tokens / s.attrs on the yielded span while
+    it runs; an exception escaping the block is recorded and re-raised.
+    """
+    parent = _current.get()
+    s = Span(name, attrs, start=time.time(), parent=parent.id if parent else None)
+    token = _current.set(s)
+    t0, c0 = time.perf_counter(), time.thread_time()
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        s.wall = time.perf_counter() - t0
+        s.cpu = time.thread_time() - c0
+        _current.reset(token)
+        _finish(s)
+
+
+def record(name: str, wall: float, cpu: float = 0.0, nbytes: int = 0, tokens: int = 0,
+           error: Optional[str] = None, **attrs) -> None:
+    """Record a stage measured elsewhere (e.g. by HTTP middleware)."""
+    parent = _current.get()
+    _finish(Span(name, attrs, nbytes, tokens, wall, cpu, time.time() - wall, error,
+                 parent=parent.id if parent else None))
+
+
+def cache_event(cache: str, hit: bool, n: int = 1) -> None:
+    REGISTRY.cache_event(cache, hit, n)
+    captured = _captured.get()
+    if captured is not None:
+        captured.append({"type": "cache", "cache": cache, "hit": hit, "n": n})
+
+
+# --- process pools ---
+
+def traced_call(fn: Callable, *args, **kwargs) -> Tuple[Any, List[dict]]:
+    """
+    Run fn in a worker and return (result, records of the spans it produced).
+    Top-level so it can be submitted to a process pool; pair with unwrap().
+    """
+    records: List[dict] = []
+    token = _captured.set(records)
+    try:
+        return fn(*args, **kwargs), records
+    finally:
+        _captured.reset(token)
+
+
+def merge(records: List[dict]) -> None:
+    """Fold spans and cache events recorded in another process into this one."""
+    captured = _captured.get()
+    for r in records:
+        if r.get("type") == "cache":
+            REGISTRY.cache_event(r["cache"], r["hit"], r.get("n", 1))
+        else:
+            REGISTRY.observe(r["name"], r["wall"], r["cpu"], r["bytes"], r["tokens"], r["error"] is not None)
+    if captured is not None:
+        captured.extend(records)
+
+
+def unwrap(result: Tuple[Any, List[dict]]) -> Any:
+    """The value from traced_call(), after merging its records here."""
+    value, records = result
+    merge(records)
+    return value
+
+
+def render_prometheus(prefix: str = "mesa") -> str:
+    return REGISTRY.render(prefix)
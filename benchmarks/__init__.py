@@ -0,0 +1,6 @@
+"""
+Offline benchmark suite: synthetic corpora (synthetic.py), local stand-ins for
+OpenAI, Google Vision and S3 (fakes.py), and the runner (run.py).
+
+    python -m benchmarks --scale small --out bench.json
+"""
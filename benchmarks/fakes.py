@@ -0,0 +1,251 @@
+# benchmarks/fakes.py
+"""
+Local stand-ins for the external services, each with configurable latency:
+
+- FakeOpenAI: a threaded HTTP server speaking enough of /v1/chat/completions for
+  the openai client (point OPENAI_BASE_URL at .base_url), streamed replies included.
+- FakeVision: replaces the google.cloud.vision module used by OCR.py; returns the
+  text drawn on synthetic JPEGs and enforces the real 16-images-per-batch limit.
+
+Both can play an overloaded service for api_scheduler: `capacity` answers 429
+to requests beyond that many in flight, `error_rate` fails that share with 503.
+- fake_s3(): moto's in-process S3 with a per-API-call delay on a boto3 client.
+"""
+from __future__ import annotations
+import hashlib, json, random, threading, time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Optional
+
+try:
+    from moto import mock_aws
+except Exception:
+    mock_aws = None
+
+
+# --- OpenAI ---
+
+class FakeOpenAI:
+    """
+    Answers every chat completion after `latency` seconds with a reply in the
+    "summary ----------- questions ----------- answers" shape summarize.py parses.
+    Usage counts are approximated as 4 characters per token. Rejected requests
+    (429/503) are counted in throttled/errors, not in requests. Streamed
+    requests get the reply as server-sent events spread over `latency`.
+    """
+
+    def __init__(self, latency: float = 0.0, host: str = "127.0.0.1", capacity: int = 0,
+                 error_rate: float = 0.0, retry_after: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.requests = 0
+        self.prompt_chars = 0
+        self.throttled = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("content-length") or 0)) or b"{}")
+                status, reply = fake._admit()
+                if status == 200:
+                    try:
+                        if body.get("stream"):
+                            return self._stream(body)
+                        reply = fake._reply(body)
+                    finally:
+                        with fake._lock:
+                            fake.in_flight -= 1
+                data = json.dumps(reply).encode()
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(data)))
+                if status == 429 and fake.retry_after:
+                    self.send_header("retry-after-ms", str(int(fake.retry_after * 1000)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, body):
+                self.send_response(200)
+                self.send_header("content-type", "text/event-stream")
+                self.send_header("connection", "close")
+                self.end_headers()
+                for chunk in fake._chunks(body):
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://{host}:{self.server.server_address[1]}/v1"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def _admit(self):
+        """(200, None) when the request may be served (and counts it in flight), else an error reply."""
+        with self._lock:
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.errors += 1
+                return 503, {"error": {"message": "The server is overloaded", "type": "server_error"}}
+            if self.capacity and self.in_flight >= self.capacity:
+                self.throttled += 1
+                return 429, {"error": {"message": "Rate limit reached", "type": "requests",
+                                       "code": "rate_limit_exceeded"}}
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            return 200, None
+
+    def _content(self, body: dict):
+        prompt = "".join(m.get("content") or "" for m in body.get("messages", []))
+        with self._lock:
+            self.requests += 1
+            self.prompt_chars += len(prompt)
+            n = self.requests
+        content = (
+            f"Summary {n}: {prompt[-400:]}\n-----------\n1. What was covered?\n"
+            f"-----------\n1. The material above."
+        )
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                 "total_tokens": (len(prompt) + len(content)) // 4}
+        return n, content, usage
+
+    def _chunks(self, body: dict) -> Iterator[dict]:
+        """chat.completion.chunk objects for a streamed reply, `latency` seconds end to end."""
+        n, content, usage = self._content(body)
+        base = {"id": f"chatcmpl-{n}", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": body.get("model", "gpt-4o-mini")}
+        pieces = [content[i:i + 16] for i in range(0, len(content), 16)]
+        for piece in pieces:
+            time.sleep(self.latency / len(pieces))
+            yield {**base, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+        yield {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield {**base, "choices": [], "usage": usage}
+
+    def _reply(self, body: dict) -> dict:
+        n, content, usage = self._content(body)
+        time.sleep(self.latency)
+        return {
+            "id": f"chatcmpl-{n}", "object": "chat.completion", "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": usage,
+        }
+
+    def __enter__(self) -> "FakeOpenAI":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# --- Google Vision ---
+
+class FakeVision:
+    """
+    Drop-in for `google.cloud.vision` as OCR.py uses it. `truth` maps the SHA-256
+    of image bytes to the text to return (see synthetic.Corpus.ocr_truth); other
+    images come back empty. Install with install(OCR) before OCR picks a backend.
+    """
+    MAX_BATCH = 16
+
+    class Feature:
+        class Type:
+            DOCUMENT_TEXT_DETECTION = 11
+
+        def __init__(self, type_=None):
+            self.type_ = type_
+
+    class Image:
+        def __init__(self, content: bytes = b""):
+            self.content = content
+
+    class AnnotateImageRequest:
+        def __init__(self, image=None, features=None):
+            self.image = image
+            self.features = features or []
+
+    class ResourceExhausted(Exception):
+        """Stands in for google.api_core.exceptions.ResourceExhausted."""
+        code = 429
+
+    def __init__(self, truth: Optional[Dict[str, str]] = None, latency: float = 0.0, capacity: int = 0):
+        self.truth = truth or {}
+        self.latency = latency
+        self.capacity = capacity
+        self.calls = 0
+        self.images = 0
+        self.throttled = 0
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def ImageAnnotatorClient(self):
+        return self
+
+    def batch_annotate_images(self, requests: List["FakeVision.AnnotateImageRequest"]):
+        if len(requests) > self.MAX_BATCH:
+            raise ValueError(f"at most {self.MAX_BATCH} images per batch, got {len(requests)}")
+        with self._lock:
+            if self.capacity and self.in_flight >= self.capacity:
+                self.throttled += 1
+                raise self.ResourceExhausted("Quota exceeded for images per minute")
+            self.in_flight += 1
+            self.calls += 1
+            self.images += len(requests)
+        try:
+            time.sleep(self.latency)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        return SimpleNamespace(responses=[
+            SimpleNamespace(
+                error=SimpleNamespace(message=""),
+                full_text_annotation=SimpleNamespace(
+                    text=self.truth.get(hashlib.sha256(r.image.content).hexdigest(), "")
+                ),
+            )
+            for r in requests
+        ])
+
+    def install(self, ocr_module) -> None:
+        """Point OCR.py at this fake and drop any client it already built."""
+        ocr_module.vision = self
+        ocr_module._client = None
+
+
+# --- S3 ---
+
+def add_latency(client, latency: float) -> None:
+    """Sleep before every API call made through this boto3 client (each multipart part counts)."""
+    if latency > 0:
+        client.meta.events.register("before-call.s3", lambda **kwargs: time.sleep(latency))
+
+
+@contextmanager
+def fake_s3(bucket: str, region: str = "us-east-1") -> Iterator[None]:
+    """moto's in-process S3 with `bucket` created; requires the moto package."""
+    if mock_aws is None:
+        raise RuntimeError("moto is not installed (pip install moto)")
+    import boto3
+
+    with mock_aws():
+        s3 = boto3.client("s3", region_name=region)
+        if region == "us-east-1":
+            s3.create_bucket(Bucket=bucket)
+        else:
+            s3.create_bucket(Bucket=bucket, CreateBucketConfiguration={"LocationConstraint": region})
+        yield
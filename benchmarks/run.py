@@ -0,0 +1,378 @@
+# benchmarks/run.py
+"""
+Benchmark runner. Generates a synthetic corpus in a temp dir, points every cache,
+upload folder and service at local stand-ins, runs the selected benchmarks and
+writes one JSON report (stdout, or --out) for comparing runs.
+
+    python -m benchmarks --scale small --out bench.json
+    python -m benchmarks --only extract_text,simple_summary --baseline bench.json
+"""
+from __future__ import annotations
+import argparse, asyncio, contextlib, io, json, os, platform, shutil, statistics
+import subprocess, sys, tempfile, time, traceback
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from benchmarks import fakes, synthetic
+
+ROOT = Path(__file__).resolve().parent.parent
+BUCKET = "bench-bucket"
+REGION = "us-east-1"
+
+
+@dataclass
+class Context:
+    corpus: synthetic.Corpus
+    work: Path
+    repeat: int
+    openai: fakes.FakeOpenAI
+    vision: fakes.FakeVision
+    s3_latency: float
+
+
+BENCHMARKS: Dict[str, Callable[[Context], dict]] = {}
+
+
+def benchmark(name: str):
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+class Skip(Exception):
+    """Raised by a benchmark whose dependencies are missing."""
+
+
+# --- timing ---
+
+def _summary(values: List[float]) -> dict:
+    return {
+        "min": min(values), "median": statistics.median(values),
+        "mean": statistics.fmean(values), "max": max(values), "runs": values,
+    }
+
+
+def measure(fn: Callable[[int], object], repeat: int, setup: Optional[Callable[[int], object]] = None) -> dict:
+    """
+    Run fn(i) repeat times; wall and CPU seconds (this process only, worker
+    processes are not included) per run, summarised.
+    """
+    walls, cpus = [], []
+    for i in range(repeat):
+        if setup is not None:
+            setup(i)
+        c0, t0 = time.process_time(), time.perf_counter()
+        fn(i)
+        walls.append(time.perf_counter() - t0)
+        cpus.append(time.process_time() - c0)
+    return {"wall": _summary(walls), "cpu": _summary(cpus)}
+
+
+def _clear_extract_cache(_=None) -> None:
+    from extract_cache import get_cache
+
+    cache = get_cache()
+    if cache is not None:
+        cache.clear()
+
+
+# --- benchmarks ---
+
+@benchmark("extract_text")
+def bench_extract_text(ctx: Context) -> dict:
+    import ai_gen
+
+    pdfs = [str(p) for p in ctx.corpus.pdf]
+    pages = sum(ai_gen.pdf_page_count(p) for p in pdfs)
+
+    def run(_):
+        for p in pdfs:
+            ai_gen._extract_text(p)
+
+    cold = measure(run, ctx.repeat, setup=_clear_extract_cache)
+    warm = measure(run, ctx.repeat)
+    return {
+        "files": len(pdfs), "pages": pages, "bytes": ctx.corpus.size_bytes(ctx.corpus.pdf),
+        "cold": cold, "warm": warm,
+        "cold_pages_per_s": pages / cold["wall"]["median"],
+        "warm_pages_per_s": pages / warm["wall"]["median"],
+    }
+
+
+@benchmark("simple_summary")
+def bench_simple_summary(ctx: Context) -> dict:
+    import ai_gen, summarizer
+
+    text = "\n".join(p.read_text(encoding="utf-8") for p in ctx.corpus.txt)
+    for p in ctx.corpus.pdf:
+        text += "\n" + ai_gen._extract_text(str(p))
+    result = measure(lambda _: ai_gen._simple_summary(text), ctx.repeat)
+    prefilter = measure(lambda _: summarizer.key_sentences(text, len(text) // 3), ctx.repeat)
+    return {
+        "chars": len(text), "vectorized": summarizer.available,
+        "summary": result, "prefilter": prefilter,
+        "chars_per_s": len(text) / result["wall"]["median"],
+    }
+
+
+@benchmark("summarize_pipeline")
+def bench_summarize_pipeline(ctx: Context) -> dict:
+    import OCR
+
+    ctx.vision.install(OCR)
+    import summarize
+
+    files = [str(p) for p in ctx.corpus.documents]
+    stages: Dict[str, List[float]] = {"extract": [], "dedup": [], "llm": []}
+    requests_before, vision_before = ctx.openai.requests, (ctx.vision.calls, ctx.vision.images)
+
+    def run(_):
+        t0 = time.perf_counter()
+        doc = summarize.extract_all(files)
+        t1 = time.perf_counter()
+        doc = summarize.dedupe_doc(doc)
+        t2 = time.perf_counter()
+        asyncio.run(summarize.summarize_doc(doc))
+        t3 = time.perf_counter()
+        stages["extract"].append(t1 - t0)
+        stages["dedup"].append(t2 - t1)
+        stages["llm"].append(t3 - t2)
+
+    total = measure(run, ctx.repeat, setup=_clear_extract_cache)
+    return {
+        "files": len(files), "bytes": ctx.corpus.size_bytes(ctx.corpus.documents),
+        "total": total, "stages": {k: _summary(v) for k, v in stages.items()},
+        "llm_requests_per_run": (ctx.openai.requests - requests_before) / ctx.repeat,
+        "vision_calls_per_run": (ctx.vision.calls - vision_before[0]) / ctx.repeat,
+        "vision_images_per_run": (ctx.vision.images - vision_before[1]) / ctx.repeat,
+        "openai_latency_s": ctx.openai.latency, "vision_latency_s": ctx.vision.latency,
+    }
+
+
+@benchmark("backend_roundtrip")
+def bench_backend_roundtrip(ctx: Context) -> dict:
+    try:
+        from fastapi.testclient import TestClient
+    except Exception as e:
+        raise Skip(f"fastapi test client unavailable: {e}")
+    import app as backend
+
+    docs = ctx.corpus.txt + ctx.corpus.pdf
+    payloads = [(p.name, p.read_bytes()) for p in docs]
+
+    def wait_ready(client, job_ids, timeout=600.0):
+        deadline = time.monotonic() + timeout
+        pending = set(job_ids)
+        while pending:
+            for j in list(pending):
+                if client.get(f"/content/{j}").json().get("status") in {"ready", "error"}:
+                    pending.discard(j)
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{len(pending)} jobs still pending")
+            time.sleep(0.005)
+
+    upload_s: List[float] = []
+    job_s: List[float] = []
+    with TestClient(backend.app) as client:
+        def upload(name, data):
+            t0 = time.perf_counter()
+            job_id = client.post("/upload", files={"file": (name, data)}).json()["jobId"]
+            upload_s.append(time.perf_counter() - t0)
+            return job_id
+
+        def sequential(_):
+            for name, data in payloads:
+                t0 = time.perf_counter()
+                job_id = upload(name, data)
+                client.post("/generate", json={"jobId": job_id})
+                wait_ready(client, [job_id])
+                job_s.append(time.perf_counter() - t0)
+
+        def batch(_):
+            ids = [upload(name, data) for name, data in payloads]
+            client.post("/generate-batch", json={"jobIds": ids})
+            wait_ready(client, ids)
+
+        seq = measure(sequential, ctx.repeat, setup=_clear_extract_cache)
+        bat = measure(batch, ctx.repeat, setup=_clear_extract_cache)
+    return {
+        "documents": len(payloads), "bytes": sum(len(d) for _, d in payloads),
+        "sequential": seq, "batch": bat,
+        "upload_latency": _summary(upload_s), "job_latency": _summary(job_s),
+    }
+
+
+@benchmark("cloud_transfer")
+def bench_cloud_transfer(ctx: Context) -> dict:
+    if fakes.mock_aws is None:
+        raise Skip("moto is not installed")
+    src = ctx.corpus.root
+    files = [p for p in src.rglob("*") if p.is_file()]
+    size = sum(p.stat().st_size for p in files)
+    out: dict = {"files": len(files), "bytes": size, "s3_latency_s": ctx.s3_latency}
+    with fakes.fake_s3(BUCKET, REGION):
+        import cloud_init, FileInput, FileOutput
+
+        fakes.add_latency(cloud_init.get_s3(), ctx.s3_latency)
+        prefix = lambda i: f"bench/run{i}/"
+        mirror_dir = lambda i: ctx.work / "mirror" / f"run{i}"
+        out["upload_cold"] = measure(lambda i: FileInput.sync_folder(src, prefix(i)), ctx.repeat)
+        out["upload_unchanged"] = measure(lambda i: FileInput.sync_folder(src, prefix(i)), ctx.repeat)
+        out["mirror_cold"] = measure(lambda i: FileOutput.mirror(prefix(i), mirror_dir(i)), ctx.repeat)
+        out["mirror_unchanged"] = measure(lambda i: FileOutput.mirror(prefix(i), mirror_dir(i)), ctx.repeat)
+    out["upload_mb_per_s"] = size / 1e6 / out["upload_cold"]["wall"]["median"]
+    out["mirror_mb_per_s"] = size / 1e6 / out["mirror_cold"]["wall"]["median"]
+    return out
+
+
+@benchmark("api_scheduler")
+def bench_api_scheduler(ctx: Context) -> dict:
+    """Bursts of chat completions through api_scheduler against an endpoint that throttles."""
+    import api_scheduler
+    from openai import AsyncOpenAI
+
+    calls, capacity = 32, 4
+    with fakes.FakeOpenAI(ctx.openai.latency, capacity=capacity, error_rate=0.02, retry_after=0.05) as fake:
+        sched = api_scheduler.Scheduler("bench", concurrency=16)
+
+        async def burst():
+            client = AsyncOpenAI(base_url=fake.base_url, api_key="bench", max_retries=0)
+            try:
+                await asyncio.gather(*(
+                    sched.run(client.chat.completions.create, model="gpt-4o-mini",
+                              messages=[{"role": "user", "content": f"part {i}"}])
+                    for i in range(calls)
+                ))
+            finally:
+                await client.close()
+
+        result = measure(lambda _: asyncio.run(burst()), ctx.repeat)
+        return {
+            "calls_per_run": calls, "endpoint_capacity": capacity, "total": result,
+            "served": fake.requests, "rejected_429": fake.throttled, "rejected_503": fake.errors,
+            "peak_in_flight": fake.peak, "scheduler": sched.stats(),
+            "calls_per_s": calls / result["wall"]["median"],
+        }
+
+
+# --- report ---
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _medians(report: dict, path: str = "") -> Dict[str, float]:
+    """Flatten every wall-clock median in a report to dotted paths."""
+    out: Dict[str, float] = {}
+    for k, v in report.items():
+        if not isinstance(v, dict):
+            continue
+        here = f"{path}.{k}" if path else k
+        if k == "wall" and "median" in v:
+            out[path] = v["median"]
+        else:
+            out.update(_medians(v, here))
+    return out
+
+
+def compare(baseline: dict, current: dict) -> List[str]:
+    old, new = _medians(baseline.get("benchmarks", {})), _medians(current.get("benchmarks", {}))
+    lines = []
+    for key in sorted(set(old) & set(new)):
+        change = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+        lines.append(f"{key:<45} {old[key]:9.4f}s -> {new[key]:9.4f}s  {change:+7.1f}%")
+    return lines
+
+
+def _configure_env(work: Path, openai: fakes.FakeOpenAI) -> None:
+    """Isolate caches and data in work/ and send every client to the stand-ins."""
+    os.environ.update({
+        "EXTRACT_CACHE_DIR": str(work / "cache"),
+        "LLM_CACHE": "off",
+        "LLM_CACHE_DIR": str(work / "cache"),
+        "UPLOAD_DIR": str(work / "backend" / "uploads"),
+        "DATA_DIR": str(work / "backend" / "data"),
+        "CLOUD_CACHE_DIR": str(work / "cloud-cache"),
+        "S3_BUCKET": BUCKET,
+        "S3_ENDPOINT_URL": "",
+        "AWS_REGION": REGION,
+        "AWS_ACCESS_KEY_ID": "testing",
+        "AWS_SECRET_ACCESS_KEY": "testing",
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": openai.base_url,
+        "OCR_BACKEND": "vision",
+        "GOOGLE_APPLICATION_CREDENTIALS": str(work / "fake-credentials.json"),
+    })
+    for sub in ("backend", "cloud", ""):
+        path = str(ROOT / sub) if sub else str(ROOT)
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the benchmark suite against local stand-ins")
+    parser.add_argument("--scale", choices=sorted(synthetic.SCALES), default="small")
+    parser.add_argument("--only", help=f"comma-separated subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--openai-latency-ms", type=float, default=200)
+    parser.add_argument("--vision-latency-ms", type=float, default=150)
+    parser.add_argument("--s3-latency-ms", type=float, default=5)
+    parser.add_argument("--out", type=Path, help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", type=Path, help="earlier report to compare medians against")
+    parser.add_argument("--keep", action="store_true", help="keep the temp work dir")
+    args = parser.parse_args(argv)
+
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    work = Path(tempfile.mkdtemp(prefix="mesa-bench-"))
+    report: dict = {
+        "meta": {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "git": _git_revision(),
+            "python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "scale": args.scale, "repeat": args.repeat, "seed": args.seed,
+        },
+        "benchmarks": {},
+    }
+    try:
+        with fakes.FakeOpenAI(args.openai_latency_ms / 1000) as openai:
+            _configure_env(work, openai)
+            corpus = synthetic.generate(work / "corpus", args.scale, args.seed)
+            vision = fakes.FakeVision(corpus.ocr_truth, args.vision_latency_ms / 1000)
+            ctx = Context(corpus, work, args.repeat, openai, vision, args.s3_latency_ms / 1000)
+            for name in names:
+                print(f"▶ {name}", file=sys.stderr)
+                try:
+                    # the code under test prints progress; keep stdout for the report
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        report["benchmarks"][name] = BENCHMARKS[name](ctx)
+                except Skip as e:
+                    report["benchmarks"][name] = {"skipped": str(e)}
+                except Exception as e:
+                    traceback.print_exc(file=sys.stderr)
+                    report["benchmarks"][name] = {"error": f"{type(e).__name__}: {e}"}
+    finally:
+        if not args.keep:
+            shutil.rmtree(work, ignore_errors=True)
+        else:
+            print(f"work dir kept at {work}", file=sys.stderr)
+
+    text = json.dumps(report, indent=1)
+    if args.out:
+        args.out.write_text(text, encoding="utf-8")
+        print(f"✅ report written to {args.out}", file=sys.stderr)
+    else:
+        print(text)
+    if args.baseline:
+        for line in compare(json.loads(args.baseline.read_text(encoding="utf-8")), report):
+            print(line, file=sys.stderr)
+    return 1 if any("error" in r for r in report["benchmarks"].values()) else 0
@@ -0,0 +1,282 @@
+# benchmarks/synthetic.py
+"""
+Synthetic corpora for the benchmarks: lecture-style .txt notes, multi-page PDFs
+with a real text layer and embedded JPEG figures, and handwritten-style JPEG
+scans. Everything is generated from a seed with the standard library and Pillow
+(PDFs are written by hand), so runs are reproducible on an offline box.
+
+    python -m benchmarks.synthetic out/ --scale medium
+"""
+from __future__ import annotations
+import hashlib, io, json, random, zlib
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+_TERMS = [
+    "binary search", "hash table", "linked list", "merge sort", "quick sort", "heap", "stack", "queue",
+    "graph", "spanning tree", "dynamic programming", "recursion", "big-o notation", "gradient descent",
+    "learning rate", "overfitting", "regularization", "neural network", "backpropagation", "decision tree",
+    "k-nearest neighbors", "cross validation", "bias", "variance", "loss function", "activation function",
+    "mitochondria", "photosynthesis", "cell membrane", "enzyme", "osmosis", "natural selection",
+]
+_KINDS = ["data structure", "algorithm", "technique", "method", "model", "concept", "process", "structure"]
+_VERBS = ["stores", "organizes", "reduces", "computes", "estimates", "controls", "compares", "transforms"]
+_OBJECTS = ["elements", "the search space", "the error", "intermediate results", "the parameters",
+            "memory usage", "the training data", "energy", "neighbouring values", "the running time"]
+_TEMPLATES = [
+    "{T} is a {K} that {V} {O}.",
+    "In practice, {t} {V} {O} in {n} steps on average.",
+    "A common mistake is to confuse {t} with {u}.",
+    "Unlike {u}, {t} {V} {O} without extra memory.",
+    "The lecture showed that {t} {V} {O} when the input is sorted.",
+    "Students should remember that {t} depends on {u}.",
+    "Exam tip: explain why {t} {V} {O}.",
+]
+
+
+def sentence(rng: random.Random) -> str:
+    t, u = rng.sample(_TERMS, 2)
+    return rng.choice(_TEMPLATES).format(
+        T=t.capitalize(), t=t, u=u, K=rng.choice(_KINDS), V=rng.choice(_VERBS),
+        O=rng.choice(_OBJECTS), n=rng.randint(2, 64),
+    )
+
+
+def paragraphs(rng: random.Random, n: int, sentences: int = 6) -> List[str]:
+    return [" ".join(sentence(rng) for _ in range(sentences)) for _ in range(n)]
+
+
+# --- PDF ---
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _wrap(text: str, width: int = 90) -> List[str]:
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + 1 + len(word) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}".strip()
+    if line:
+        lines.append(line)
+    return lines
+
+
+def figure_jpeg(rng: random.Random, width: int = 480, height: int = 320) -> bytes:
+    """A chart-like figure: axes, bars and a caption."""
+    img = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(img)
+    draw.line([(40, height - 40), (width - 20, height - 40)], fill="black", width=2)
+    draw.line([(40, 20), (40, height - 40)], fill="black", width=2)
+    bars = rng.randint(4, 9)
+    step = (width - 80) // bars
+    for i in range(bars):
+        h = rng.randint(20, height - 80)
+        x = 50 + i * step
+        draw.rectangle([x, height - 40 - h, x + step - 10, height - 41], fill=rng.choice(["#4a7", "#47a", "#a74"]))
+    draw.text((50, height - 30), f"Figure: {rng.choice(_TERMS)}", fill="black")
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=85)
+    return out.getvalue()
+
+
+def write_pdf(path: Path, pages: List[List[str]], images: Dict[int, bytes]) -> None:
+    """
+    Minimal PDF 1.4: Helvetica text lines per page, plus one DCT (JPEG) image
+    XObject on the pages listed in images. Enough for pdfplumber and viewers.
+    """
+    objects: List[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(b"")                       # filled in once the page tree exists
+    page_tree = add(b"")
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    kids = []
+    for i, lines in enumerate(pages):
+        ops = ["BT", "/F1 10 Tf", "13 TL", "56 760 Td"]
+        ops += [f"({_pdf_escape(line)}) Tj T*" for line in lines]
+        ops.append("ET")
+        resources = f"/Font << /F1 {font} 0 R >>"
+        if i in images:
+            data = images[i]
+            with Image.open(io.BytesIO(data)) as im:
+                w, h = im.size
+            img = add(
+                f"<< /Type /XObject /Subtype /Image /Width {w} /Height {h} /ColorSpace /DeviceRGB "
+                f"/BitsPerComponent 8 /Filter /DCTDecode /Length {len(data)} >>\nstream\n".encode()
+                + data + b"\nendstream"
+            )
+            ops.append(f"q 240 0 0 {240 * h // w} 56 60 cm /Im1 Do Q")
+            resources += f" /XObject << /Im1 {img} 0 R >>"
+        stream = "\n".join(ops).encode("latin-1", "replace")
+        content = add(f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+        kids.append(add(
+            f"<< /Type /Page /Parent {page_tree} 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << {resources} >> /Contents {content} 0 R >>".encode()
+        ))
+    objects[catalog - 1] = f"<< /Type /Catalog /Pages {page_tree} 0 R >>".encode()
+    objects[page_tree - 1] = (
+        f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] /Count {len(kids)} >>".encode()
+    )
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for n, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{n} 0 obj\n".encode() + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for off in offsets:
+        out.write(f"{off:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root {catalog} 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    path.write_bytes(out.getvalue())
+
+
+# --- handwriting ---
+
+def handwritten_jpeg(rng: random.Random, text: str, width: int = 1240, dpi: int = 150) -> bytes:
+    """
+    Ruled notebook page with jittered, slanted glyphs, a slight page skew and
+    scanner noise: cheap stand-in for a phone photo of handwritten notes.
+    """
+    size = max(12, width // 40)
+    font = ImageFont.load_default(size)
+    line_h = int(size * 1.8)
+    lines = _wrap(text, width // int(size * 0.55))
+    height = max(line_h * (len(lines) + 3), width * 11 // 8)
+    page = Image.new("L", (width, height), 245)
+    draw = ImageDraw.Draw(page)
+    for y in range(line_h * 2, height, line_h):
+        draw.line([(0, y), (width, y)], fill=200, width=1)
+    for row, line in enumerate(lines):
+        x = size * 2 + rng.randint(-4, 4)
+        base = line_h * (row + 2) - size - 2
+        for ch in line:
+            glyph = Image.new("L", (size * 2, size * 2), 0)
+            ImageDraw.Draw(glyph).text((size // 2, size // 3), ch, fill=255, font=font)
+            glyph = glyph.rotate(rng.uniform(-12, 12), resample=Image.BILINEAR)
+            ink = rng.randint(20, 70)
+            page.paste(ink, (x - size // 2, base + rng.randint(-2, 2)), glyph)
+            x += int(font.getlength(ch) * rng.uniform(0.95, 1.2)) if ch != " " else int(size * 0.5)
+    page = page.rotate(rng.uniform(-2.5, 2.5), resample=Image.BICUBIC, fillcolor=245, expand=True)
+    noise = Image.effect_noise(page.size, 12)
+    page = Image.blend(page, noise, 0.08).filter(ImageFilter.GaussianBlur(0.6))
+    out = io.BytesIO()
+    page.convert("RGB").save(out, format="JPEG", quality=80, dpi=(dpi, dpi))
+    return out.getvalue()
+
+
+# --- corpus ---
+
+@dataclass
+class Scale:
+    txt_files: int = 4
+    txt_paragraphs: int = 20
+    pdf_files: int = 2
+    pdf_pages: int = 10
+    pdf_image_every: int = 4        # one figure every N pages
+    jpeg_files: int = 3
+    jpeg_width: int = 1240
+    blob_files: int = 1             # opaque binaries for the S3 transfer benchmarks
+    blob_mb: int = 20
+
+
+SCALES = {
+    "small": Scale(),
+    "medium": Scale(txt_files=10, txt_paragraphs=40, pdf_files=4, pdf_pages=50, jpeg_files=8, blob_files=2, blob_mb=40),
+    "large": Scale(txt_files=20, txt_paragraphs=80, pdf_files=8, pdf_pages=200, jpeg_files=20, jpeg_width=2480,
+                   blob_files=4, blob_mb=100),
+}
+
+
+@dataclass
+class Corpus:
+    root: Path
+    txt: List[Path] = field(default_factory=list)
+    pdf: List[Path] = field(default_factory=list)
+    jpeg: List[Path] = field(default_factory=list)
+    blobs: List[Path] = field(default_factory=list)
+    ocr_truth: Dict[str, str] = field(default_factory=dict)   # sha256 of JPEG bytes -> text drawn on it
+
+    @property
+    def documents(self) -> List[Path]:
+        return self.txt + self.pdf + self.jpeg
+
+    def size_bytes(self, paths: List[Path]) -> int:
+        return sum(p.stat().st_size for p in paths)
+
+
+def generate(root: Path | str, scale: Scale | str = "small", seed: int = 0) -> Corpus:
+    """Write a corpus under root (docs/ and blobs/) and describe it."""
+    scale = SCALES[scale] if isinstance(scale, str) else scale
+    rng = random.Random(seed)
+    root = Path(root)
+    docs = root / "docs"
+    blobs = root / "blobs"
+    docs.mkdir(parents=True, exist_ok=True)
+    blobs.mkdir(parents=True, exist_ok=True)
+    corpus = Corpus(root)
+
+    for i in range(scale.txt_files):
+        p = docs / f"notes_{i:03d}.txt"
+        p.write_text("\n\n".join(paragraphs(rng, scale.txt_paragraphs)), encoding="utf-8")
+        corpus.txt.append(p)
+
+    for i in range(scale.pdf_files):
+        pages, images = [], {}
+        for n in range(scale.pdf_pages):
+            lines = [f"Lecture {i + 1}, page {n + 1}", ""]
+            for para in paragraphs(rng, 4, 4):
+                lines += _wrap(para) + [""]
+            pages.append(lines[:54])
+            if scale.pdf_image_every and n % scale.pdf_image_every == 0:
+                images[n] = figure_jpeg(rng)
+        p = docs / f"lecture_{i:03d}.pdf"
+        write_pdf(p, pages, images)
+        corpus.pdf.append(p)
+
+    for i in range(scale.jpeg_files):
+        text = " ".join(sentence(rng) for _ in range(8))
+        data = handwritten_jpeg(rng, text, scale.jpeg_width)
+        p = docs / f"handwritten_{i:03d}.jpg"
+        p.write_bytes(data)
+        corpus.jpeg.append(p)
+        corpus.ocr_truth[hashlib.sha256(data).hexdigest()] = text
+
+    for i in range(scale.blob_files):
+        p = blobs / f"blob_{i:03d}.bin"
+        with p.open("wb") as f:
+            block = rng.randbytes(1024 * 1024)
+            for n in range(scale.blob_mb):
+                # cheap but incompressible and distinct per MiB
+                f.write(zlib.crc32(bytes([i, n % 256])).to_bytes(4, "big") + block[4:])
+        corpus.blobs.append(p)
+
+    (root / "corpus.json").write_text(json.dumps({
+        "scale": asdict(scale), "seed": seed,
+        "txt": [p.name for p in corpus.txt], "pdf": [p.name for p in corpus.pdf],
+        "jpeg": [p.name for p in corpus.jpeg], "blobs": [p.name for p in corpus.blobs],
+    }, indent=1), encoding="utf-8")
+    return corpus
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic benchmark corpus")
+    parser.add_argument("dest", type=Path)
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    c = generate(args.dest, args.scale, args.seed)
+    print(f"✅ {len(c.txt)} txt, {len(c.pdf)} pdf, {len(c.jpeg)} jpeg, {len(c.blobs)} blobs in {args.dest}")
@@ -1,15 +1,21 @@
 # cloud/FileInput.py
 from __future__ import annotations
-import os, uuid
+import hashlib, json, os, threading, uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, Tuple, List
+from typing import Dict, Iterable, Tuple, List, Optional
 from botocore.exceptions import ClientError
 
 from cloud_init import (
     get_s3, S3_BUCKET, AWS_REGION, S3_PUBLIC_READ,
-    FILES_DIR, UPLOAD_PREFIX, guess_content_type, s3_path, s3_http_url, ensure_prefix
+    FILES_DIR, UPLOAD_PREFIX, guess_content_type, s3_path, s3_http_url, ensure_prefix,
+    CACHE_DIR, MULTIPART_CHUNK, TRANSFER_CONFIG, span, cache_event,
 )
 
+UPLOAD_WORKERS = int(os.environ.get("S3_UPLOAD_WORKERS", "8"))
+MANIFEST_PATH = CACHE_DIR / "s3_upload_manifest.json"
+
 def _build_key(filename: str, prefix: str, keep_name: bool = True, with_uuid: bool = False) -> str:
     prefix = ensure_prefix(prefix)
     name = Path(filename).name.replace(" ", "_")
@@ -21,17 +27,19 @@ def _build_key(filename: str, prefix: str, keep_name: bool = True, with_uuid: bo
     ext = Path(name).suffix
     return f"{prefix}{uuid.uuid4().hex}{ext}"
 
-def upload_path(path: Path | str, prefix: str = UPLOAD_PREFIX) -> tuple[str, str]:
+def upload_path(path: Path | str, prefix: str = UPLOAD_PREFIX, s3=None, name: Optional[str] = None) -> tuple[str, str]:
     """
-    Upload a single local file to S3, keeping the original filename.
+    Upload a single local file to S3, keeping the original filename (or name,
+    a path under the prefix such as "week1/notes.pdf").
     If the same file name exists in S3, it will be overwritten.
+    Large files go up as parallel multipart uploads (see TRANSFER_CONFIG).
     """
     p = Path(path)
     if not p.is_file():
         raise FileNotFoundError(f"Not a file: {p}")
 
     # just keep the original filename
-    name = p.name.replace(" ", "_")
+    name = (name or p.name).replace(" ", "_")
     key = ensure_prefix(prefix) + name
 
     extra = {"ContentType": guess_content_type(name)}
@@ -39,26 +47,131 @@ def upload_path(path: Path | str, prefix: str = UPLOAD_PREFIX) -> tuple[str, str
     if os.environ.get("S3_PUBLIC_READ", "false").lower() == "true":
         extra["ACL"] = "public-read"
 
-    s3 = get_s3()
-    with p.open("rb") as f:
-        s3.upload_fileobj(f, S3_BUCKET, key, ExtraArgs=extra)
+    s3 = s3 or get_s3()
+    with span("s3.upload", key=key) as sp, p.open("rb") as f:
+        sp.bytes = p.stat().st_size
+        s3.upload_fileobj(f, S3_BUCKET, key, ExtraArgs=extra, Config=TRANSFER_CONFIG)
 
     return key, s3_http_url(key)
 
 
-def upload_folder(folder: Path | str = FILES_DIR, prefix: str = UPLOAD_PREFIX) -> List[Tuple[str, str]]:
+# --- Bulk sync ---
+
+@dataclass
+class UploadResult:
+    path: str
+    key: str
+    status: str               # "uploaded" | "skipped" | "failed"
+    bytes: int = 0
+    url: str = ""
+    error: Optional[str] = None
+
+
+def local_etag(path: Path, chunk: int = MULTIPART_CHUNK) -> str:
     """
-    Recursively upload all files in a folder. Returns list of (key, url).
+    The ETag S3 will report for this file when uploaded with TRANSFER_CONFIG:
+    plain MD5 below the multipart threshold, otherwise MD5 of the part MD5s + "-N".
+    """
+    if path.stat().st_size < chunk:
+        return hashlib.md5(path.read_bytes()).hexdigest()
+    parts = []
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            parts.append(hashlib.md5(block).digest())
+    return f"{hashlib.md5(b''.join(parts)).hexdigest()}-{len(parts)}"
+
+
+def _load_manifest() -> Dict[str, dict]:
+    try:
+        return json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(manifest: Dict[str, dict]) -> None:
+    MANIFEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = MANIFEST_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, indent=1), encoding="utf-8")
+    os.replace(tmp, MANIFEST_PATH)
+
+
+def _remote_objects(s3, prefix: str) -> Dict[str, Tuple[int, str]]:
+    """key -> (size, ETag) for everything under prefix, from one paginated listing."""
+    out: Dict[str, Tuple[int, str]] = {}
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=S3_BUCKET, Prefix=ensure_prefix(prefix)):
+        for obj in page.get("Contents", []):
+            out[obj["Key"]] = (obj["Size"], obj["ETag"].strip('"'))
+    return out
+
+
+def sync_folder(
+    folder: Path | str = FILES_DIR,
+    prefix: str = UPLOAD_PREFIX,
+    workers: int = UPLOAD_WORKERS,
+    skip_unchanged: bool = True,
+) -> List[UploadResult]:
+    """
+    Upload every file under folder with a thread pool sharing one client.
+    Keys keep the path relative to folder, so files with the same name in
+    different subfolders do not overwrite each other.
+    Files whose size and ETag already match the object under the same key are
+    skipped; local ETags are remembered in a manifest keyed by size+mtime so
+    unchanged files are not even re-hashed. Returns one result per file.
     """
     folder = Path(folder)
     if not folder.exists():
         raise FileNotFoundError(f"Folder not found: {folder}")
-    results: List[Tuple[str, str]] = []
-    for path in folder.rglob("*"):
-        if path.is_file():
-            results.append(upload_path(path, prefix=prefix))
+    s3 = get_s3()
+    paths = sorted(p for p in folder.rglob("*") if p.is_file())
+    remote = _remote_objects(s3, prefix) if skip_unchanged else {}
+    manifest = _load_manifest()
+    lock = threading.Lock()
+
+    def etag_of(p: Path) -> str:
+        st = p.stat()
+        entry = manifest.get(str(p.resolve()))
+        if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            return entry["etag"]
+        etag = local_etag(p)
+        with lock:
+            manifest[str(p.resolve())] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "etag": etag}
+        return etag
+
+    def one(p: Path) -> UploadResult:
+        name = p.relative_to(folder).as_posix()
+        key = ensure_prefix(prefix) + name.replace(" ", "_")
+        size = p.stat().st_size
+        try:
+            if skip_unchanged and key in remote:
+                remote_size, remote_etag = remote[key]
+                unchanged = remote_size == size and remote_etag == etag_of(p)
+                cache_event("s3_sync", unchanged)
+                if unchanged:
+                    return UploadResult(str(p), key, "skipped", 0, s3_http_url(key))
+            key, url = upload_path(p, prefix=prefix, s3=s3, name=name)
+            return UploadResult(str(p), key, "uploaded", size, url)
+        except Exception as e:  # report per file, keep syncing the rest
+            return UploadResult(str(p), key, "failed", 0, error=str(e))
+
+    with span("s3.sync_folder", files=len(paths)) as sp, ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(one, paths))
+        sp.bytes = sum(r.bytes for r in results)
+    if skip_unchanged:
+        _save_manifest(manifest)
     return results
 
+
+def upload_folder(folder: Path | str = FILES_DIR, prefix: str = UPLOAD_PREFIX) -> List[Tuple[str, str]]:
+    """
+    Recursively upload all files in a folder. Returns list of (key, url).
+    Unchanged files are skipped; see sync_folder for the per-file report.
+    """
+    results = sync_folder(folder, prefix=prefix)
+    failed = [r for r in results if r.status == "failed"]
+    if failed:
+        raise RuntimeError(f"{len(failed)} upload(s) failed, first: {failed[0].path}: {failed[0].error}")
+    return [(r.key, r.url) for r in results]
+
 # --- CLI usage ---
 if __name__ == "__main__":
     import argparse
@@ -71,10 +184,13 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     if args.all:
-        res = upload_folder(FILES_DIR, prefix=args.prefix)
-        for key, url in res:
-            print(f"✅ {s3_path(key)}")
-            print(f"   URL: {url}")
+        res = sync_folder(FILES_DIR, prefix=args.prefix)
+        icons = {"uploaded": "✅", "skipped": "⏭️", "failed": "❌"}
+        for r in res:
+            print(f"{icons[r.status]} {r.status:<8} {s3_path(r.key)}" + (f"  ({r.error})" if r.error else ""))
+        sent = sum(r.bytes for r in res)
+        counts = {s: sum(r.status == s for r in res) for s in icons}
+        print(f"   {counts['uploaded']} uploaded ({sent / 1e6:.1f} MB), {counts['skipped']} unchanged, {counts['failed']} failed")
     else:
         local = Path(args.file) if args.file else (FILES_DIR / args.name)
         key, url = upload_path(local, prefix=args.prefix)
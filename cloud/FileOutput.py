@@ -1,34 +1,113 @@
 # cloud/FileOutput.py
 from __future__ import annotations
-import os
+import hashlib, json, os, threading, time, uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
 from pathlib import Path
-from typing import List, Iterable, Optional, Tuple
+from typing import Dict, List, Iterable, Optional, Tuple
 from botocore.exceptions import ClientError
 
 from cloud_init import (
-    get_s3, S3_BUCKET, AWS_REGION, OUTPUT_DIR, UPLOAD_PREFIX, ensure_prefix
+    get_s3, S3_BUCKET, AWS_REGION, OUTPUT_DIR, UPLOAD_PREFIX, ensure_prefix,
+    CACHE_DIR, TRANSFER_CONFIG, span, cache_event,
 )
 
-def _list_keys(prefix: str = UPLOAD_PREFIX) -> List[Tuple[str, "datetime"]]:
-    s3 = get_s3()
+DOWNLOAD_WORKERS = int(os.environ.get("S3_DOWNLOAD_WORKERS", "8"))
+INDEX_TTL = float(os.environ.get("S3_INDEX_TTL", "300"))  # seconds before a full re-list
+
+# --- Listing index ---
+
+@dataclass
+class ObjectInfo:
+    key: str
+    last_modified: datetime
+    etag: str
+    size: int
+
+
+class PrefixIndex:
+    """
+    All objects under one prefix plus a name -> newest object map, built from one
+    paginated listing. Within the TTL, lookups that miss first list only keys
+    after the last one seen (StartAfter), which picks up newly added names that
+    sort last cheaply; if a name is still missing (a new key that sorts earlier),
+    the prefix is listed again in full before it is reported absent. Objects
+    overwritten in place are picked up by the full rebuild once the TTL expires.
+    """
+
+    def __init__(self, prefix: str, ttl: float = INDEX_TTL):
+        self.prefix = ensure_prefix(prefix)
+        self.ttl = ttl
+        self.objects: Dict[str, ObjectInfo] = {}
+        self.by_name: Dict[str, ObjectInfo] = {}
+        self.last_key: Optional[str] = None
+        self.built_at = 0.0
+        self._lock = threading.Lock()
+
+    def _scan(self, start_after: Optional[str] = None) -> None:
+        kwargs = {"Bucket": S3_BUCKET, "Prefix": self.prefix}
+        if start_after:
+            kwargs["StartAfter"] = start_after
+        for page in get_s3().get_paginator("list_objects_v2").paginate(**kwargs):
+            for obj in page.get("Contents", []):
+                key = obj["Key"]
+                self.last_key = max(self.last_key or key, key)
+                if key.endswith("/"):  # skip pseudo-dirs
+                    continue
+                info = ObjectInfo(key, obj["LastModified"], obj["ETag"].strip('"'), obj["Size"])
+                self.objects[key] = info
+                name = key.rsplit("/", 1)[-1]
+                current = self.by_name.get(name)
+                if current is None or info.last_modified >= current.last_modified:
+                    self.by_name[name] = info
+
+    def refresh(self, full: bool = False) -> None:
+        with self._lock, span("s3.list", prefix=self.prefix, full=full):
+            if full or time.monotonic() - self.built_at > self.ttl:
+                self.objects, self.by_name, self.last_key = {}, {}, None
+                self._scan()
+                self.built_at = time.monotonic()
+            else:
+                self._scan(start_after=self.last_key)
+
+    def _fresh(self) -> None:
+        if time.monotonic() - self.built_at > self.ttl:
+            self.refresh(full=True)
+
+    def lookup_many(self, names: Iterable[str]) -> Dict[str, Optional[ObjectInfo]]:
+        """Newest object for each file name (None if absent), re-listing at most twice on a miss."""
+        self._fresh()
+        names = [Path(n).name for n in names]
+        if any(n not in self.by_name for n in names):
+            self.refresh()
+        if any(n not in self.by_name for n in names):
+            self.refresh(full=True)
+        return {n: self.by_name.get(n) for n in names}
+
+    def lookup(self, name: str) -> Optional[ObjectInfo]:
+        return self.lookup_many([name])[Path(name).name]
+
+    def all(self) -> List[ObjectInfo]:
+        self._fresh()
+        return list(self.objects.values())
+
+
+_indexes: Dict[str, PrefixIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(prefix: str = UPLOAD_PREFIX) -> PrefixIndex:
+    """Process-wide listing index for a prefix."""
     prefix = ensure_prefix(prefix)
-    keys: List[Tuple[str, "datetime"]] = []
-    token: Optional[str] = None
-
-    while True:
-        kwargs = {"Bucket": S3_BUCKET, "Prefix": prefix}
-        if token:
-            kwargs["ContinuationToken"] = token
-        resp = s3.list_objects_v2(**kwargs)
-        for obj in resp.get("Contents", []):
-            key = obj["Key"]
-            if not key.endswith("/"):  # skip pseudo-dirs
-                keys.append((key, obj["LastModified"]))
-        if resp.get("IsTruncated"):
-            token = resp.get("NextContinuationToken")
-        else:
-            break
-    return keys
+    with _indexes_lock:
+        if prefix not in _indexes:
+            _indexes[prefix] = PrefixIndex(prefix)
+        return _indexes[prefix]
+
+
+def _list_keys(prefix: str = UPLOAD_PREFIX) -> List[Tuple[str, datetime]]:
+    return [(o.key, o.last_modified) for o in get_index(prefix).all()]
 
 def _download_key(key: str, dest_dir: Path = OUTPUT_DIR) -> Path:
     s3 = get_s3()
@@ -45,17 +124,115 @@ def download_by_name(filename: str, prefix: str = UPLOAD_PREFIX) -> Path:
     Returns local path; raises if not found.
     """
     filename = Path(filename).name
-    matches = [(k, ts) for (k, ts) in _list_keys(prefix) if k.endswith("/" + filename) or k == filename]
-    if not matches:
+    info = get_index(prefix).lookup(filename)
+    if info is None:
         raise FileNotFoundError(f"No object named '{filename}' under prefix '{prefix}'")
-    key, _ = sorted(matches, key=lambda x: x[1], reverse=True)[0]
-    return _download_key(key)
+    return _download_key(info.key)
 
 def download_many_by_names(filenames: Iterable[str], prefix: str = UPLOAD_PREFIX) -> List[Path]:
-    return [download_by_name(name, prefix=prefix) for name in filenames]
+    """Resolve every name against one listing index, then download them."""
+    found = get_index(prefix).lookup_many(filenames)
+    missing = [n for n, info in found.items() if info is None]
+    if missing:
+        raise FileNotFoundError(f"No object named {missing} under prefix '{prefix}'")
+    return [_download_key(info.key) for info in found.values()]
 
 def download_all(prefix: str = UPLOAD_PREFIX) -> List[Path]:
-    return [_download_key(k) for (k, _) in _list_keys(prefix)]
+    """Mirror the prefix into OutputFiles/ and return the local paths (see mirror)."""
+    results = mirror(prefix)
+    failed = [r for r in results if r.status == "failed"]
+    if failed:
+        raise RuntimeError(f"{len(failed)} download(s) failed, first: {failed[0].key}: {failed[0].error}")
+    return [r.path for r in results]
+
+# --- Mirror / sync ---
+
+@dataclass
+class MirrorResult:
+    key: str
+    path: Path
+    status: str               # "downloaded" | "unchanged" | "failed"
+    bytes: int = 0
+    error: Optional[str] = None
+
+
+def _manifest_path(dest_dir: Path) -> Path:
+    tag = hashlib.sha1(str(dest_dir.resolve()).encode()).hexdigest()[:12]
+    return CACHE_DIR / "s3_mirror" / f"{tag}.json"
+
+
+def _local_path(key: str, prefix: str, dest_dir: Path) -> Path:
+    """Key path relative to the prefix, kept as subfolders so same-named objects never collide."""
+    rel = key[len(prefix):] if key.startswith(prefix) else key
+    dest = (dest_dir / rel).resolve()
+    if dest_dir.resolve() not in dest.parents:
+        raise ValueError(f"Refusing to write outside {dest_dir}: {key}")
+    return dest
+
+
+def _download_atomic(s3, key: str, dest: Path) -> None:
+    """Download to a temp file next to dest, then rename, so readers never see partial files."""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(f".{dest.name}.{uuid.uuid4().hex[:8]}.part")
+    try:
+        with span("s3.download", key=key) as sp:
+            s3.download_file(S3_BUCKET, key, str(tmp), Config=TRANSFER_CONFIG)
+            sp.bytes = tmp.stat().st_size
+        os.replace(tmp, dest)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def mirror(prefix: str = UPLOAD_PREFIX, dest_dir: Path = OUTPUT_DIR, workers: int = DOWNLOAD_WORKERS) -> List[MirrorResult]:
+    """
+    Incrementally sync everything under prefix into dest_dir. Objects whose size
+    and ETag match the last sync (and whose local copy is intact) are left alone;
+    the rest download in a bounded thread pool. Large objects are fetched as
+    parallel ranged GETs by TRANSFER_CONFIG.
+    """
+    prefix = ensure_prefix(prefix)
+    dest_dir = Path(dest_dir)
+    index = get_index(prefix)
+    index.refresh(full=True)  # a sync needs a complete, current listing
+    manifest_file = _manifest_path(dest_dir)
+    try:
+        manifest: Dict[str, dict] = json.loads(manifest_file.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        manifest = {}
+    s3 = get_s3()
+
+    def one(info: ObjectInfo) -> MirrorResult:
+        try:
+            dest = _local_path(info.key, prefix, dest_dir)
+        except ValueError as e:
+            return MirrorResult(info.key, dest_dir, "failed", error=str(e))
+        seen = manifest.get(info.key)
+        unchanged = bool(seen and seen["etag"] == info.etag and seen["size"] == info.size
+                         and dest.exists() and dest.stat().st_size == info.size)
+        cache_event("s3_mirror", unchanged)
+        if unchanged:
+            return MirrorResult(info.key, dest, "unchanged")
+        try:
+            _download_atomic(s3, info.key, dest)
+            return MirrorResult(info.key, dest, "downloaded", info.size)
+        except Exception as e:
+            return MirrorResult(info.key, dest, "failed", error=str(e))
+
+    objects = sorted(index.all(), key=lambda o: o.key)
+    with span("s3.mirror", objects=len(objects)) as sp, ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(one, objects))
+        sp.bytes = sum(r.bytes for r in results)
+
+    for info, r in zip(objects, results):
+        if r.status != "failed":
+            manifest[info.key] = {"etag": info.etag, "size": info.size}
+    live = {o.key for o in objects}
+    manifest = {k: v for k, v in manifest.items() if k in live}
+    manifest_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp = manifest_file.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, indent=1), encoding="utf-8")
+    os.replace(tmp, manifest_file)
+    return results
 
 # --- CLI usage ---
 if __name__ == "__main__":
@@ -68,13 +245,16 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     if args.all:
-        paths = download_all(prefix=args.prefix)
-        if not paths:
+        results = mirror(prefix=args.prefix)
+        if not results:
             print(f"ℹ️ No objects under '{args.prefix}'")
         else:
-            print("✅ Downloaded:")
-            for p in paths:
-                print(" -", p)
+            icons = {"downloaded": "✅", "unchanged": "⏭️", "failed": "❌"}
+            for r in results:
+                print(f"{icons[r.status]} {r.status:<10} {r.path}" + (f"  ({r.error})" if r.error else ""))
+            moved = sum(r.bytes for r in results)
+            counts = {s: sum(r.status == s for r in results) for s in icons}
+            print(f"   {counts['downloaded']} downloaded ({moved / 1e6:.1f} MB), {counts['unchanged']} unchanged, {counts['failed']} failed")
     else:
         p = download_by_name(args.name, prefix=args.prefix)
         print("✅ Downloaded:", p)
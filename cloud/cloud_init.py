@@ -1,10 +1,14 @@
 # cloud/cloud_init.py
 from __future__ import annotations
-import os, mimetypes
+import os, mimetypes, sys, threading, time
 from pathlib import Path
-from typing import Optional
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Dict, Optional, Tuple
 from dotenv import load_dotenv
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 
 # --- Load env (.env can be in cloud/ OR project root) ---
 HERE = Path(__file__).resolve().parent
@@ -16,6 +20,18 @@ if (HERE / ".env").exists():
 elif (ROOT / ".env").exists():
     load_dotenv(ROOT / ".env")
 
+# --- Telemetry (shared with the backend; optional when cloud/ is deployed alone) ---
+sys.path.append(str(ROOT / "backend"))
+try:
+    from telemetry import span, cache_event
+except Exception:
+    @contextmanager
+    def span(name, **attrs):
+        yield SimpleNamespace(bytes=0, tokens=0, attrs=attrs)
+
+    def cache_event(cache, hit, n=1):
+        pass
+
 # --- Required settings ---
 AWS_REGION: str = os.environ.get("AWS_REGION", "us-east-2")
 S3_BUCKET: str = os.environ.get("S3_BUCKET", "")
@@ -33,18 +49,53 @@ OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 # Default key prefix in the bucket
 UPLOAD_PREFIX = "uploads/"
 
+# Local bookkeeping (upload manifest etc.), shared with the extraction cache dir
+CACHE_DIR = Path(os.environ.get("CLOUD_CACHE_DIR") or ROOT / ".cache")
+
+# --- Transfers ---
+# Files at or above the threshold go up/down as parallel multipart transfers.
+# Uploads use the same part size, so a local file's multipart ETag can be
+# computed and compared with the remote one.
+MB = 1024 * 1024
+MULTIPART_CHUNK = int(os.environ.get("S3_MULTIPART_MB", "16")) * MB
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=MULTIPART_CHUNK,
+    multipart_chunksize=MULTIPART_CHUNK,
+    max_concurrency=int(os.environ.get("S3_TRANSFER_CONCURRENCY", "8")),
+    use_threads=True,
+)
+
 # --- S3 client (reusable) ---
+# Enough pooled connections for the bulk upload/download thread pools, each of
+# which runs several multipart parts at once.
+S3_MAX_POOL_CONNECTIONS = int(os.environ.get("S3_MAX_POOL_CONNECTIONS", "64"))
+S3_RETRY_MODE = os.environ.get("S3_RETRY_MODE", "adaptive")   # legacy | standard | adaptive
+S3_MAX_ATTEMPTS = int(os.environ.get("S3_MAX_ATTEMPTS", "5"))
+
+_s3 = None
+_s3_lock = threading.Lock()
+
 def get_s3():
     """
-    Returns a configured boto3 S3 client using env credentials.
+    Returns the process-wide boto3 S3 client using env credentials.
+    Built once (session, credential resolution, endpoint setup) and shared by
+    every cloud module and thread; boto3 clients are thread-safe.
     """
-    return boto3.client(
-        "s3",
-        region_name=AWS_REGION,
-        endpoint_url=S3_ENDPOINT_URL,
-        aws_access_key_id=os.environ.get("AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=os.environ.get("AWS_SECRET_ACCESS_KEY"),
-    )
+    global _s3
+    with _s3_lock:
+        if _s3 is None:
+            _s3 = boto3.client(
+                "s3",
+                region_name=AWS_REGION,
+                endpoint_url=S3_ENDPOINT_URL,
+                aws_access_key_id=os.environ.get("AWS_ACCESS_KEY_ID"),
+                aws_secret_access_key=os.environ.get("AWS_SECRET_ACCESS_KEY"),
+                config=Config(
+                    max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+                    retries={"mode": S3_RETRY_MODE, "max_attempts": S3_MAX_ATTEMPTS},
+                ),
+            )
+        return _s3
 
 def guess_content_type(filename: str) -> str:
     return mimetypes.guess_type(filename)[0] or "application/octet-stream"
@@ -59,13 +110,34 @@ def s3_http_url(key: str) -> str:
 def ensure_prefix(prefix: str) -> str:
     return prefix if prefix.endswith("/") else prefix + "/"
 
+# Presigned URLs are reused until less than this fraction of their lifetime is left.
+PRESIGN_REFRESH_FRACTION = 0.2
+_PRESIGN_CACHE_MAX = 10_000
+_presigned: Dict[Tuple[str, int], Tuple[str, float]] = {}
+_presigned_lock = threading.Lock()
+
 def presigned_get_url(key: str, expires_in: int = 3600) -> str:
-    s3 = get_s3()
-    return s3.generate_presigned_url(
+    """Presigned GET URL for key, re-signed only when the cached one is close to expiring."""
+    now = time.time()
+    with _presigned_lock:
+        hit = _presigned.get((key, expires_in))
+    fresh = bool(hit) and hit[1] - now > expires_in * PRESIGN_REFRESH_FRACTION
+    cache_event("presign", fresh)
+    if fresh:
+        return hit[0]
+    url = get_s3().generate_presigned_url(
         ClientMethod="get_object",
         Params={"Bucket": S3_BUCKET, "Key": key},
         ExpiresIn=expires_in,
     )
+    with _presigned_lock:
+        if len(_presigned) >= _PRESIGN_CACHE_MAX:
+            for k in [k for k, (_, exp) in _presigned.items() if exp - now <= k[1] * PRESIGN_REFRESH_FRACTION]:
+                del _presigned[k]
+            if len(_presigned) >= _PRESIGN_CACHE_MAX:
+                _presigned.clear()
+        _presigned[(key, expires_in)] = (url, now + expires_in)
+    return url
 
 # Health check helper (optional)
 def check_s3_access(prefix: str = UPLOAD_PREFIX) -> bool:
@@ -1,15 +1,11 @@
 # s3_client.py
 import os, uuid, mimetypes
-import boto3
 
 def _client():
-    return boto3.client(
-        "s3",
-        region_name=os.environ.get("AWS_REGION", "us-east-2"),
-        endpoint_url=os.environ.get("S3_ENDPOINT_URL") or None,
-        aws_access_key_id=os.environ.get("AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=os.environ.get("AWS_SECRET_ACCESS_KEY"),
-    )
+    # shared, pooled client from cloud_init (same env settings); imported here
+    # because cloud_init refuses to load without S3_BUCKET
+    from cloud_init import get_s3
+    return get_s3()
 
 def _public_url(bucket: str, key: str) -> str:
     base = os.environ.get("S3_PUBLIC_BASE_URL")
@@ -30,9 +26,11 @@ def upload_fileobj(fileobj, filename: str, prefix: str = "uploads/"):
     if os.environ.get("S3_PUBLIC_READ", "false").lower() == "true":
         extra["ACL"] = "public-read"
 
+    from cloud_init import TRANSFER_CONFIG
+
     s3 = _client()
     fileobj.seek(0)
-    s3.upload_fileobj(fileobj, bucket, key, ExtraArgs=extra)
+    s3.upload_fileobj(fileobj, bucket, key, ExtraArgs=extra, Config=TRANSFER_CONFIG)
 
     return key, _public_url(bucket, key)
 
@@ -0,0 +1,141 @@
+# dedup.py
+"""
+Near-duplicate passage removal for summarize.py.
+
+Several students often upload notes on the same lecture, so the extracted corpus
+repeats itself. Passages (paragraphs, split further when long) are shingled into
+word 3-grams, MinHashed, and bucketed with LSH; a passage whose estimated Jaccard
+similarity to an earlier one reaches the threshold is dropped, and the kept copy
+is tagged with every source it was merged from. dedupe_passages() works on
+(source, text) pairs such as document segments.
+"""
+from __future__ import annotations
+import hashlib, re
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+NUM_PERM = 64
+BANDS = 16                      # 16 bands x 4 rows: catches pairs down to ~0.5 similarity
+ROWS = NUM_PERM // BANDS
+SHINGLE = 3
+MIN_WORDS = 8                   # shorter passages (titles, option lines) are never merged
+MAX_PASSAGE_WORDS = 120
+
+_PRIME = (1 << 61) - 1
+# fixed coefficients so runs are reproducible
+_PERMS = [
+    (int.from_bytes(hashlib.blake2b(b"a%d" % i, digest_size=8).digest(), "big") % _PRIME | 1,
+     int.from_bytes(hashlib.blake2b(b"b%d" % i, digest_size=8).digest(), "big") % _PRIME)
+    for i in range(NUM_PERM)
+]
+
+_WORD = re.compile(r"\w+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])(\s+)")
+
+
+@dataclass
+class DedupStats:
+    passages: int = 0
+    removed: int = 0
+    chars_before: int = 0
+    chars_after: int = 0
+    merged: Dict[str, List[str]] = field(default_factory=dict)  # kept passage source -> merged sources
+
+
+def _shingles(words: List[str]) -> set:
+    if len(words) < SHINGLE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE]) for i in range(len(words) - SHINGLE + 1)}
+
+
+def _minhash(shingles: set) -> Tuple[int, ...]:
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big") for s in shingles]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMS)
+
+
+def _passages(body: str) -> List[Tuple[str, str]]:
+    """
+    Blank-line paragraphs, with long ones cut into groups of whole sentences.
+    Returns (passage, trailing whitespace) pairs that concatenate back to body.
+    """
+    out: List[Tuple[str, str]] = []
+    parts = re.split(r"(\n\s*\n)", body)
+    for para, sep in zip(parts[::2], parts[1::2] + [""]):
+        if len(para.split()) <= MAX_PASSAGE_WORDS:
+            out.append((para, sep))
+            continue
+        pieces = _SENTENCE_END.split(para)
+        group, size = "", 0
+        for sentence, space in zip(pieces[::2], pieces[1::2] + [sep]):
+            group += sentence
+            size += len(sentence.split())
+            if size >= MAX_PASSAGE_WORDS:
+                out.append((group, space))
+                group, size = "", 0
+            else:
+                group += space
+        if group:
+            text = group.rstrip()
+            out.append((text, group[len(text):]))
+    return out
+
+
+def dedupe_passages(items: List[Tuple[str, str]], threshold: float = 0.8) -> Tuple[List[str], DedupStats]:
+    """
+    Drop near-duplicate passages across (source label, body) pairs. Returns the
+    rewritten bodies, one per item and in the same order (possibly empty), and
+    statistics about what was merged.
+    """
+    stats = DedupStats(chars_before=sum(len(body) for _, body in items))
+    buckets: Dict[Tuple[int, Tuple[int, ...]], int] = {}
+    signatures: List[Tuple[int, ...]] = []
+    provenance: List[List[str]] = []   # per kept passage: sources merged into it
+    kept_at: List[Tuple[int, int]] = []  # per kept passage: (item index, passage index)
+    parsed: List[Tuple[str, List[List[str]]]] = []
+
+    for bi, (source, body) in enumerate(items):
+        kept: List[List[str]] = []
+        for passage, trailing in _passages(body):
+            words = [w.lower() for w in _WORD.findall(passage)]
+            if not words:
+                kept.append([passage, trailing])
+                continue
+            stats.passages += 1
+            if len(words) < MIN_WORDS:
+                kept.append([passage, trailing])
+                continue
+            sig = _minhash(_shingles(words))
+            bands = [(band, sig[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+            match = None
+            for key in bands:
+                other = buckets.get(key)
+                if other is not None:
+                    similar = sum(x == y for x, y in zip(sig, signatures[other])) / NUM_PERM
+                    if similar >= threshold:
+                        match = other
+                        break
+            if match is not None:
+                stats.removed += 1
+                if source not in provenance[match]:
+                    provenance[match].append(source)
+                continue
+            pid = len(signatures)
+            signatures.append(sig)
+            provenance.append([source])
+            kept_at.append((bi, len(kept)))
+            for key in bands:
+                buckets.setdefault(key, pid)
+            kept.append([passage, trailing])
+        parsed.append((source, kept))
+
+    # tag kept passages with the other sources that said the same thing
+    for pid, (bi, pi) in enumerate(kept_at):
+        others = provenance[pid][1:]
+        if others:
+            source, kept = parsed[bi]
+            kept[pi][0] += f"\n[Also in: {'; '.join(others)}]"
+            stats.merged.setdefault(source, []).extend(others)
+
+    out = ["".join(p + t for p, t in kept) for _, kept in parsed]
+    stats.chars_after = sum(len(body) for body in out if body.strip())
+    return out, stats
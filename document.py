@@ -0,0 +1,192 @@
+# document.py
+"""
+Segmented document model for summarize.py.
+
+Extraction produces one Segment per PDF page, text file or OCR result, each
+recording where it came from (source file, page, kind) and where its UTF-8
+bytes sit in the document body. Stages (dedup, pre-filter, chunking) build new
+Documents that point at the same text objects, so nothing is copied until a
+prompt is rendered, and rendering writes every segment once into a StringIO.
+
+Documents can be saved to a flat binary file and loaded back with mmap; loaded
+segments decode their text only when it is first read:
+
+    header   magic, segment count, source count, body offset   (_HEAD)
+    entries  source index, page, kind, start, end per segment  (_ENTRY)
+    sources  length-prefixed UTF-8 file names
+    body     the segments' UTF-8 text, back to back
+"""
+from __future__ import annotations
+import io, mmap, struct
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TextIO
+
+# --- segment kinds ---
+TEXT = "text"           # text file or PDF page
+OCR_TEXT = "ocr"        # text recognized in an image
+MISSING = "missing"     # image that could not be read; empty body
+NOTES = "notes"         # condensed notes from a map-reduce round
+KINDS = (TEXT, OCR_TEXT, MISSING, NOTES)
+
+MAGIC = b"MESASEG1"
+_HEAD = struct.Struct("<8sIIQ")     # magic, segments, sources, body offset
+_ENTRY = struct.Struct("<IIBQQ")    # source index, page, kind index, start, end
+_LEN = struct.Struct("<I")
+
+
+class Segment:
+    """One piece of extracted text and its provenance; start/end are byte offsets in the body."""
+    __slots__ = ("source", "page", "kind", "start", "end", "_text", "_body")
+
+    def __init__(self, source: str, text: Optional[str], page: int = 0, kind: str = TEXT,
+                 start: int = 0, end: int = 0, body: Optional[memoryview] = None):
+        self.source = source
+        self.page = page
+        self.kind = kind
+        self.start = start
+        self.end = end
+        self._text = text
+        self._body = body
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = str(self._body[self.start:self.end], "utf-8")
+        return self._text
+
+    @property
+    def nbytes(self) -> int:
+        return self.end - self.start
+
+    @property
+    def label(self) -> str:
+        """Short citation for this segment, e.g. "notes.pdf, page 3"."""
+        return f"{self.source}, page {self.page}" if self.page else self.source
+
+    @property
+    def header(self) -> str:
+        if self.kind == OCR_TEXT:
+            return f"--- OCR Text from {self.source} ---"
+        if self.kind == MISSING:
+            return f"--- Image file {self.source} (OCR not available) ---"
+        if self.kind == NOTES:
+            return f"--- Notes from {self.source} ---"
+        return f"--- Content of {self.label} ---"
+
+    def __repr__(self) -> str:
+        return f"Segment({self.label!r}, {self.kind}, bytes {self.start}-{self.end})"
+
+
+class Document:
+    """Ordered segments over one logical body of text."""
+    __slots__ = ("segments", "size")
+
+    def __init__(self, segments: Iterable[Segment] = ()):
+        self.segments: List[Segment] = []
+        self.size = 0
+        for seg in segments:
+            self.append(seg)
+
+    def add(self, source: str, text: str, page: int = 0, kind: str = TEXT) -> Segment:
+        n = len(text.encode("utf-8"))
+        seg = Segment(source, text, page, kind, self.size, self.size + n)
+        self.segments.append(seg)
+        self.size += n
+        return seg
+
+    def append(self, seg: Segment) -> Segment:
+        """Add a segment from another document, sharing its text."""
+        moved = Segment(seg.source, seg.text, seg.page, seg.kind, self.size, self.size + seg.nbytes)
+        self.segments.append(moved)
+        self.size += seg.nbytes
+        return moved
+
+    def extend(self, other: Iterable[Segment]) -> None:
+        for seg in other:
+            self.append(seg)
+
+    def map(self, fn: Callable[[Segment], Optional[str]]) -> "Document":
+        """New document with each segment's text replaced by fn(segment); None drops it."""
+        out = Document()
+        for seg in self.segments:
+            text = fn(seg)
+            if text is None:
+                continue
+            if text is seg.text:
+                out.append(seg)
+            else:
+                out.add(seg.source, text, seg.page, seg.kind)
+        return out
+
+    def __iter__(self) -> Iterator[Segment]:
+        return iter(self.segments)
+
+    def __len__(self) -> int:
+        return len(self.segments)
+
+    def __bool__(self) -> bool:
+        return bool(self.segments)
+
+    def sources(self) -> List[str]:
+        return list(dict.fromkeys(seg.source for seg in self.segments))
+
+    # --- rendering ---
+    def write(self, out: TextIO) -> None:
+        for seg in self.segments:
+            out.write("\n\n")
+            out.write(seg.header)
+            out.write("\n\n")
+            out.write(seg.text)
+
+    def render(self, prefix: str = "") -> str:
+        """Prompt text: prefix, then every segment under its "--- source ---" header."""
+        out = io.StringIO()
+        out.write(prefix)
+        self.write(out)
+        return out.getvalue()
+
+    # --- on-disk format ---
+    def save(self, path) -> None:
+        names: Dict[str, int] = {}
+        entries = []
+        for seg in self.segments:
+            idx = names.setdefault(seg.source, len(names))
+            entries.append(_ENTRY.pack(idx, seg.page, KINDS.index(seg.kind), seg.start, seg.end))
+        sources = b"".join(_LEN.pack(len(b)) + b for b in (n.encode("utf-8") for n in names))
+        body_offset = _HEAD.size + len(entries) * _ENTRY.size + len(sources)
+        with open(path, "wb") as f:
+            f.write(_HEAD.pack(MAGIC, len(entries), len(names), body_offset))
+            f.writelines(entries)
+            f.write(sources)
+            for seg in self.segments:
+                f.write(seg.text.encode("utf-8"))
+
+    @classmethod
+    def load(cls, path) -> "Document":
+        """Map a saved document; segment text is decoded from the mapping on first access."""
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mm)
+        magic, n_segments, n_sources, body_offset = _HEAD.unpack_from(view, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a saved document")
+        pos = _HEAD.size + n_segments * _ENTRY.size
+        names = []
+        for _ in range(n_sources):
+            (n,) = _LEN.unpack_from(view, pos)
+            names.append(str(view[pos + _LEN.size:pos + _LEN.size + n], "utf-8"))
+            pos += _LEN.size + n
+        body = view[body_offset:]
+        doc = cls()
+        for idx, page, kind, start, end in _ENTRY.iter_unpack(view[_HEAD.size:_HEAD.size + n_segments * _ENTRY.size]):
+            doc.segments.append(Segment(names[idx], None, page, KINDS[kind], start, end, body))
+        doc.size = len(body)
+        return doc
+
+
+if __name__ == "__main__":
+    import sys
+
+    doc = Document.load(sys.argv[1])
+    for seg in doc:
+        print(f"{seg.start:>10} {seg.nbytes:>8}  {seg.kind:<8} {seg.label}")
+    print(f"{len(doc)} segments from {len(doc.sources())} sources, {doc.size} bytes")
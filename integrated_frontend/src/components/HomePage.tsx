@@ -151,20 +151,19 @@ const HomePage: React.FC = () => {
     if (inputFiles.length === 0) return;
     
     setProcessing(true);
+    // Show each section of the new study guide as soon as it is saved
+    const poll = setInterval(loadStudyMaterials, 2000);
     try {
       // Trigger Python processing
       const response = await axios.post('http://localhost:3001/api/process-files');
       console.log('Processing complete:', response.data);
-      
-      // Reload study materials after processing
-      setTimeout(async () => {
-        await loadStudyMaterials();
-      }, 2000); // Give it a moment to complete
-      
     } catch (error) {
       console.error('Error processing files:', error);
     } finally {
+      clearInterval(poll);
       setProcessing(false);
+      // Reload study materials after processing
+      await loadStudyMaterials();
     }
   };
 
@@ -223,7 +222,7 @@ const HomePage: React.FC = () => {
               Your Study Materials
             </h2>
             <span className="ml-auto text-sm text-gray-500">
-              Updated: {studyMaterial.lastUpdated}
+              {studyMaterial.inProgress ? 'Generating…' : `Updated: ${studyMaterial.lastUpdated}`}
             </span>
           </div>
           
@@ -23,6 +23,7 @@ export interface StudyMaterial {
   questions: string;
   answers: string;
   lastUpdated: string;
+  inProgress?: boolean; // sections of a study guide that is still being generated
 }
 
 export interface UploadedFile {
@@ -0,0 +1,121 @@
+# llm_cache.py
+"""
+Disk cache for chat-completion responses used by summarize.py.
+
+Responses are keyed by the SHA-256 of (model, messages, parameters), stored in a
+WAL-mode SQLite file under .cache/, and evicted least-recently-used first once
+the cache grows past its size cap. LLM_CACHE=on (default) reads and writes,
+LLM_CACHE=refresh skips lookups but stores the fresh responses, LLM_CACHE=off
+bypasses the cache entirely.
+"""
+from __future__ import annotations
+import hashlib, json, os, sys, threading, time
+from pathlib import Path
+from typing import Optional
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from sqlite_util import SqliteDB, evict_lru
+
+# --- settings ---
+LLM_CACHE = os.getenv("LLM_CACHE", "on").lower()
+LLM_CACHE_DIR = Path(os.getenv("LLM_CACHE_DIR") or Path(__file__).resolve().parent / ".cache")
+LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB") or 64)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used);
+"""
+
+
+def request_key(model: str, messages: list, **params) -> str:
+    """Stable hash of everything that determines a completion."""
+    payload = json.dumps({"model": model, "messages": messages, "params": params},
+                         sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache(SqliteDB):
+    """SQLite-backed response cache; safe to share between threads and processes."""
+
+    def __init__(self, path: str | Path, max_bytes: int, read: bool = True):
+        self.max_bytes = max_bytes
+        self.read = read
+        self.hits = self.misses = self.bytes_saved = 0
+        self._stats_lock = threading.Lock()
+        super().__init__(path, _SCHEMA)
+
+    def get(self, key: str) -> Optional[str]:
+        """The cached response for key, or None on a miss (always None in refresh mode)."""
+        row = None
+        if self.read:
+            conn = self._conn()
+            with conn:
+                row = conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE responses SET last_used = ?, hits = hits + 1 WHERE key = ?",
+                                 (time.time(), key))
+        with self._stats_lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.bytes_saved += len(row[0].encode("utf-8"))
+        return row[0]
+
+    def put(self, key: str, model: str, response: str) -> None:
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                """INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_used)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                (key, model, response, len(response.encode("utf-8")), now, now),
+            )
+        self._evict()
+
+    def _evict(self) -> None:
+        """Drop least-recently-used responses until the cache fits under max_bytes."""
+        evict_lru(self._conn(), "responses", self.max_bytes)
+
+    def stats(self) -> dict:
+        """This process's hits/misses plus what is on disk."""
+        entries, size, lifetime_hits = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hits), 0) FROM responses"
+        ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "bytes_saved": self.bytes_saved,
+            "entries": entries,
+            "size": size,
+            "lifetime_hits": lifetime_hits,
+        }
+
+    def clear(self) -> None:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM responses")
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Optional[ResponseCache]:
+    """Process-wide cache instance, or None when disabled via LLM_CACHE=off."""
+    global _cache
+    if LLM_CACHE in {"off", "0", "false"}:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(LLM_CACHE_DIR / "llm.sqlite3", LLM_CACHE_MAX_MB * 1024 * 1024,
+                                   read=LLM_CACHE != "refresh")
+    return _cache
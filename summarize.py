@@ -1,14 +1,29 @@
-from openai import OpenAI
-import pdfplumber
+"""
+Summarize the files in InputFiles/ into OutputFiles/summarization.txt,
+questions.txt and answers.txt.
+
+Run it as a script (main()) or import it: process() runs one job and accepts a
+warm OpenAI client and worker pools to reuse. The heavy dependencies (openai,
+the OCR engines, pdfplumber, tiktoken, numpy) are imported on first use, so
+importing the module is cheap; summarize_worker.py keeps one process warm and
+serves jobs from stdin or a socket.
+"""
 from dotenv import load_dotenv
 import os
-from google.cloud import vision
-from PIL import Image
-import io
+import sys
 
 # Load environment variables from .env file
 load_dotenv()
 
+# backend/ holds the extraction helpers shared with the FastAPI service
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from extract_cache import cache_key, file_digest, get_cache
+from dedup import dedupe_passages
+from document import Document, MISSING, NOTES, OCR_TEXT
+import api_scheduler
+import llm_cache
+from telemetry import cache_event, record, span
+
 # Only set Google credentials if they exist in environment
 google_creds = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
 if google_creds:
@@ -17,57 +32,159 @@ if google_creds:
 # Get API key from environment
 api_key = os.getenv("OPENAI_API_KEY")
 
-client = OpenAI(api_key=api_key)
-
+import asyncio
+import contextvars
+import functools
 import glob
+import hashlib
+import inspect
+import json
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+
+# Worker counts for the extraction stage: processes parse PDF pages (CPU-bound),
+# threads drive OCR requests and per-file bookkeeping (network/IO-bound).
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS") or os.cpu_count() or 4)
+OCR_WORKERS = int(os.getenv("OCR_WORKERS") or 8)
+# Process pools start their workers with spawn: a forked child of this
+# threaded process could inherit a lock some other thread was holding.
+MP_CONTEXT = multiprocessing.get_context("spawn")
+
+_ocr_backend = None
+_ocr_ready = False
+_ocr_lock = threading.Lock()
+
+
+def get_ocr_backend():
+    """OCR_BACKEND=vision|tesseract|auto, chosen on first use; None when neither engine is usable."""
+    global _ocr_backend, _ocr_ready
+    with _ocr_lock:
+        if not _ocr_ready:
+            import OCR
+            _ocr_backend = OCR.get_backend()
+            _ocr_ready = True
+    return _ocr_backend
+
+
+def _submit(pool, fn, *args):
+    """pool.submit() that carries the caller's context (job output, parent span) into the thread."""
+    return pool.submit(contextvars.copy_context().run, fn, *args)
+
+
+def _ocr_batch(backend, batch, futures):
+    """OCR one batch of (path, digest) pairs in a single call and cache the results."""
+    try:
+        with span("ocr.batch", backend=backend.name, images=len(batch)) as sp:
+            sp.bytes = sum(os.path.getsize(path) for path, _ in batch)
+            results = backend.recognize([path for path, _ in batch])
+    except Exception as e:
+        for path, _ in batch:
+            futures[path].set_exception(e)
+        return
+    cache = get_cache()
+    engines = {e.name: e for e in backend.engines()}
+    for (path, digest), (text, engine) in zip(batch, results):
+        if text is not None and cache is not None:
+            cache.put(cache_key(digest, engine, engines[engine].version), [text])
+        futures[path].set_result(text)
+
+
+def ocr_all(backend, image_paths, threads):
+    """
+    Start OCR for every image and return {path: Future[text or None]}. Unchanged
+    images are answered from the extraction cache (the primary engine's result,
+    or a fallback's while the primary is unavailable); the rest go out in
+    batches, one batch per thread.
+    """
+    import OCR
+
+    cache = get_cache()
+    engines = backend.cache_engines() if cache else []
+    futures, misses = {}, []
+    for path in image_paths:
+        futures[path] = Future()
+        digest = file_digest(path) if cache else None
+        pages = None
+        for engine in engines:
+            pages = cache.get(cache_key(digest, engine.name, engine.version), count=False)
+            if pages is not None:
+                break
+        if cache:
+            cache_event("extract", pages is not None)  # once per image, however many engines were tried
+        if pages is not None:
+            futures[path].set_result(pages[0])
+        else:
+            misses.append((path, digest))
+    for i in range(0, len(misses), OCR.MAX_BATCH):
+        _submit(threads, _ocr_batch, backend, misses[i:i + OCR.MAX_BATCH], futures)
+    return futures
 
-# Get all files from InputFiles directory
-file_paths = glob.glob("InputFiles/*")
 
-all_text = ""
-images = []
+def extract_file(path, procs, ocr):
+    """Return the segments of one input file: one per page, text file or OCR result."""
+    kind = os.path.splitext(path)[1].lower().lstrip(".") or "other"
+    with span(f"extract.{kind}", file=os.path.basename(path)) as sp:
+        sp.bytes = os.path.getsize(path)
+        return _extract_file(path, procs, ocr)
 
-for path in file_paths:
+
+def _extract_file(path, procs, ocr):
     print(f"Processing file: {path}")
+    doc = Document()
     if path.lower().endswith(".txt"):
         with open(path, "r", encoding="utf-8") as f:
-            all_text += f"\n\n--- Content of {path} ---\n\n{f.read()}"
+            doc.add(path, f.read())
     elif path.lower().endswith(".pdf"):
-        with pdfplumber.open(path) as pdf:
-            for i, page in enumerate(pdf.pages, start=1):
-                all_text += f"\n\n--- Content of {path}, page {i} ---\n\n"
-                all_text += page.extract_text() + f"\n[Refer to images/{path}_page{i}.jpg]\n"
-                for img_index, img in enumerate(page.images):
-                    image_filename = f"images/{path}_page{i}_img{img_index}.jpg"
-                    images.append(image_filename)
-                    # Optional: Save images
+        from ai_gen import iter_pdf_pages
+        # pages stream in order from the cache, or from ranges parsed on the process pool
+        for i, page_text in enumerate(iter_pdf_pages(path, executor=procs), start=1):
+            doc.add(path, page_text + "\n", page=i)
     elif path.lower().endswith((".jpg", ".jpeg")):
         print(f"Found image file: {path}")
-        if google_creds:
+        if path in ocr:
             try:
-                print("Attempting OCR with Google Vision...")
-                vision_client = vision.ImageAnnotatorClient()
-                # Open the image and convert to bytes
-                with Image.open(path) as img:
-                    with io.BytesIO() as output:
-                        img.save(output, format="JPEG")
-                        content = output.getvalue()
-
-                image = vision.Image(content=content)
-                response = vision_client.document_text_detection(image=image)
-                ocr_text = response.full_text_annotation.text
+                print(f"Attempting OCR with {get_ocr_backend().name}...")
+                ocr_text = ocr[path].result()
+                if ocr_text is None:
+                    raise RuntimeError("no text returned")
                 print(f"OCR extracted {len(ocr_text)} characters")
-                all_text += f"\n\n--- OCR Text from {path} ---\n\n"
-                all_text += ocr_text
+                doc.add(path, ocr_text, kind=OCR_TEXT)
             except Exception as e:
                 print(f"Warning: Could not process image {path}: {e}")
-                all_text += f"\n\n--- Image file {path} (OCR not available) ---\n\n"
+                doc.add(path, "", kind=MISSING)
         else:
-            print(f"Warning: Google Cloud Vision not configured, skipping image {path}")
-            all_text += f"\n\n--- Image file {path} (OCR not available) ---\n\n"
-
-
-prompt = f"""make a summarization of the files given in the form of an article-like text. Most of the information inside of the
+            print(f"Warning: no OCR engine configured (Vision credentials or Tesseract), skipping image {path}")
+            doc.add(path, "", kind=MISSING)
+    return doc
+
+
+def extract_all(file_paths, workers=EXTRACT_WORKERS, procs=None, threads=None):
+    """
+    Extract every input concurrently into one Document, in input order, so the
+    prompt is identical to a serial run. Pools that are not passed in are
+    created for this call.
+    """
+    with ExitStack() as stack:
+        stack.enter_context(span("extract", files=len(file_paths)))
+        if procs is None:
+            procs = stack.enter_context(ProcessPoolExecutor(max_workers=workers, mp_context=MP_CONTEXT))
+        if threads is None:
+            threads = stack.enter_context(ThreadPoolExecutor(max_workers=max(workers, OCR_WORKERS)))
+        backend = get_ocr_backend()
+        images = [p for p in file_paths if p.lower().endswith((".jpg", ".jpeg"))]
+        ocr = ocr_all(backend, images, threads) if backend else {}
+        futures = [_submit(threads, extract_file, path, procs, ocr) for path in file_paths]
+        doc = Document()
+        for f in futures:
+            doc.extend(f.result())
+        return doc
+
+
+PROMPT_INSTRUCTIONS = """make a summarization of the files given in the form of an article-like text. Most of the information inside of the
 files will be overlapping, so make sure to not use redundant information and try to highlight important or special information.
 Make it readable and easy to understand for college level students. Also make a multiple answer question and short form answer 
 question set with the correct answers and where you got the answer based on the text given, use this format as an example for 
@@ -109,32 +226,616 @@ short form answer here
 
 ....
 
-{all_text}"""
+"""
+
+MAP_INSTRUCTIONS = """Condense the following part of a set of study files into dense notes for a later summary.
+Keep every definition, fact, formula, example and name, drop repetition, and keep the "--- Content of ... ---"
+source labels next to the notes that came from them so answers can still say where they were found.
+Do not add information that is not in the text.
+
+"""
+
+# --- map-reduce summarization ---
+MODEL = "gpt-4o-mini"
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS") or 6000)       # input budget per map call
+REDUCE_TOKENS = int(os.getenv("REDUCE_TOKENS") or 12000)    # max notes fed to the final call
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY") or 4)    # in-flight map requests per job
+COMPLETION_TOKENS = 1500  # expected reply size, reserved from the tokens/min budget until usage is known
+# stream the final response and save each output file as soon as its section is complete
+LLM_STREAM = os.getenv("LLM_STREAM", "on").lower() not in {"off", "0", "false"}
 
-response = client.chat.completions.create(
-    model="gpt-4o-mini",
-    messages=[
-        {"role": "user", "content": prompt}
-    ]
-)
 
-sections = response.choices[0].message.content.split("-----------")
+@functools.lru_cache(maxsize=None)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model(MODEL)
+    except Exception:
+        return None
 
-# Save each section into separate files
-if len(sections) >= 3:
-    summarization = sections[0].strip()
-    questions = sections[1].strip()
-    answers = sections[2].strip()
 
-    with open("OutputFiles/summarization.txt", "w", encoding="utf-8") as f:
-        f.write(summarization)
+def count_tokens(text):
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # rough estimate when tiktoken is not installed; rounded up, so the counts
+    # of a text's lines add up to at least the count of the whole text
+    return -(-len(text) // 4)
 
-    with open("OutputFiles/questions.txt", "w", encoding="utf-8") as f:
-        f.write(questions)
 
-    with open("OutputFiles/answers.txt", "w", encoding="utf-8") as f:
-        f.write(answers)
+def segment_tokens(seg):
+    """Tokens of one rendered segment, header included."""
+    return count_tokens(seg.header) + count_tokens(seg.text) + 2
 
-    print("Files saved successfully!")
-else:
-    print("The output did not contain the expected separator lines.")
+
+def doc_tokens(doc):
+    return sum(segment_tokens(seg) for seg in doc)
+
+
+def _split_oversized(text, max_tokens):
+    """
+    Split one segment's text that is larger than a chunk on line boundaries,
+    and a single line that is larger than a chunk between words.
+    """
+    parts, current, size = [], [], 0
+    for line in text.splitlines(keepends=True):
+        if count_tokens(line) <= max_tokens:
+            pieces = [line]
+        else:
+            words = line.split(" ")
+            pieces = [w + " " for w in words[:-1]] + words[-1:]
+        for piece in pieces:
+            n = count_tokens(piece)
+            if current and size + n > max_tokens:
+                parts.append("".join(current))
+                current, size = [], 0
+            current.append(piece)
+            size += n
+    if current:
+        parts.append("".join(current))
+    return parts
+
+
+def chunk_sources(doc, max_tokens=CHUNK_TOKENS):
+    """
+    Pack whole segments into Documents of at most max_tokens, in order. A
+    segment larger than a chunk is split into pieces that keep its source label.
+    """
+    chunks, current, size = [], Document(), 0
+    for seg in doc:
+        n = segment_tokens(seg)
+        if n <= max_tokens:
+            pieces = [seg]
+        else:
+            pieces = Document()
+            # each piece is rendered with the segment's header, so leave room for it
+            budget = max(1, max_tokens - (n - count_tokens(seg.text)))
+            for part in _split_oversized(seg.text, budget):
+                pieces.add(seg.source, part, seg.page, seg.kind)
+        for piece in pieces:
+            n = segment_tokens(piece)
+            if current and size + n > max_tokens:
+                chunks.append(current)
+                current, size = Document(), 0
+            current.append(piece)
+            size += n
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+# --- near-duplicate removal ---
+DEDUP = os.getenv("DEDUP", "on").lower() not in {"off", "0", "false"}
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD") or 0.8)
+
+
+def dedupe_doc(doc):
+    """Collapse passages repeated across uploads, tagging the kept copy with its sources."""
+    bodies, stats = dedupe_passages([(seg.label, seg.text) for seg in doc], DEDUP_THRESHOLD)
+    kept = iter(bodies)
+    deduped = doc.map(lambda seg: _unchanged_or(seg, next(kept)))
+    saved = doc_tokens(doc) - doc_tokens(deduped)
+    print(f"Dedup: merged {stats.removed} of {stats.passages} passages, saved ~{saved} tokens")
+    for source, others in stats.merged.items():
+        print(f"  {source} also covers: {', '.join(sorted(set(others)))}")
+    return deduped
+
+
+def _unchanged_or(seg, text):
+    """text for seg, None when nothing is left of it, or seg.text itself when unchanged (shared, not copied)."""
+    if not text.strip():
+        return None
+    return seg.text if text == seg.text else text
+
+
+# --- extractive pre-filter ---
+# Keep only this fraction of each large source's characters (its most central,
+# non-redundant sentences) before any LLM call. 0 disables the filter.
+PREFILTER_RATIO = float(os.getenv("PREFILTER_RATIO") or 0)
+PREFILTER_MIN_CHARS = 2000  # smaller segments are passed through whole
+
+
+def prefilter_doc(doc, ratio=PREFILTER_RATIO):
+    """Shrink every large segment to its key sentences."""
+    from summarizer import key_sentences
+
+    def shrink(seg):
+        if len(seg.text) <= PREFILTER_MIN_CHARS:
+            return seg.text
+        return key_sentences(seg.text, int(len(seg.text) * ratio)) + "\n"
+
+    filtered = doc.map(shrink)
+    print(f"Pre-filter: kept ~{doc_tokens(filtered)} of {doc_tokens(doc)} tokens")
+    return filtered
+
+
+@functools.lru_cache(maxsize=None)
+def _stream_usage(create):
+    """Whether this openai version reports usage on streams (stream_options, openai>=1.26)."""
+    return "stream_options" in inspect.signature(create).parameters
+
+
+async def _stream(aclient, messages, on_text):
+    """
+    One streamed completion: (text, total tokens, 0 when the client cannot
+    report them). on_text gets every piece as it arrives, and None first so a
+    retried attempt starts over.
+    """
+    on_text(None)
+    t0 = time.perf_counter()
+    create = aclient.chat.completions.create
+    extra = {"stream_options": {"include_usage": True}} if _stream_usage(type(aclient.chat.completions).create) else {}
+    stream = await create(model=MODEL, messages=messages, stream=True, **extra)
+    parts, usage = [], 0
+    async for chunk in stream:
+        if getattr(chunk, "usage", None):
+            usage = chunk.usage.total_tokens
+        for choice in chunk.choices:
+            if choice.delta.content:
+                if not parts:
+                    record("llm.first_token", time.perf_counter() - t0, model=MODEL)
+                parts.append(choice.delta.content)
+                on_text(choice.delta.content)
+    return "".join(parts), usage
+
+
+async def _complete(aclient, prompt, on_text=None, valid=None):
+    """
+    The model's reply to prompt. With on_text (and LLM_STREAM on) the reply is
+    streamed and on_text is called with each piece as it arrives; a cached
+    reply is passed to it whole. With valid, only replies it accepts are
+    cached (or reused from the cache).
+    """
+    messages = [
+        {"role": "user", "content": prompt}
+    ]
+    cache = llm_cache.get_cache()
+    key = llm_cache.request_key(MODEL, messages)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None and valid is not None and not valid(cached):
+            cached = None
+        cache_event("llm", cached is not None)
+        if cached is not None:
+            if on_text is not None:
+                on_text(None)
+                on_text(cached)
+            return cached
+    with span("llm.request", model=MODEL) as sp:
+        sp.bytes = len(prompt.encode("utf-8"))
+        estimate = count_tokens(prompt) + COMPLETION_TOKENS
+        # queued behind other jobs' calls, and retried on 429 / 5xx (see api_scheduler)
+        scheduler = api_scheduler.get_scheduler("openai")
+        if on_text is not None and LLM_STREAM:
+            text, sp.tokens = await scheduler.run(
+                _stream, aclient, messages, on_text,
+                tokens=estimate,
+                used=lambda r: r[1] or estimate,
+            )
+        else:
+            response = await scheduler.run(
+                aclient.chat.completions.create,
+                model=MODEL,
+                messages=messages,
+                tokens=estimate,
+                used=lambda r: r.usage.total_tokens if r.usage else estimate,
+            )
+            sp.tokens = response.usage.total_tokens if response.usage else 0
+            text = response.choices[0].message.content
+    if cache is not None and (valid is None or valid(text)):
+        cache.put(key, MODEL, text)
+    return text
+
+
+async def _map_chunks(aclient, chunks):
+    """Condense every chunk concurrently, at most LLM_CONCURRENCY at a time."""
+    limit = asyncio.Semaphore(LLM_CONCURRENCY)
+
+    async def condense(i, chunk):
+        async with limit:
+            print(f"Condensing part {i}/{len(chunks)}...")
+            return await _complete(aclient, chunk.render(MAP_INSTRUCTIONS))
+
+    notes = await asyncio.gather(*(condense(i, c) for i, c in enumerate(chunks, start=1)))
+    doc = Document()
+    for i, n in enumerate(notes, start=1):
+        doc.add(f"part {i}", n, kind=NOTES)
+    return doc
+
+
+def new_client():
+    """
+    An AsyncOpenAI client; reuse one across jobs to keep its connections alive.
+    Its own retries are off: api_scheduler retries with the shared backoff.
+    """
+    from openai import AsyncOpenAI
+
+    return AsyncOpenAI(api_key=api_key, max_retries=0)
+
+
+async def summarize_doc(doc, aclient=None, on_text=None):
+    """
+    Return the raw "summary ----------- questions ----------- answers" response.
+    Corpora under REDUCE_TOKENS go out as a single request; larger ones are
+    condensed chunk by chunk (map), repeating on the notes if they are still too
+    big, and the notes are summarized once (reduce). on_text receives the final
+    response as it streams in (see _complete). A client passed in is left open
+    for the caller.
+    """
+    owned = aclient is None
+    if owned:
+        aclient = new_client()
+    try:
+        for _ in range(3):  # map rounds; each one shrinks the notes a lot
+            if doc_tokens(doc) <= REDUCE_TOKENS:
+                break
+            chunks = chunk_sources(doc)
+            if len(chunks) <= 1:
+                break
+            doc = await _map_chunks(aclient, chunks)
+        return await _complete(aclient, doc.render(PROMPT_INSTRUCTIONS), on_text, has_sections)
+    finally:
+        if owned:
+            await aclient.close()
+
+
+def run_key(file_paths):
+    """
+    Cache key for a whole run: the input file contents plus every setting that
+    changes the prompts, so an identical rerun can skip extraction as well.
+    """
+    inputs = sorted((os.path.basename(p), file_digest(p)) for p in file_paths)
+    return llm_cache.request_key(
+        MODEL, [{"role": "user", "content": PROMPT_INSTRUCTIONS + MAP_INSTRUCTIONS}],
+        inputs=inputs, **_settings(),
+    )
+
+
+def _settings():
+    """Settings that change what extraction and the prompts produce."""
+    ocr_backend = get_ocr_backend()
+    return dict(
+        ocr=[(e.name, e.version) for e in ocr_backend.engines()] if ocr_backend else None,
+        dedup=DEDUP and DEDUP_THRESHOLD, prefilter=PREFILTER_RATIO,
+        chunk_tokens=CHUNK_TOKENS, reduce_tokens=REDUCE_TOKENS,
+    )
+
+
+# Save the prepared corpus here for inspection (python document.py FILE); off when empty.
+CORPUS_FILE = os.getenv("CORPUS_FILE", "")
+
+
+def prepare_doc(file_paths, procs=None, threads=None):
+    """Extracted, deduplicated and (optionally) pre-filtered segments for the inputs."""
+    doc = extract_all(file_paths, procs=procs, threads=threads)
+    if DEDUP:
+        with span("dedup"):
+            doc = dedupe_doc(doc)
+    if PREFILTER_RATIO:
+        with span("prefilter"):
+            doc = prefilter_doc(doc)
+    if CORPUS_FILE:
+        doc.save(CORPUS_FILE)
+    return doc
+
+
+OUTPUT_FILES = ("summarization.txt", "questions.txt", "answers.txt")
+SECTION_SEPARATOR = "-----------"
+PARTIAL_SUFFIX = ".partial"  # sections saved while the response is still streaming
+
+
+def _write_section(output_dir, name, section):
+    """Replace output_dir/name atomically, so readers never see a partial write."""
+    path = os.path.join(output_dir, name)
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(section.strip())
+    os.replace(tmp, path)
+
+
+def has_sections(raw):
+    """Whether raw has the summary, questions and answers separators."""
+    return len(raw.split(SECTION_SEPARATOR)) >= len(OUTPUT_FILES)
+
+
+def write_outputs(raw, output_dir="OutputFiles"):
+    """
+    Save the summary, questions and answers sections of raw to output_dir.
+    Each file is replaced atomically, so readers never see a partial write.
+    Returns False (and writes nothing) when the separators are missing.
+    """
+    if not has_sections(raw):
+        return False
+    sections = raw.split(SECTION_SEPARATOR)
+    os.makedirs(output_dir, exist_ok=True)
+    with span("write_outputs"):
+        for name, section in zip(OUTPUT_FILES, sections):
+            _write_section(output_dir, name, section)
+    return True
+
+
+class SectionWriter:
+    """
+    on_text callback for a streamed response: saves summarization.txt.partial
+    as soon as the separator after it arrives, then questions.txt.partial,
+    while the rest is still being generated. The real output files are only
+    replaced by write_outputs() once the whole response has the expected
+    sections, so a malformed response leaves the previous outputs in place.
+    Use it as a context manager: the .partial files are removed on exit.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.reset()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        for name in OUTPUT_FILES:
+            try:
+                os.remove(os.path.join(self.output_dir, name + PARTIAL_SUFFIX))
+            except FileNotFoundError:
+                pass
+
+    def reset(self):
+        self.text = ""
+        self.start = 0  # where the section being received begins
+        self.saved = 0  # sections saved so far
+
+    def __call__(self, delta):
+        if delta is None:  # the response is starting (again)
+            self.reset()
+            return
+        scan = max(self.start, len(self.text) - len(SECTION_SEPARATOR) + 1)
+        self.text += delta
+        while self.saved < len(OUTPUT_FILES) - 1:
+            end = self.text.find(SECTION_SEPARATOR, scan)
+            if end < 0:
+                break
+            name = OUTPUT_FILES[self.saved] + PARTIAL_SUFFIX
+            os.makedirs(self.output_dir, exist_ok=True)
+            _write_section(self.output_dir, name, self.text[self.start:end])
+            print(f"Saved {name}")
+            self.saved += 1
+            self.start = scan = end + len(SECTION_SEPARATOR)
+
+
+def _cached_run(file_paths):
+    """(cache, run key, cached response or None) for a whole run."""
+    cache = llm_cache.get_cache()
+    if cache is None:
+        return None, None, None
+    key = run_key(file_paths)
+    raw = cache.get(key)
+    cache_event("llm_run", raw is not None)
+    return cache, key, raw
+
+
+async def process(file_paths, output_dir="OutputFiles", aclient=None, procs=None, threads=None,
+                  incremental=None):
+    """
+    Summarize file_paths into output_dir and return {"ok", "cached"}. The
+    blocking stages run in threads, so several jobs can share one event loop,
+    one client and one set of pools. incremental defaults to INCREMENTAL.
+    """
+    if INCREMENTAL if incremental is None else incremental:
+        return await process_incremental(file_paths, output_dir, aclient, procs, threads)
+    with span("run", files=len(file_paths)):
+        cache, key, raw = await asyncio.to_thread(_cached_run, file_paths)
+        cached = raw is not None
+        with SectionWriter(output_dir) as partial:
+            if cached:
+                print("LLM cache hit: reusing the saved response for these inputs")
+            else:
+                doc = await asyncio.to_thread(prepare_doc, file_paths, procs, threads)
+                with span("llm.summarize"):
+                    raw = await summarize_doc(doc, aclient, partial)
+
+            # Save each section into separate files
+            ok = await asyncio.to_thread(write_outputs, raw, output_dir)
+        if ok:
+            print("Files saved successfully!")
+            if cache is not None and not cached:
+                await asyncio.to_thread(cache.put, key, MODEL, raw)
+        else:
+            print("The output did not contain the expected separator lines.")
+            print("Rerun with LLM_CACHE=refresh to request a new response.")
+    return {"ok": ok, "cached": cached}
+
+
+# --- incremental master summary ---
+# INCREMENTAL=on keeps each source's notes and content hash from the last run
+# (one state file per output directory under SUMMARY_STATE_DIR). A later run
+# extracts and condenses only new or changed sources and merges their notes
+# into the saved study guide with one small call; removing a source rebuilds
+# the guide from the saved notes without re-reading any file.
+INCREMENTAL = os.getenv("INCREMENTAL", "off").lower() in {"on", "1", "true"}
+SUMMARY_STATE_DIR = os.getenv("SUMMARY_STATE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+NOTES_PASSTHROUGH_TOKENS = int(os.getenv("NOTES_PASSTHROUGH_TOKENS") or 1500)  # smaller sources are their own notes
+
+MERGE_INSTRUCTIONS = """Below is an existing study guide with three parts separated by "-----------": the summarization,
+the question section and the answer sheet. After it come notes from new or updated source files. Update the study guide
+so it also covers the notes: work new information into the summarization where it belongs without repeating what is
+already there, add questions about the new material continuing the numbering, and add their answers with where they were
+found. For updated sources, replace what the guide said from their earlier version. Keep everything else as it is and keep
+the exact same format, using "-----------" to separate the summarization, questions, and answers.
+
+"""
+
+_state_locks = {}
+
+
+def _state_path(output_dir):
+    digest = hashlib.sha256(os.path.abspath(output_dir).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(SUMMARY_STATE_DIR, f"master_{digest}.json")
+
+
+def _state_settings():
+    """Everything that shapes saved notes and the merge; a change invalidates the state."""
+    return llm_cache.request_key(
+        MODEL, [{"role": "user", "content": MAP_INSTRUCTIONS + MERGE_INSTRUCTIONS}],
+        passthrough=NOTES_PASSTHROUGH_TOKENS, **_settings(),
+    )
+
+
+def load_state(output_dir):
+    """The saved state for output_dir, or None when missing or made with other settings."""
+    try:
+        with open(_state_path(output_dir), encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return state if state.get("settings") == _state_settings() else None
+
+
+def save_state(output_dir, sources, master):
+    path = _state_path(output_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    state = {
+        "settings": _state_settings(),
+        "output_dir": os.path.abspath(output_dir),
+        "sources": sources,
+        "master": master,
+    }
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+async def source_notes(aclient, doc):
+    """
+    {source: notes} for every source in doc. Sources under
+    NOTES_PASSTHROUGH_TOKENS are kept verbatim; larger ones are condensed with
+    MAP_INSTRUCTIONS, chunk by chunk, at most LLM_CONCURRENCY requests at a time.
+    """
+    by_source = {}
+    for seg in doc:
+        by_source.setdefault(seg.source, Document()).append(seg)
+    limit = asyncio.Semaphore(LLM_CONCURRENCY)
+
+    async def condense(chunk):
+        async with limit:
+            return await _complete(aclient, chunk.render(MAP_INSTRUCTIONS))
+
+    async def notes(source, src):
+        if doc_tokens(src) <= NOTES_PASSTHROUGH_TOKENS:
+            return src.render().strip()
+        print(f"Condensing {source}...")
+        parts = await asyncio.gather(*(condense(c) for c in chunk_sources(src)))
+        return "\n\n".join(p.strip() for p in parts)
+
+    results = await asyncio.gather(*(notes(s, d) for s, d in by_source.items()))
+    return dict(zip(by_source, results))
+
+
+async def process_incremental(file_paths, output_dir="OutputFiles", aclient=None, procs=None, threads=None):
+    """process() for INCREMENTAL=on: only new or changed sources are read and condensed."""
+    lock = _state_locks.setdefault(os.path.abspath(output_dir), asyncio.Lock())
+    async with lock:
+        owned = aclient is None
+        if owned:
+            aclient = new_client()
+        try:
+            with span("run", files=len(file_paths), incremental=True):
+                return await _process_incremental(file_paths, output_dir, aclient, procs, threads)
+        finally:
+            if owned:
+                await aclient.close()
+
+
+async def _process_incremental(file_paths, output_dir, aclient, procs, threads):
+    digests = await asyncio.to_thread(lambda: {p: file_digest(p) for p in file_paths})
+    state = await asyncio.to_thread(load_state, output_dir)
+    saved = state["sources"] if state else {}
+    master = state["master"] if state else None
+    changed = [p for p in file_paths if saved.get(p, {}).get("digest") != digests[p]]
+    removed = [p for p in saved if p not in digests]
+    updated = [p for p in changed if p in saved]
+    print(f"Incremental: {len(changed) - len(updated)} new, {len(updated)} changed, {len(removed)} removed, "
+          f"{len(file_paths) - len(changed)} unchanged sources")
+
+    if master is not None and not changed and not removed:
+        print("Nothing changed since the last run; keeping the saved study guide")
+        ok = await asyncio.to_thread(write_outputs, master, output_dir)
+        return {"ok": ok, "cached": True}
+
+    notes = {}
+    if changed:
+        doc = await asyncio.to_thread(prepare_doc, changed, procs, threads)
+        with span("llm.notes", sources=len(changed)):
+            notes = await source_notes(aclient, doc)
+    sources = {
+        p: {"digest": digests[p], "notes": notes.get(p, "") if p in changed else saved[p]["notes"]}
+        for p in file_paths
+    }
+
+    with SectionWriter(output_dir) as partial:
+        if master is not None and not removed:
+            update = Document()
+            for p in changed:
+                if sources[p]["notes"]:
+                    update.add(p, sources[p]["notes"], kind=NOTES)
+            if not update:
+                raw = master
+            else:
+                prefix = MERGE_INSTRUCTIONS
+                if updated:
+                    prefix += f"Updated sources: {', '.join(updated)}\n\n"
+                prefix += f"--- Existing study guide ---\n\n{master}"
+                print(f"Merging {len(update)} sources into the saved study guide...")
+                with span("llm.merge"):
+                    raw = await _complete(aclient, update.render(prefix), partial, has_sections)
+        else:
+            # first run, new settings or removed sources: summarize all saved notes
+            all_notes = Document()
+            for p in file_paths:
+                if sources[p]["notes"]:
+                    all_notes.add(p, sources[p]["notes"], kind=NOTES)
+            with span("llm.summarize"):
+                raw = await summarize_doc(all_notes, aclient, partial)
+
+        ok = await asyncio.to_thread(write_outputs, raw, output_dir)
+    if ok:
+        await asyncio.to_thread(save_state, output_dir, sources, raw)
+        print("Files saved successfully!")
+    else:
+        print("The output did not contain the expected separator lines; the saved state was kept.")
+    return {"ok": ok, "cached": False}
+
+
+def main():
+    # Get all files from InputFiles directory
+    file_paths = glob.glob("InputFiles/*")
+    asyncio.run(process(file_paths))
+
+    cache = llm_cache.get_cache()
+    if cache is not None:
+        st = cache.stats()
+        print(f"LLM cache: {st['hits']} hits, {st['misses']} misses, "
+              f"{st['entries']} entries ({st['size'] / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
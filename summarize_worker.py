@@ -0,0 +1,291 @@
+# summarize_worker.py
+"""
+Long-lived summarization worker. One process keeps the imported libraries,
+the OpenAI client (and its keep-alive connections), the OCR client and the
+PDF-parsing process pool warm, and runs summarize.py jobs as they arrive.
+
+Requests are JSON lines, read from stdin (the default; replies go to stdout)
+or from connections to a Unix socket (--socket PATH) or a localhost TCP port
+(--port N):
+
+    {"id": "1", "files": ["InputFiles/a.pdf"], "outputDir": "OutputFiles", "incremental": true, "priority": "bulk"}
+    {"id": "2", "op": "ping"}
+    {"id": "3", "op": "stats"}
+
+Every request gets one reply line carrying the same id, e.g.
+
+    {"id": "1", "ok": true, "cached": false, "seconds": 4.2, "output": "Processing file: ..."}
+
+"files" defaults to everything in InputFiles/, "outputDir" to OutputFiles/,
+"incremental" to the INCREMENTAL setting (see summarize.process_incremental)
+and "priority" to "interactive"; OpenAI and Vision calls of "bulk" jobs wait
+until no interactive job's calls are queued (see api_scheduler). "stats"
+includes each API's queue depth and throttle counters.
+"output" is what the job printed. Up to SUMMARIZE_JOBS jobs run at once; a
+request for the same unchanged inputs and output directory as a running job
+shares that job's result instead of repeating it. In stdin mode the worker
+exits once stdin closes and the running jobs finish.
+"""
+from __future__ import annotations
+import argparse, asyncio, glob, io, json, os, signal, sys, threading, time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+import api_scheduler
+import summarize
+from telemetry import REGISTRY
+
+SUMMARIZE_JOBS = int(os.getenv("SUMMARIZE_JOBS") or 2)
+
+# --- per-job output ---
+_job_output: ContextVar[Optional[List[str]]] = ContextVar("job_output", default=None)
+
+
+class _JobStdout(io.TextIOBase):
+    """print() target: the running job's buffer, or the worker log (stderr) outside a job."""
+
+    def write(self, s: str) -> int:
+        buf = _job_output.get()
+        if buf is None:
+            sys.stderr.write(s)
+        else:
+            buf.append(s)
+        return len(s)
+
+    def flush(self) -> None:
+        sys.stderr.flush()
+
+
+# --- worker ---
+
+class Worker:
+    def __init__(self, jobs: int = SUMMARIZE_JOBS):
+        self.limit = asyncio.Semaphore(jobs)
+        self.jobs = jobs
+        self.procs = ProcessPoolExecutor(max_workers=summarize.EXTRACT_WORKERS, mp_context=summarize.MP_CONTEXT)
+        self.threads = ThreadPoolExecutor(max_workers=max(summarize.EXTRACT_WORKERS, summarize.OCR_WORKERS))
+        self.aclient = None
+        self.inflight: Dict[Tuple, asyncio.Task] = {}
+        self.started = time.time()
+        self.active = self.done = self.failed = self.shared = 0
+
+    async def start(self) -> None:
+        """Import and build everything a job needs up front, so the first job is as fast as the rest."""
+        t0 = time.perf_counter()
+        await asyncio.to_thread(self._warm)
+        try:
+            self.aclient = summarize.new_client()
+        except Exception as e:  # e.g. no OPENAI_API_KEY yet; jobs report it and retry
+            print(f"Warning: OpenAI client unavailable ({e})", file=sys.stderr)
+        print(f"🔥 summarize worker ready in {time.perf_counter() - t0:.1f}s "
+              f"({self.jobs} concurrent jobs, pid {os.getpid()})", file=sys.stderr)
+
+    def _warm(self) -> None:
+        import ai_gen, openai, summarizer  # pdfplumber, numpy/scipy; forked pool workers inherit them
+        summarize.get_ocr_backend()
+        summarize.count_tokens("warm up")
+        for f in [self.procs.submit(os.getpid) for _ in range(summarize.EXTRACT_WORKERS)]:
+            f.result()
+
+    async def close(self) -> None:
+        if self.aclient is not None:
+            await self.aclient.close()
+        self.threads.shutdown(wait=False)
+        self.procs.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "pid": os.getpid(), "uptime": time.time() - self.started, "concurrency": self.jobs,
+            "active": self.active, "done": self.done, "failed": self.failed, "shared": self.shared,
+            "stages": REGISTRY.snapshot()["stages"], "apis": api_scheduler.stats(),
+        }
+
+    async def handle(self, req: dict) -> dict:
+        rid = req.get("id")
+        op = req.get("op", "summarize")
+        if op == "ping":
+            return {"id": rid, "ok": True}
+        if op == "stats":
+            return {"id": rid, "ok": True, **self.stats()}
+        if op != "summarize":
+            return {"id": rid, "ok": False, "error": f"unknown op: {op}"}
+
+        files = req.get("files") or glob.glob("InputFiles/*")
+        output_dir = req.get("outputDir") or "OutputFiles"
+        incremental = req.get("incremental")  # None: the INCREMENTAL setting
+        priority = req.get("priority") or api_scheduler.INTERACTIVE
+        if priority not in api_scheduler.LANES:
+            return {"id": rid, "ok": False, "error": f"unknown priority: {priority}"}
+        try:
+            stamps = tuple((os.path.getsize(p), os.path.getmtime(p)) for p in files)
+        except OSError as e:
+            return {"id": rid, "ok": False, "error": str(e)}
+        key = (tuple(files), os.path.abspath(output_dir), stamps, incremental)
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._run(files, output_dir, incremental, priority))
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        else:
+            self.shared += 1
+        return {"id": rid, **await asyncio.shield(task)}
+
+    async def _run(self, files: List[str], output_dir: str, incremental: Optional[bool], priority: str) -> dict:
+        out: List[str] = []
+        _job_output.set(out)  # this task's own context; threads it starts copy it
+        async with self.limit:
+            self.active += 1
+            t0 = time.perf_counter()
+            try:
+                if self.aclient is None:
+                    self.aclient = summarize.new_client()
+                with api_scheduler.lane(priority):
+                    result = await summarize.process(files, output_dir, self.aclient, self.procs, self.threads,
+                                                     incremental=incremental)
+                self.done += 1
+                reply = {"ok": result["ok"], "cached": result["cached"]}
+                if not result["ok"]:
+                    reply["error"] = "The output did not contain the expected separator lines."
+            except Exception as e:
+                self.failed += 1
+                reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            finally:
+                self.active -= 1
+            reply["seconds"] = round(time.perf_counter() - t0, 3)
+            reply["output"] = "".join(out)
+            return reply
+
+
+# --- transports ---
+
+def _decode(line: bytes | str) -> dict:
+    try:
+        req = json.loads(line)
+    except ValueError as e:
+        return {"op": "invalid", "error": f"invalid JSON: {e}"}
+    return req if isinstance(req, dict) else {"op": "invalid", "error": "request must be a JSON object"}
+
+
+async def _reply(worker: Worker, req: dict) -> dict:
+    if req.get("op") == "invalid":
+        return {"id": None, "ok": False, "error": req["error"]}
+    try:
+        return await worker.handle(req)
+    except Exception as e:  # a bad request must not take the worker down
+        return {"id": req.get("id"), "ok": False, "error": f"{type(e).__name__}: {e}"}
+
+
+async def serve_stdio(worker: Worker, protocol) -> None:
+    """
+    Read requests from stdin until EOF. A daemon thread does the blocking reads
+    (works with pipes on every platform and never holds up shutdown).
+    """
+    loop = asyncio.get_running_loop()
+    lines: asyncio.Queue = asyncio.Queue()
+    pending = set()
+
+    def read() -> None:
+        for line in sys.stdin:
+            loop.call_soon_threadsafe(lines.put_nowait, line)
+        loop.call_soon_threadsafe(lines.put_nowait, "")
+
+    async def respond(req: dict) -> None:
+        reply = await _reply(worker, req)
+        protocol.write(json.dumps(reply, ensure_ascii=False) + "\n")
+        protocol.flush()
+
+    threading.Thread(target=read, name="stdin-reader", daemon=True).start()
+    while True:
+        line = await lines.get()
+        if not line:
+            break
+        if line.strip():
+            task = asyncio.create_task(respond(_decode(line)))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+    if pending:
+        await asyncio.wait(pending)
+
+
+async def serve_stream(worker: Worker, socket_path: Optional[str] = None, port: Optional[int] = None) -> None:
+    async def client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        pending = set()
+
+        async def respond(req: dict) -> None:
+            reply = await _reply(worker, req)
+            writer.write((json.dumps(reply, ensure_ascii=False) + "\n").encode("utf-8"))
+            await writer.drain()
+
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    task = asyncio.create_task(respond(_decode(line)))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.wait(pending)
+        except (ConnectionError, asyncio.CancelledError):  # client gone, or worker shutting down
+            pass
+        finally:
+            writer.close()
+
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)  # stale socket from an earlier run
+        server = await asyncio.start_unix_server(client, path=socket_path, limit=16 * 1024 * 1024)
+        os.chmod(socket_path, 0o600)
+        where = socket_path
+    else:
+        server = await asyncio.start_server(client, "127.0.0.1", port, limit=16 * 1024 * 1024)
+        where = f"127.0.0.1:{port}"
+    print(f"📡 listening on {where}", file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+async def _main(args) -> None:
+    worker = Worker(args.jobs)
+    try:
+        # SIGTERM cancels the server so the pools below are shut down, not orphaned
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except (NotImplementedError, AttributeError):  # Windows event loops
+        pass
+    try:
+        await worker.start()
+        if args.socket or args.port:
+            await serve_stream(worker, args.socket, args.port)
+        else:
+            await serve_stdio(worker, args.protocol)
+    finally:
+        await worker.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Persistent summarize.py worker (JSON lines)")
+    where = parser.add_mutually_exclusive_group()
+    where.add_argument("--socket", help="serve on this Unix socket instead of stdin/stdout")
+    where.add_argument("--port", type=int, help="serve on this localhost TCP port instead of stdin/stdout")
+    parser.add_argument("--jobs", type=int, default=SUMMARIZE_JOBS, help="jobs run at once")
+    args = parser.parse_args()
+
+    args.protocol = None
+    if not (args.socket or args.port):
+        # stdout carries only replies: keep a private handle to it and point fd 1
+        # (prints, pool workers, native libraries) at stderr
+        sys.stdout.flush()
+        args.protocol = os.fdopen(os.dup(1), "w", encoding="utf-8")
+        os.dup2(2, 1)
+    sys.stdout = _JobStdout()
+    try:
+        asyncio.run(_main(args))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+
+if __name__ == "__main__":
+    main()